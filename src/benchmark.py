@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""!
+
+@package benchmark
+
+Scaling benchmarks of the main processing stages on synthetic catalogs
+
+For every catalog size (number of picks) a synthetic catalog and station
+file are written with synthetic.py (and reused in later runs), and the
+following stages are timed:
+
+read_line1      read_line1 on every hypocenter line
+read_line4      read_line4 on every phase card
+read_tables     nordic.read_tables (bulk decoding)
+read_mmap       nordic.read_tables_mmap
+dataframe       nordic2df.phase_dataframe
+station_stats   station_list.station_pick_counts and station_stats.station_phases
+plotting        station_stats.plot_station for the station with most picks
+
+Each stage is run once to measure its wall time and, unless --no-memory is
+given, once more under tracemalloc to measure its peak memory allocation.
+Stages whose libraries are not installed (e.g. cartopy for plotting) are
+reported as skipped. The results are written as JSON, with the versions of
+the code and libraries, so that runs of different versions can be compared.
+
+Usage: benchmark.py [--sizes N [N ...]] [--stages STAGE [STAGE ...]] [-o results.json]
+
+Created on Sat Oct 17 16:20:11 2026
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import resource
+import subprocess
+import tracemalloc
+
+import numpy as np
+
+import nordic
+import synthetic
+
+stage_names = ['read_line1', 'read_line4', 'read_tables', 'read_mmap', 'dataframe',
+               'station_stats', 'plotting']
+
+def _catalog(workdir, size, seed):
+    """! Returns the names of the synthetic catalog and station file of a size, writing them if needed"""
+
+    nordic_file = os.path.join(workdir, 'synthetic_{}_{}.nor'.format(size, seed))
+    station_file = os.path.join(workdir, 'synthetic_{}.sta'.format(seed))
+    if not (os.path.exists(nordic_file) and os.path.exists(station_file)):
+        station_table = synthetic.make_stations(100, np.random.default_rng(seed))
+        synthetic.write_stations(station_file, station_table)
+        temporary_file = nordic_file + '.tmp'
+        synthetic.write_catalog(temporary_file, size, station_table, seed)
+        os.replace(temporary_file, nordic_file)
+    return nordic_file, station_file
+
+class Stages:
+    """
+    Stages of the benchmark for one catalog
+
+    Each stage is a method that returns the number of items (events or
+    picks) it processed. The inputs of a stage (lines, tables, dataframe)
+    are prepared by prepare, outside of the measured time.
+    """
+
+    def __init__(self, nordic_file, station_file, output_dir):
+        self.nordic_file = nordic_file
+        self.station_file = station_file
+        self.output_dir = output_dir
+        self.inputs = {}
+
+    def prepare(self, stage):
+        """! Builds the inputs that a stage needs"""
+
+        if stage in ('read_line1', 'read_line4') and 'lines' not in self.inputs:
+            with open(self.nordic_file, encoding='latin-1') as fp:
+                lines = fp.readlines()
+            self.inputs['lines'] = {
+                '1': [line for line in lines if line[79:80] == '1'],
+                '4': [line for line in lines if line[79:80] in (' ', '4') and
+                      len(line.strip()) > 5 and not line.startswith(' STAT')],
+            }
+        if stage in ('dataframe', 'station_stats', 'plotting') and 'tables' not in self.inputs:
+            self.inputs['tables'] = nordic.read_tables(self.nordic_file)
+        if stage == 'plotting' and 'station' not in self.inputs:
+            import stations
+            hypocenters, picks = self.inputs['tables']
+            codes, counts = np.unique(picks['station_name'], return_counts=True)
+            station = codes[np.argmax(counts)]
+            df = stations.read_stations(self.station_file)
+            row = df[df['station'] == station].iloc[0]
+            self.inputs['station'] = (station, row['latitude'], row['longitude'])
+
+    def read_line1(self):
+        for line in self.inputs['lines']['1']:
+            nordic.read_line1(line)
+        return len(self.inputs['lines']['1'])
+
+    def read_line4(self):
+        for line in self.inputs['lines']['4']:
+            nordic.read_line4(line)
+        return len(self.inputs['lines']['4'])
+
+    def read_tables(self):
+        hypocenters, picks = nordic.read_tables(self.nordic_file)
+        return len(picks)
+
+    def read_mmap(self):
+        hypocenters, picks = nordic.read_tables_mmap(self.nordic_file)
+        return len(picks)
+
+    def dataframe(self):
+        import nordic2df
+        return len(nordic2df.phase_dataframe(*self.inputs['tables']))
+
+    def station_stats(self):
+        import station_list
+        import station_stats
+        hypocenters, picks = self.inputs['tables']
+        station_list.station_pick_counts(hypocenters, picks)
+        phases = station_stats.station_phases(hypocenters, picks, np.unique(picks['station_name']))
+        return sum(len(df) for df in phases.values())
+
+    def plotting(self):
+        import station_stats
+        station, latitude, longitude = self.inputs['station']
+        hypocenters, picks = self.inputs['tables']
+        dfs = station_stats.station_phases(hypocenters, picks, [station])[station]
+        dfp = dfs[dfs.phase == 'P']
+        station_stats.plot_station(station, latitude, longitude, dfp, self.output_dir)
+        return len(dfp)
+
+def run_stage(stages, stage, memory=True):
+    """! Function run_stage
+
+    @brief Measures one stage
+
+    @param[in]   stages   Stages of a catalog
+    @param[in]   stage    name of the stage
+    @param[in]   memory   also measure the peak memory allocated by the stage
+    @return      dict with the results of the stage
+    """
+
+    try:
+        stages.prepare(stage)
+        function = getattr(stages, stage)
+        start = time.perf_counter()
+        items = function()
+        seconds = time.perf_counter() - start
+    except ImportError as error:
+        return {'stage': stage, 'skipped': str(error)}
+
+    result = {'stage': stage, 'seconds': seconds, 'items': items,
+              'items_per_second': items / seconds if seconds > 0 else None}
+
+    if memory:
+        tracemalloc.start()
+        function()
+        result['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return result
+
+def _versions():
+    """! Returns the versions of the code, Python and the main libraries"""
+
+    versions = {'python': platform.python_version(), 'numpy': np.__version__,
+                'platform': platform.platform()}
+    for module in ('pandas', 'pyarrow'):
+        try:
+            versions[module] = __import__(module).__version__
+        except ImportError:
+            pass
+    try:
+        versions['commit'] = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return versions
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Benchmarks the processing stages on synthetic catalogs')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help='numbers of picks of the catalogs')
+    parser.add_argument('--stages', nargs='+', default=stage_names, choices=stage_names,
+                        metavar='STAGE', help='stages to run: ' + ', '.join(stage_names))
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic catalogs')
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'let-benchmark'),
+                        help='directory of the synthetic catalogs and plots')
+    parser.add_argument('--no-memory', action='store_true', help='do not measure memory')
+    parser.add_argument('-o', '--output', help='JSON output file (default standard output)')
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.workdir, exist_ok=True)
+
+    results = []
+    for size in args.sizes:
+        nordic_file, station_file = _catalog(args.workdir, size, args.seed)
+        stages = Stages(nordic_file, station_file, args.workdir)
+        for stage in args.stages:
+            result = run_stage(stages, stage, not args.no_memory)
+            result.update({'size': size, 'bytes': os.path.getsize(nordic_file)})
+            results.append(result)
+            print('{:>9d} {:14s} {}'.format(size, stage, 'skipped' if 'skipped' in result
+                                            else '{:.3f} s'.format(result['seconds'])),
+                  file=sys.stderr)
+
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'versions': _versions(),
+        'max_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        'results': results,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(report, fp, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+        print()
+
+if __name__ == '__main__':
+    main()
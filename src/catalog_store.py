@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""!
+
+@package catalog_store
+
+Persistent catalog of hypocenter and pick tables updated incrementally from a Nordic file
+
+The store is a directory with one partition per month of origin time
+(YYYY-MM.hypocenters.feather and YYYY-MM.picks.feather) and a manifest
+(manifest.feather) with the key, content hash and partition of every event.
+The key of an event is its SEISAN ID (type I line), or its origin time
+field if it has no ID; repeated keys get a suffix #2, #3...
+
+update scans the Nordic file as raw events and hashes each one, so only
+new events and events whose lines changed (e.g. relocated) are parsed.
+Events that are no longer in the file are kept in the manifest as
+tombstones. Only the partitions that contain new, changed or deleted
+events are rewritten. The manifest is written last, so an interrupted
+update is repeated by the next one.
+
+Usage: catalog_store.py update store_directory nordic_file
+       catalog_store.py export store_directory feather_file
+       catalog_store.py info store_directory
+
+Created on Sat Oct 17 14:40:17 2026
+"""
+
+import os
+import sys
+import hashlib
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+import nordic
+
+MANIFEST_FILE = 'manifest.feather'
+
+manifest_columns = ['key', 'hash', 'partition', 'deleted']
+
+def event_key(lines):
+    """! Returns the SEISAN ID of an event given as raw lines, or its origin time field"""
+
+    for line in lines[1:]:
+        if line[79:80] == b'I' and line[57:60] == b'ID:':
+            return line[60:74].decode('latin-1').strip()
+    return 'T' + lines[0][1:20].decode('latin-1')
+
+def event_partition(lines):
+    """! Returns the partition (YYYY-MM of the origin time) of an event given as raw lines"""
+    return '{}-{}'.format(lines[0][1:5].decode('latin-1').strip(),
+                          lines[0][6:8].decode('latin-1').strip().zfill(2))
+
+def _partition_files(store_directory, partition):
+    """! Returns the names of the Feather files of a partition"""
+    return [os.path.join(store_directory, '{}.{}.feather'.format(partition, name))
+            for name in ('hypocenters', 'picks')]
+
+def _write_feather(table, file_name):
+    """! Writes an Arrow table or DataFrame to a Feather file atomically"""
+    temporary_file = file_name + '.tmp'
+    feather.write_feather(table, temporary_file)
+    os.replace(temporary_file, file_name)
+
+def read_manifest(store_directory):
+    """! Function read_manifest
+
+    @brief Reads the manifest of a store
+
+    @param[in]   store_directory   directory of the store
+    @return      DataFrame with columns manifest_columns (empty for a new store)
+    """
+
+    file_name = os.path.join(store_directory, MANIFEST_FILE)
+    if not os.path.exists(file_name):
+        return pd.DataFrame({'key': pd.Series(dtype=object), 'hash': pd.Series(dtype=object),
+                             'partition': pd.Series(dtype=object),
+                             'deleted': pd.Series(dtype=bool)})
+    return feather.read_feather(file_name)
+
+def read_partition(store_directory, partition):
+    """! Function read_partition
+
+    @brief Reads the tables of a partition
+
+    @param[in]   store_directory   directory of the store
+    @param[in]   partition         name of the partition (YYYY-MM)
+    @return      (keys, nordic.HypocenterTable, nordic.PickTable), keys being the
+                 key of every hypocenter. Empty tables if the partition does not exist
+    """
+
+    hypocenter_file, pick_file = _partition_files(store_directory, partition)
+    if not os.path.exists(hypocenter_file):
+        hypocenters, picks = nordic.tables_from_events([])
+        return np.array([], dtype=object), hypocenters, picks
+
+    table = feather.read_table(hypocenter_file)
+    keys = table.column('key').to_numpy(zero_copy_only=False)
+    hypocenters = nordic.HypocenterTable.from_arrow(table.drop(['key']))
+    picks = nordic.PickTable.from_arrow(feather.read_table(pick_file))
+    return keys, hypocenters, picks
+
+def _write_partition(store_directory, partition, keys, hypocenters, picks):
+    """! Writes the tables of a partition, or removes it if it has no events"""
+
+    files = _partition_files(store_directory, partition)
+    if len(keys) == 0:
+        for file_name in files:
+            if os.path.exists(file_name):
+                os.remove(file_name)
+        return
+
+    table = hypocenters.to_arrow()
+    table = table.append_column('key', pa.array(np.asarray(keys, dtype=str)))
+    _write_feather(table, files[0])
+    _write_feather(picks.to_arrow(), files[1])
+
+def _take_events(hypocenters, picks, rows):
+    """! Returns the tables of the events in rows (boolean mask), renumbering the picks"""
+
+    new_row = np.cumsum(rows) - 1
+    pick_rows = rows[picks['event']]
+    picks = picks.take(pick_rows)
+    picks.columns['event'] = new_row[picks.columns['event']].astype(np.int64)
+    return hypocenters.take(rows), picks
+
+def update(store_directory, nordic_file):
+    """! Function update
+
+    @brief Updates a store with the events of a Nordic file
+
+    @param[in]   store_directory   directory of the store (created if needed)
+    @param[in]   nordic_file       name of the file in Nordic format with the whole catalog
+    @return      dict with the number of new, changed, deleted and unchanged
+                 events and the list of partitions rewritten
+    """
+
+    os.makedirs(store_directory, exist_ok=True)
+    manifest = read_manifest(store_directory)
+    live = manifest[~manifest['deleted']].set_index('key')
+    known_hash = live['hash'].to_dict()
+
+    # Scan the file as raw events and keep only the lines of new or changed events
+
+    keys = []
+    hashes = []
+    partitions = []
+    pending = {}
+    seen = {}
+    with open(nordic_file, 'rb', buffering=1 << 22) as fp:
+        for lines in nordic.iter_raw_events(fp):
+            key = event_key(lines)
+            seen[key] = seen.get(key, 0) + 1
+            if seen[key] > 1:
+                key = '{}#{}'.format(key, seen[key])
+            digest = hashlib.blake2b(b''.join(lines), digest_size=16).hexdigest()
+            keys.append(key)
+            hashes.append(digest)
+            partitions.append(event_partition(lines))
+            if known_hash.get(key) != digest:
+                pending[key] = lines
+
+    current = pd.DataFrame({'key': keys, 'hash': hashes, 'partition': partitions,
+                            'deleted': False})
+    deleted = live.index.difference(pd.Index(keys))
+    changed = [key for key in pending if key in known_hash]
+
+    affected = set(current['partition'][current['key'].isin(list(pending))])
+    affected.update(live.loc[changed, 'partition'])
+    affected.update(live.loc[deleted, 'partition'])
+
+    # Parse the new and changed events and rewrite the affected partitions
+
+    events = []
+    for key, lines in pending.items():
+        try:
+            events.extend(nordic.iter_events(lines))
+        except nordic.NordicFormatError as error:
+            message = str(error).rsplit(' (line', 1)[0]
+            raise nordic.NordicFormatError('event {}: {}'.format(key, message),
+                                           error.line_number, error.line) from None
+    new_hypocenters, new_picks = nordic.tables_from_events(events)
+    new_keys = np.array(list(pending), dtype=object)
+    new_partitions = np.array([event_partition(lines) for lines in pending.values()],
+                              dtype=object)
+    removed = set(pending) | set(deleted)
+
+    for partition in sorted(affected):
+        keys_old, hypocenters, picks = read_partition(store_directory, partition)
+        kept = ~np.isin(keys_old, list(removed))
+        added = new_partitions == partition
+        tables = [_take_events(hypocenters, picks, kept),
+                  _take_events(new_hypocenters, new_picks, added)]
+        hypocenters, picks = nordic.concatenate_tables(tables)
+        keys_new = np.concatenate([keys_old[kept], new_keys[added]])
+        _write_partition(store_directory, partition, keys_new, hypocenters, picks)
+
+    # Tombstones: previous ones that did not reappear, and the events deleted now
+
+    tombstones = manifest[manifest['deleted'] & ~manifest['key'].isin(keys)]
+    deleted_now = live.loc[deleted].rename_axis('key').reset_index()[manifest_columns]
+    deleted_now['deleted'] = True
+    manifest = pd.concat([current, tombstones, deleted_now], ignore_index=True)
+    manifest['deleted'] = manifest['deleted'].astype(bool)
+    _write_feather(manifest, os.path.join(store_directory, MANIFEST_FILE))
+
+    return {'new': len(pending) - len(changed), 'changed': len(changed),
+            'deleted': len(deleted), 'unchanged': len(keys) - len(pending),
+            'partitions': sorted(affected)}
+
+def read_tables(store_directory):
+    """! Function read_tables
+
+    @brief Reads all the events of a store
+
+    @param[in]   store_directory   directory of the store
+    @return      (nordic.HypocenterTable, nordic.PickTable) sorted by origin time,
+                 as returned by nordic.read_tables
+    """
+
+    manifest = read_manifest(store_directory)
+    partitions = sorted(set(manifest['partition'][~manifest['deleted']]))
+    tables = [read_partition(store_directory, partition)[1:] for partition in partitions]
+    return nordic.sort_tables(*nordic.concatenate_tables(tables))
+
+if __name__ == '__main__':
+
+    if len(sys.argv) < 3 or sys.argv[1] not in ('update', 'export', 'info'):
+        print("Usage: catalog_store.py update store_directory nordic_file")
+        print("       catalog_store.py export store_directory feather_file")
+        print("       catalog_store.py info store_directory")
+        sys.exit()
+
+    store_directory = sys.argv[2]
+
+    if sys.argv[1] == 'update':
+        try:
+            result = update(store_directory, sys.argv[3])
+        except nordic.NordicFormatError as error:
+            print('ERROR: ' + str(error))
+            print(error.line)
+            sys.exit()
+        print('New: {new}  changed: {changed}  deleted: {deleted}  unchanged: {unchanged}'
+              .format(**result))
+        print('Partitions rewritten: ' + ' '.join(result['partitions']))
+
+    elif sys.argv[1] == 'export':
+        import nordic2df
+        hypocenters, picks = read_tables(store_directory)
+        feather.write_feather(nordic2df.phase_dataframe(hypocenters, picks), sys.argv[3])
+        print("Number of events exported: ", len(hypocenters))
+
+    else:
+        manifest = read_manifest(store_directory)
+        live = manifest[~manifest['deleted']]
+        print('Events: {}  tombstones: {}  partitions: {}'.format(
+              len(live), manifest['deleted'].sum(), live['partition'].nunique()))
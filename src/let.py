@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""! let.py
+
+@brief Command-line entry point for the processing of local earthquake tomography data
+
+Usage: let.py [--timing] [--metrics FILE] [--profile {cprofile,sample}] subcommand [arguments]
+
+Subcommands:
+convert        converts a Nordic file to Feather (nordic2df.py)
+station-list   statistics of the stations of a catalog (station_list.py)
+station-stats  statistics and plots of the picks of stations (station_stats.py)
+select         writes the events of a catalog that match a query (select_eq.py)
+index          builds the event index of a Nordic file (nordic_index.py)
+ingest         reads the S-files of a SEISAN database directory (rea.py)
+catalog        converts a Nordic file to an ObsPy catalog file (obspy_catalog.py)
+residuals      statistics of the travel-time residuals (residual_stats.py)
+export         writes rays for SIMUL, FMTOMO or LOTOS (let_export.py)
+
+Only this module and argparse are imported before a subcommand is chosen.
+Each subcommand imports the modules it needs, and the plotting libraries
+(matplotlib, seaborn, cartopy) and ObsPy are only imported when a subcommand
+actually makes plots. The time from the start of this module until the
+modules of the subcommand are imported must stay below STARTUP_BUDGET;
+--timing prints it together with the heavy libraries that were loaded.
+
+--metrics writes the wall time, throughput and peak memory of the stages of
+the subcommand as JSON when it exits ('-' for the standard error, see
+metrics.py). --profile runs the subcommand under cProfile or under a
+sampling profiler, writing the profile to --profile-output.
+
+Created on Sat Oct 17 13:02:10 2026
+"""
+
+import time
+
+_start = time.perf_counter()
+
+import sys
+import argparse
+
+STARTUP_BUDGET = 1.0   # seconds
+
+heavy_modules = ['matplotlib', 'seaborn', 'cartopy', 'obspy']
+
+# Each loader imports the modules of a subcommand and returns its main function
+
+def _convert():
+    import nordic2df
+    return nordic2df.main
+
+def _station_list():
+    import station_list
+    return station_list.main
+
+def _station_stats():
+    import station_stats
+    return station_stats.main
+
+def _select():
+    import select_eq
+    return select_eq.main
+
+def _ingest():
+    import rea
+    return rea.main
+
+def _catalog():
+    import obspy_catalog
+    return obspy_catalog.main
+
+def _residuals():
+    import residual_stats
+    return residual_stats.main
+
+def _export():
+    import let_export
+    return let_export.main
+
+def _index():
+    import nordic_index
+    return lambda args: _index_main(nordic_index, args)
+
+def _index_main(nordic_index, args):
+
+    parser = argparse.ArgumentParser(prog='let.py index',
+                                     description='Builds the event index of a Nordic file')
+    parser.add_argument('nordic_file', help='file in Nordic format')
+    args = parser.parse_args(args)
+
+    index = nordic_index.load_index(args.nordic_file)
+    print("Number of events indexed: ", len(index['offset']))
+
+subcommands = {
+    'convert':       (_convert, 'converts a Nordic file to Feather'),
+    'station-list':  (_station_list, 'statistics of the stations of a catalog'),
+    'station-stats': (_station_stats, 'statistics and plots of the picks of stations'),
+    'select':        (_select, 'writes the events of a catalog that match a query'),
+    'index':         (_index, 'builds the event index of a Nordic file'),
+    'ingest':        (_ingest, 'reads the S-files of a SEISAN database directory'),
+    'catalog':       (_catalog, 'converts a Nordic file to an ObsPy catalog file'),
+    'residuals':     (_residuals, 'statistics of the travel-time residuals'),
+    'export':        (_export, 'writes rays for SIMUL, FMTOMO or LOTOS'),
+}
+
+def startup_report(elapsed):
+    """! Prints the startup time and the heavy modules already imported"""
+
+    loaded = [name for name in heavy_modules if name in sys.modules]
+    print('Startup time: {:.3f} s (budget {:.3f} s)'.format(elapsed, STARTUP_BUDGET),
+          file=sys.stderr)
+    if elapsed > STARTUP_BUDGET:
+        print('WARNING: startup time over budget', file=sys.stderr)
+    if loaded:
+        print('Heavy modules loaded at startup: ' + ', '.join(loaded), file=sys.stderr)
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(prog='let.py',
+                                     description='Processing of local earthquake tomography data')
+    parser.add_argument('--timing', action='store_true',
+                        help='print the startup time of the subcommand')
+    parser.add_argument('--metrics', metavar='FILE',
+                        help="write the metrics of the stages as JSON at exit ('-' for stderr)")
+    parser.add_argument('--profile', choices=['cprofile', 'sample'],
+                        help='run the subcommand under a profiler')
+    parser.add_argument('--profile-output', metavar='FILE',
+                        help='profile file (default let.prof or let.samples.txt)')
+    subparsers = parser.add_subparsers(dest='subcommand', metavar='subcommand')
+    for name, (loader, description) in subcommands.items():
+        subparsers.add_parser(name, help=description, add_help=False)
+
+    # The arguments of the subcommand are parsed by the subcommand itself
+    args, subcommand_args = parser.parse_known_args(argv)
+    if args.subcommand is None:
+        parser.print_help()
+        sys.exit()
+
+    loader, description = subcommands[args.subcommand]
+    function = loader()
+
+    if args.timing:
+        startup_report(time.perf_counter() - _start)
+
+    if args.metrics or args.profile:
+        import metrics
+        if args.metrics:
+            metrics.dump_at_exit(args.metrics)
+        if args.profile:
+            metrics.profile(function, (subcommand_args,), args.profile, args.profile_output)
+            return
+
+    function(subcommand_args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,438 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""!
+
+@package let_export
+
+Writes the rays of a catalog as input files of local earthquake tomography codes
+
+The picks of the catalog are turned into rays (event, receiver, phase,
+travel time, weight) with array operations: picks are joined to the epoch
+of their station in operation at the time of the pick (see
+stations.StationInventory), duplicated picks and later phases are removed
+(see obspy_catalog.first_arrivals), and picks with weight code 4 or more,
+without time, outside the operating period of their station or with a
+travel time that is not positive or above max_travel_time are left out.
+Each station epoch used by some ray is a receiver.
+
+The writers produce:
+
+- SIMUL-style (VELEST/SIMUL2000): events and phases in CNV format
+  (prefix.cnv) and the station list (prefix.sta)
+- FMTOMO-style: sources.in, receivers.in and otimes.dat
+- LOTOS-style: rays.dat and stat_ft.dat
+
+The fixed-width fields are not formatted one value at a time: the digits of
+whole columns are written into byte arrays (the reverse of the bulk
+decoders of nordic.py), the lines of each file are assembled with one
+scatter and written with a single write.
+
+Usage: let_export.py station_file nordic_file --format {simul,fmtomo,lotos} -o output
+
+Created on Sat Oct 17 19:02:44 2026
+"""
+
+import os
+import sys
+import argparse
+
+import numpy as np
+
+import nordic
+import stations
+
+formats = ['simul', 'fmtomo', 'lotos']
+
+# Travel-time uncertainty in seconds of the weight codes 0 to 3 (FMTOMO)
+weight_uncertainty = np.array([0.05, 0.1, 0.2, 0.4])
+
+# Longest travel time in seconds of the rays exported
+max_travel_time = 300.0
+
+_NS_PER_SECOND = 1000000000
+
+def _fixed(values, width, decimals=0, zero_pad=False):
+    """! Function _fixed
+
+    @brief Formats a column of numbers right-aligned in a fixed-width field
+
+    The result is the same as formatting every value with '{:width.decimalsf}'
+    (or '{:0widthd}' with zero_pad), except that negative values rounded to
+    zero have no sign. Values that do not fit and values that are not finite
+    (NaN or infinite) are written as asterisks, like Fortran does.
+
+    @param[in]   values     array of numbers
+    @param[in]   width      width of the field
+    @param[in]   decimals   number of decimals
+    @param[in]   zero_pad   pad integers with zeros instead of blanks
+    @return      uint8 array of shape (len(values), width)
+    """
+
+    values = np.asarray(values, dtype=np.float64)
+    finite = np.isfinite(values)
+    values = np.where(finite, values, 0.0)
+    scaled = np.abs(values) * 10.0 ** decimals
+    # Values close to half a unit are rounded by Python from their exact binary value
+    tie = np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6)
+    scaled = np.floor(scaled + 0.5).astype(np.int64)
+    scaled[tie] = [int('{:.{}f}'.format(value, decimals).replace('.', '').lstrip('-'))
+                   for value in np.abs(values[tie]).tolist()]
+    negative = (values < 0) & (scaled > 0)
+    integer = scaled // 10 ** decimals
+
+    block = np.full((len(values), width), ord('0' if zero_pad else ' '), dtype=np.uint8)
+    column = width - 1
+    for j in range(decimals):
+        block[:, column] = ord('0') + (scaled // 10 ** j) % 10
+        column -= 1
+    if decimals:
+        block[:, column] = ord('.')
+        column -= 1
+
+    num_digits = np.ones(len(values), dtype=np.int64)
+    for i in range(1, 19):
+        num_digits += integer >= 10 ** i
+
+    for i in range(column + 1):
+        written = (i < num_digits) | zero_pad
+        block[written, column - i] = ord('0') + (integer[written] // 10 ** i) % 10
+    sign_column = column - num_digits
+    signed = negative & (sign_column >= 0)
+    block[np.flatnonzero(signed), sign_column[signed]] = ord('-')
+
+    overflow = (num_digits + negative > column + 1) | ~finite
+    block[overflow] = ord('*')
+    return block
+
+def _text(strings, width):
+    """! Formats a column of strings left-aligned (and truncated) in a fixed-width field"""
+    encoded = np.char.encode(np.asarray(strings, dtype=str), 'latin-1').astype('S{}'.format(width))
+    block = np.frombuffer(encoded.tobytes(), dtype=np.uint8).reshape(len(encoded), width).copy()
+    block[block == 0] = ord(' ')
+    return block
+
+def _constant(text, rows):
+    """! Repeats a constant string in all the rows"""
+    return np.tile(np.frombuffer(text.encode('latin-1'), dtype=np.uint8), (rows, 1))
+
+def _row(*fields):
+    """! Joins blocks of fields (uint8 arrays) and constant strings into one block of rows"""
+    rows = next(len(field) for field in fields if not isinstance(field, str))
+    return np.hstack([_constant(field, rows) if isinstance(field, str) else field
+                      for field in fields])
+
+def _assemble(pieces):
+    """! Function _assemble
+
+    @brief Concatenates the rows of several blocks in the order of their keys
+
+    @param[in]   pieces   list of (keys, block): int64 array of sort keys and the uint8
+                          block with one row per key. Rows of different blocks can
+                          have different widths
+    @return      bytes with all the rows, sorted by key (stable for equal keys)
+    """
+
+    keys = np.concatenate([key for key, block in pieces])
+    widths = np.concatenate([np.full(len(key), block.shape[1], dtype=np.int64)
+                             for key, block in pieces])
+    order = np.argsort(keys, kind='stable')
+    start = np.empty(len(keys), dtype=np.int64)
+    start[order] = np.cumsum(widths[order]) - widths[order]
+
+    output = np.empty(int(widths.sum()), dtype=np.uint8)
+    first = 0
+    for key, block in pieces:
+        rows = start[first:first + len(key)]
+        output[rows[:, None] + np.arange(block.shape[1])] = block
+        first += len(key)
+    return output.tobytes()
+
+def _write(file_name, data):
+    """! Writes bytes to a file with one buffered write"""
+    with open(file_name, 'wb') as fp:
+        fp.write(data)
+
+def rays(hypocenters, picks, inventory, phase_types='PS', max_travel_time=max_travel_time):
+    """! Function rays
+
+    @brief Selects the rays of a catalog and joins them to their events and receivers
+
+    @param[in]   hypocenters   nordic.HypocenterTable
+    @param[in]   picks         nordic.PickTable
+    @param[in]   inventory     stations.StationInventory
+    @param[in]   phase_types   first letters of the phases exported
+    @param[in]   max_travel_time   longest travel time in seconds. Picks with longer
+                                   travel times (e.g. with a wrong hour or day) are
+                                   left out
+    @return      dict with three dicts of arrays:
+                 'rays':      event, receiver (rows of the other two), phase (1 for P,
+                              2 for S), travel_time (s) and weight_code, sorted by
+                              event, receiver and phase
+                 'events':    time (datetime64[ns]), latitude, longitude, depth, magnitude
+                 'receivers': station, latitude, longitude, elevation (m)
+    """
+
+    import obspy_catalog
+
+    kept = obspy_catalog.first_arrivals(hypocenters, picks, phase_types=phase_types)
+    picks = picks.take(kept)
+
+    epochs = inventory.pick_epochs(hypocenters, picks)
+    origin_time = nordic.origin_times(hypocenters['year'], hypocenters['month'],
+                                      hypocenters['day'], hypocenters['hour'],
+                                      hypocenters['minute'], hypocenters['second'])
+    event = picks['event']
+    pick_time = nordic.pick_times(hypocenters, picks)
+    travel_time = ((pick_time.astype(np.int64) - origin_time[event].astype(np.int64))
+                   / _NS_PER_SECOND)
+    weight_code = np.nan_to_num(picks['weight_code'], nan=0.0).astype(np.int64)
+
+    located = ~(np.isnan(hypocenters['latitude']) | np.isnan(hypocenters['longitude']) |
+                np.isnan(hypocenters['depth']) | np.isnat(origin_time))
+    selected = ((epochs['epoch'] >= 0) & ~epochs['outside'] & located[event] &
+                ~np.isnat(pick_time) & (travel_time > 0) &
+                (travel_time <= max_travel_time) & (weight_code < 4))
+
+    phase = np.char.ljust(picks['phase'].astype(str), 1).astype('U1')
+    phase_code = np.where(phase == 'S', 2, 1)
+
+    epoch_used, receiver = np.unique(epochs['epoch'][selected], return_inverse=True)
+    event_used, event_row = np.unique(event[selected], return_inverse=True)
+    ray = {
+        'event':       event_row.reshape(-1),
+        'receiver':    receiver.reshape(-1),
+        'phase':       phase_code[selected],
+        'travel_time': travel_time[selected],
+        'weight_code': weight_code[selected],
+    }
+    order = np.lexsort((ray['phase'], ray['receiver'], ray['event']))
+    ray = {name: column[order] for name, column in ray.items()}
+
+    magnitude = hypocenters['mag1'][event_used]
+    return {
+        'rays': ray,
+        'events': {
+            'time':      origin_time[event_used],
+            'latitude':  hypocenters['latitude'][event_used],
+            'longitude': hypocenters['longitude'][event_used],
+            'depth':     hypocenters['depth'][event_used],
+            'magnitude': np.nan_to_num(magnitude, nan=0.0),
+        },
+        'receivers': {
+            'station':   inventory.epochs['station'].to_numpy(dtype=str)[epoch_used],
+            'latitude':  inventory.epochs['latitude'].to_numpy()[epoch_used],
+            'longitude': inventory.epochs['longitude'].to_numpy()[epoch_used],
+            'elevation': inventory.epochs['elevation'].to_numpy()[epoch_used],
+        },
+    }
+
+def _time_fields(time):
+    """! Returns year, month, day, hour, minute and seconds of a datetime64[ns] array"""
+
+    day = time.astype('datetime64[D]')
+    month = time.astype('datetime64[M]')
+    year = time.astype('datetime64[Y]')
+    nanoseconds = (time - day).astype(np.int64)
+    return (year.astype(np.int64) + 1970, (month - year).astype(np.int64) + 1,
+            (day - month).astype(np.int64) + 1, nanoseconds // (3600 * _NS_PER_SECOND),
+            nanoseconds // (60 * _NS_PER_SECOND) % 60,
+            nanoseconds % (60 * _NS_PER_SECOND) / _NS_PER_SECOND)
+
+def _hemisphere(values, positive, negative):
+    """! Returns the absolute values and a block with the hemisphere letter"""
+    letter = np.where(np.asarray(values) < 0, ord(negative), ord(positive)).astype(np.uint8)
+    return np.abs(values), letter[:, None]
+
+def write_simul(data, prefix):
+    """! Function write_simul
+
+    @brief Writes rays in the CNV format of VELEST and SIMUL2000, and their station list
+
+    prefix.cnv has one header line per event followed by its phases, six per
+    line (station, P or S, weight code and travel time), and a blank line.
+    prefix.sta has one line per station (station codes are 4 characters);
+    stations with several epochs get the coordinates of the first epoch used.
+
+    @param[in]   data     dict returned by rays
+    @param[in]   prefix   prefix of the output files
+    @return      list of output file names
+    """
+
+    ray, event, receiver = data['rays'], data['events'], data['receivers']
+    codes = receiver['station']
+    if len(codes) and max(len(code) for code in codes) > 4:
+        raise ValueError('station codes longer than 4 characters: ' +
+                         ' '.join(sorted(set(code for code in codes if len(code) > 4))))
+
+    # Events: header, phases (6 per line) and blank line
+
+    num_events = len(event['time'])
+    year, month, day, hour, minute, second = _time_fields(event['time'])
+    latitude, ns = _hemisphere(event['latitude'], 'N', 'S')
+    longitude, ew = _hemisphere(event['longitude'], 'E', 'W')
+    header = _row(_fixed(year % 100, 2, zero_pad=True), _fixed(month, 2, zero_pad=True),
+                  _fixed(day, 2, zero_pad=True), ' ', _fixed(hour, 2, zero_pad=True),
+                  _fixed(minute, 2, zero_pad=True), ' ', _fixed(second, 5, 2), ' ',
+                  _fixed(latitude, 7, 4), ns, ' ', _fixed(longitude, 8, 4), ew, ' ',
+                  _fixed(event['depth'], 7, 2), '  ', _fixed(event['magnitude'], 5, 2), '\n')
+
+    first = np.searchsorted(ray['event'], np.arange(num_events + 1))
+    num_rays = np.diff(first)
+    rank = np.arange(len(ray['event'])) - first[ray['event']]
+    end_of_line = (rank % 6 == 5) | (rank == num_rays[ray['event']] - 1)
+    phases = _row(_text(codes[ray['receiver']], 4),
+                  np.where(ray['phase'] == 2, ord('S'), ord('P')).astype(np.uint8)[:, None],
+                  _fixed(ray['weight_code'], 1), _fixed(ray['travel_time'], 6, 2))
+
+    slots = 2 * int(num_rays.max(initial=0)) + 3
+    key = ray['event'] * slots + 1 + 2 * rank
+    events = np.arange(num_events) * slots
+    cnv = _assemble([(events, header), (key, phases),
+                     (key[end_of_line] + 1, _constant('\n', end_of_line.sum())),
+                     (events + slots - 1, _constant('\n', num_events))])
+
+    # Stations: format line, one line per station code and blank line
+
+    codes, rows = np.unique(codes, return_index=True)
+    latitude, ns = _hemisphere(receiver['latitude'][rows], 'N', 'S')
+    longitude, ew = _hemisphere(receiver['longitude'][rows], 'E', 'W')
+    station_lines = _row(_text(codes, 4), _fixed(latitude, 7, 4), ns, ' ',
+                         _fixed(longitude, 8, 4), ew, ' ',
+                         _fixed(receiver['elevation'][rows], 4), ' 1 ',
+                         _fixed(np.arange(1, len(codes) + 1), 3), '  0.00   0.00\n')
+    sta = (b'(a4,f7.4,a1,1x,f8.4,a1,1x,i4,1x,i1,1x,i3,1x,f5.2,2x,f5.2)\n' +
+           station_lines.tobytes() + b'\n')
+
+    names = [prefix + '.cnv', prefix + '.sta']
+    _write(names[0], cnv)
+    _write(names[1], sta)
+    return names
+
+def write_fmtomo(data, directory):
+    """! Function write_fmtomo
+
+    @brief Writes rays as the sources.in, receivers.in and otimes.dat files of FMTOMO
+
+    Every source has two paths, direct P (path 1, velocity field 1) and
+    direct S (path 2, velocity field 2). Every receiver lists the sources and
+    paths of its rays, and otimes.dat has one line per ray in the same order,
+    with the travel time and its uncertainty from the weight code
+    (weight_uncertainty). Depths are in km, positive downwards.
+
+    @param[in]   data        dict returned by rays
+    @param[in]   directory   output directory (created if needed)
+    @return      list of output file names
+    """
+
+    ray, event, receiver = data['rays'], data['events'], data['receivers']
+    os.makedirs(directory, exist_ok=True)
+    num_events = len(event['time'])
+    num_receivers = len(receiver['station'])
+
+    sources = _row('0\n', _fixed(event['depth'], 10, 4), ' ', _fixed(event['latitude'], 10, 4),
+                   ' ', _fixed(event['longitude'], 10, 4), '\n2\n1\n0 1\n1\n1\n0 1\n2\n')
+    sources = '{}\n'.format(num_events).encode() + sources.tobytes()
+
+    # Receivers: rays sorted by receiver, then event and phase
+    order = np.lexsort((ray['phase'], ray['event'], ray['receiver']))
+    by_receiver = {name: column[order] for name, column in ray.items()}
+    first = np.searchsorted(by_receiver['receiver'], np.arange(num_receivers + 1))
+    num_paths = np.diff(first)
+    rank = np.arange(len(order)) - first[by_receiver['receiver']]
+
+    header = _row(_fixed(-receiver['elevation'] / 1000.0, 10, 4), ' ',
+                  _fixed(receiver['latitude'], 10, 4), ' ',
+                  _fixed(receiver['longitude'], 10, 4), '\n', _fixed(num_paths, 8), '\n')
+    slots = 2 * int(num_paths.max(initial=0)) + 3
+    receivers = np.arange(num_receivers) * slots
+    key = by_receiver['receiver'] * slots + 1 + rank
+    receiver_file = ('{}\n'.format(num_receivers).encode() + _assemble([
+        (receivers, header),
+        (key, _fixed(by_receiver['event'] + 1, 8)),
+        (receivers + slots // 2, _constant('\n', num_receivers)),
+        (key + slots // 2, _fixed(by_receiver['phase'], 2)),
+        (receivers + slots - 1, _constant('\n', num_receivers))]))
+
+    otimes = _row('1 ', _fixed(by_receiver['travel_time'], 10, 4), ' ',
+                  _fixed(weight_uncertainty[by_receiver['weight_code']], 8, 4), '\n')
+
+    names = [os.path.join(directory, name)
+             for name in ('sources.in', 'receivers.in', 'otimes.dat')]
+    _write(names[0], sources)
+    _write(names[1], receiver_file)
+    _write(names[2], otimes.tobytes())
+    return names
+
+def write_lotos(data, directory):
+    """! Function write_lotos
+
+    @brief Writes rays as the rays.dat and stat_ft.dat files of LOTOS
+
+    rays.dat has for every event a line with longitude, latitude, depth and
+    number of rays, followed by one line per ray with the phase (1 for P, 2
+    for S), the number of the station (line of stat_ft.dat) and the travel
+    time. stat_ft.dat has longitude, latitude and elevation in km.
+
+    @param[in]   data        dict returned by rays
+    @param[in]   directory   output directory (created if needed)
+    @return      list of output file names
+    """
+
+    ray, event, receiver = data['rays'], data['events'], data['receivers']
+    os.makedirs(directory, exist_ok=True)
+    num_events = len(event['time'])
+
+    num_rays = np.bincount(ray['event'], minlength=num_events)
+    header = _row(_fixed(event['longitude'], 10, 4), _fixed(event['latitude'], 10, 4),
+                  _fixed(event['depth'], 8, 2), _fixed(num_rays, 6), '\n')
+    lines = _row(_fixed(ray['phase'], 3), _fixed(ray['receiver'] + 1, 7),
+                 _fixed(ray['travel_time'], 10, 4), '\n')
+    rays_file = _assemble([(np.arange(num_events) * 2, header), (ray['event'] * 2 + 1, lines)])
+
+    station_lines = _row(_fixed(receiver['longitude'], 10, 4), _fixed(receiver['latitude'], 10, 4),
+                         _fixed(receiver['elevation'] / 1000.0, 8, 3), '\n')
+
+    names = [os.path.join(directory, name) for name in ('rays.dat', 'stat_ft.dat')]
+    _write(names[0], rays_file)
+    _write(names[1], station_lines.tobytes())
+    return names
+
+writers = {'simul': write_simul, 'fmtomo': write_fmtomo, 'lotos': write_lotos}
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Writes the rays of a catalog for tomography codes')
+    parser.add_argument('station_file', help='station file')
+    parser.add_argument('nordic_file', help='file in Nordic format')
+    parser.add_argument('--format', choices=formats, required=True, help='output format')
+    parser.add_argument('-o', '--output', required=True,
+                        help='prefix of the output files (simul) or output directory')
+    parser.add_argument('--max-travel-time', type=float, default=max_travel_time,
+                        help='longest travel time in seconds of the rays exported '
+                             '(default {:g})'.format(max_travel_time))
+    args = parser.parse_args(argv)
+
+    import parse_cache
+
+    inventory = stations.StationInventory.from_file(args.station_file)
+    try:
+        hypocenters, picks = parse_cache.read_tables(args.nordic_file)
+    except nordic.NordicFormatError as error:
+        print('ERROR: ' + str(error))
+        print(error.line)
+        sys.exit()
+
+    data = rays(hypocenters, picks, inventory, max_travel_time=args.max_travel_time)
+    print("Number of events: ", len(data['events']['time']))
+    print("Number of receivers: ", len(data['receivers']['station']))
+    print("Number of rays: ", len(data['rays']['event']))
+
+    try:
+        names = writers[args.format](data, args.output)
+    except ValueError as error:
+        print('ERROR: ' + str(error))
+        sys.exit()
+    print('Written ' + ', '.join(names))
+
+if __name__ == '__main__':
+    main()
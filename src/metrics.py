@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""!
+
+@package metrics
+
+Throughput metrics of the processing stages and profiling hooks
+
+The stages of the pipelines (reading, decoding, time conversion, dataframe
+building, writing, plotting...) are timed with
+
+    with metrics.stage('decode') as record:
+        ...
+        record.add(events=len(hypocenters), picks=len(picks))
+
+Every stage accumulates its wall time, number of calls and the bytes,
+events and picks it processed, and the peak resident set size of the
+process at its end. report returns all the stages with their throughput
+(bytes/s, events/s, picks/s), and dump writes it as JSON. If the
+environment variable LET_METRICS names a file, the report is written there
+at exit (let.py --metrics does the same).
+
+profile runs a function under cProfile or under a sampling profiler based
+on SIGPROF, that writes the sampled stacks in the collapsed format of flame
+graph tools.
+
+Created on Sat Oct 17 16:52:30 2026
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import resource
+from contextlib import contextmanager
+
+def peak_rss():
+    """! Returns the peak resident set size of this process and its children in bytes"""
+
+    scale = 1 if sys.platform == 'darwin' else 1024     # ru_maxrss is in KiB on Linux
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) * scale
+
+class StageRecord:
+    """
+    Accumulated measurements of one stage
+
+    Attributes
+    ----------
+    seconds : float
+        total wall time
+    calls : int
+        number of times the stage was run
+    bytes, events, picks : int
+        amount of data processed
+    peak_rss : int
+        peak resident set size in bytes at the end of the last call
+    """
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.calls = 0
+        self.bytes = 0
+        self.events = 0
+        self.picks = 0
+        self.peak_rss = 0
+
+    def add(self, bytes=0, events=0, picks=0):
+        """! Adds processed data to the stage"""
+        self.bytes += bytes
+        self.events += events
+        self.picks += picks
+
+    def to_dict(self):
+        """! Returns the measurements and throughputs of the stage"""
+
+        result = {'seconds': self.seconds, 'calls': self.calls, 'bytes': self.bytes,
+                  'events': self.events, 'picks': self.picks, 'peak_rss_bytes': self.peak_rss}
+        for name in ('bytes', 'events', 'picks'):
+            count = getattr(self, name)
+            if count and self.seconds > 0:
+                result[name + '_per_second'] = count / self.seconds
+        return result
+
+class Metrics:
+    """
+    Collection of the stages measured in a process
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        """! Context manager that measures a run of a stage and yields its StageRecord"""
+
+        record = self.stages.get(name)
+        if record is None:
+            record = self.stages[name] = StageRecord()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record.seconds += time.perf_counter() - start
+            record.calls += 1
+            record.peak_rss = peak_rss()
+
+    def report(self):
+        """! Returns a dict with the total wall time, peak RSS and the stages"""
+        return {
+            'command': ' '.join(sys.argv),
+            'wall_seconds': time.perf_counter() - self.start,
+            'peak_rss_bytes': peak_rss(),
+            'stages': {name: record.to_dict() for name, record in self.stages.items()},
+        }
+
+    def dump(self, file_name):
+        """! Writes the report as JSON ('-' for the standard error)"""
+
+        if file_name == '-':
+            json.dump(self.report(), sys.stderr, indent=1)
+            print(file=sys.stderr)
+            return
+        with open(file_name, 'w') as fp:
+            json.dump(self.report(), fp, indent=1)
+
+metrics = Metrics()
+
+def stage(name):
+    """! Measures a stage in the metrics of the process (see Metrics.stage)"""
+    return metrics.stage(name)
+
+def dump_at_exit(file_name):
+    """! Writes the metrics of the process to file_name when it exits"""
+    atexit.register(metrics.dump, file_name)
+
+if os.environ.get('LET_METRICS'):
+    dump_at_exit(os.environ['LET_METRICS'])
+
+class SamplingProfiler:
+    """
+    Statistical profiler that records the stack of the main thread at
+    regular intervals of CPU time (SIGPROF, Unix only)
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = {}
+
+    def _sample(self, signum, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append('{}:{}'.format(os.path.basename(code.co_filename), code.co_name))
+            frame = frame.f_back
+        key = ';'.join(reversed(stack))
+        self.samples[key] = self.samples.get(key, 0) + 1
+
+    def __enter__(self):
+        import signal
+        self._previous = signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        return self
+
+    def __exit__(self, *exc):
+        import signal
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self._previous)
+
+    def write(self, file_name):
+        """! Writes the samples as collapsed stacks ('stack count' lines)"""
+        with open(file_name, 'w') as fp:
+            for stack, count in sorted(self.samples.items()):
+                fp.write('{} {}\n'.format(stack, count))
+
+    def top(self, limit=20):
+        """! Returns the functions with most samples at the top of the stack"""
+        own = {}
+        for stack, count in self.samples.items():
+            function = stack.rsplit(';', 1)[-1]
+            own[function] = own.get(function, 0) + count
+        return sorted(own.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+def profile(function, args=(), kind='cprofile', output=None):
+    """! Function profile
+
+    @brief Runs a function under a profiler and writes the profile
+
+    @param[in]   function   function to run
+    @param[in]   args       arguments of the function
+    @param[in]   kind       'cprofile' (deterministic) or 'sample' (sampling profiler)
+    @param[in]   output     output file (default let.prof or let.samples.txt). cProfile
+                            output can be read with pstats, samples are collapsed stacks
+    @return      value returned by the function
+    """
+
+    if kind == 'cprofile':
+        import cProfile
+        import pstats
+        output = output or 'let.prof'
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(function, *args)
+        finally:
+            profiler.dump_stats(output)
+            pstats.Stats(profiler, stream=sys.stderr).sort_stats('cumulative').print_stats(20)
+            print('Profile written to ' + output, file=sys.stderr)
+
+    output = output or 'let.samples.txt'
+    profiler = SamplingProfiler()
+    try:
+        with profiler:
+            return function(*args)
+    finally:
+        profiler.write(output)
+        for name, count in profiler.top():
+            print('{:8d}  {}'.format(count, name), file=sys.stderr)
+        print('Samples written to ' + output, file=sys.stderr)
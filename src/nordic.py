@@ -12,22 +12,97 @@ H =
 4 = phase card
 7 = phase card header
 
-To implement:
+Decoded on access (see Event):
 
 2 = Macroseismic information
 3 = Comment (or XNEAR, XFAR, SDEP for hypocenter)
 5 = Error estimates (not used by SEISAN)
 6 = Waveform information (file or archive)
+E = Hypocenter error estimates
 
 NOTE: Type 1 line must be the first, all type 4 lines should be together and
 the last line must be blank
 
+Every Event keeps all its lines as raw bytes. The auxiliary lines (types 2,
+3, 5, 6 and E) are only decoded into Macroseismic, Comment, ErrorEstimate and
+Waveform dataclasses the first time the corresponding attribute of the Event
+is read, so the bulk readers never pay for them. write_events writes events
+back from their raw lines, byte for byte.
+
+Events are read one at a time with the generator iter_events, that yields
+Event objects with the hypocenter, the high-precision hypocenter (line H)
+and the phase cards of each event, so that files of any size can be
+processed with constant memory.
+
+The whole file can also be read into column tables with read_tables, or in
+chunks with iter_tables, using the bulk readers described below, and
+tables_from_events builds the same tables from any sequence of events.
+Tables are HypocenterTable and PickTable containers, with typed numpy arrays
+for the numeric columns and interned codes for the string columns. Large
+files can be read with several processes with read_tables_parallel, that
+splits the file at the blank lines between events.
+
+read_tables_mmap and iter_tables_mmap return the same tables from a memory
+map of the file: line and event boundaries are found on the raw bytes and
+the fields are decoded from the map without building a string per line.
+Memory does not grow with the size of the file and the pages are shared by
+all the processes that read it (read_tables_parallel with use_mmap).
+
+iter_tables_tolerant reads in chunks like iter_tables but hands malformed
+events to a callback instead of raising, and gives the file position after
+every chunk, so long conversions can keep going and be resumed.
+
+Splitting events into lines, scanning the map and decoding are measured as
+the stages split, scan and decode of metrics (only in the calling process:
+the stages run by the workers of read_tables_parallel are not collected).
+
+Origin and pick times of whole tables are built with origin_times and
+pick_times, as datetime64[ns] arrays, with integer arithmetic: seconds of 60
+or more carry over to the next minute, and picks with hour and minute
+earlier than the origin time are given the next day.
+
+Besides the line readers, that return one dataclass per line, there are bulk
+readers (read_lines1, read_lines4) that decode many lines at once into NumPy
+column arrays. Blank numeric fields are returned as NaN, so integer fields
+that can be blank are returned as float arrays.
+
 Created on Fri Aug 21 15:00:48 2020
 
 @author: Antonio Villasenor, ICM-CSIC
 """
 
-from dataclasses import dataclass
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, fields
+from functools import cached_property
+
+import numpy as np
+
+import metrics
+
+LINE_WIDTH = 80
+
+# Version of the tables returned by read_tables. Increase it when the decoding
+# of any column changes, so that tables cached on disk are not reused.
+PARSER_VERSION = 2
+
+class NordicFormatError(ValueError):
+    """
+    Exception raised when a file does not follow SEISAN's Nordic format
+
+    Attributes
+    ----------
+    line_number : int
+        number of the offending line in the file (starting at 1)
+    line : str
+        offending line
+    """
+    def __init__(self, message, line_number=None, line=None):
+        if line_number is not None:
+            message = '{} (line {})'.format(message, line_number)
+        super().__init__(message)
+        self.line_number = line_number
+        self.line = line
 
 @dataclass
 class Hypocenter:
@@ -114,6 +189,155 @@ class Phase_pick:
     distance:           float = None
     azimuth:            int = None
 
+@dataclass
+class Macroseismic:
+    """
+    A data class used to represent the macroseismic information line (format 2)
+    of a SEISAN S-file in Nordic format
+    """
+    description:         str = ''
+    diastrophism:        str = ' '
+    tsunami:             str = ' '
+    seiche:              str = ' '
+    cultural_effects:    str = ' '
+    unusual_events:      str = ' '
+    max_intensity:       int = None
+    intensity_qualifier: str = ' '
+    intensity_scale:     str = '  '
+    latitude:            float = None
+    longitude:           float = None
+    magnitude:           float = None
+    magnitude_type:      str = ' '
+    felt_radius:         float = None
+    area1:               float = None
+    intensity1:          int = None
+    area2:               float = None
+    intensity2:          int = None
+    quality:             str = ' '
+    agency:              str = '   '
+
+@dataclass
+class Comment:
+    """
+    A data class used to represent a comment line (format 3) or an error
+    estimate line of the previous line (format 5), given by line_type
+    """
+    text:               str = ''
+    line_type:          str = '3'
+
+@dataclass
+class ErrorEstimate:
+    """
+    A data class used to represent the hypocenter error line (format E)
+    of a SEISAN S-file in Nordic format
+
+    Attributes
+    ----------
+    gap : int
+        azimuthal gap in degrees
+    time_error : float
+        origin time error in seconds
+    latitude_error, longitude_error, depth_error : float
+        location errors in km
+    covariance_xy, covariance_xz, covariance_yz : float
+        covariances of the location in km^2
+    """
+    gap:                int = None
+    time_error:         float = None
+    latitude_error:     float = None
+    longitude_error:    float = None
+    depth_error:        float = None
+    covariance_xy:      float = None
+    covariance_xz:      float = None
+    covariance_yz:      float = None
+
+@dataclass
+class Waveform:
+    """
+    A data class used to represent a waveform information line (format 6)
+    """
+    file_name:          str = ''
+
+@dataclass
+class Event:
+    """
+    A data class used to represent one event of a file in Nordic format
+
+    Attributes
+    ----------
+    hypocenter : Hypocenter
+        hypocenter line (format 1) of the event
+    high_precision : tuple
+        (seconds, latitude, longitude, depth, rms) from the high-precision
+        hypocenter line (format H), or None if the event does not have one
+    pick_lines : list
+        phase cards (format 4) of the event, as raw bytes
+    lines : list
+        all the lines of the event as raw bytes, including the final blank line
+    offset : int
+        byte offset of the hypocenter line of the event in the file
+    """
+    hypocenter:         Hypocenter = None
+    high_precision:     tuple = None
+    pick_lines:         list = field(default_factory=list)
+    lines:              list = field(default_factory=list)
+    offset:             int = None
+
+    @property
+    def length(self):
+        """! Number of bytes of the event in the file"""
+        return sum(len(line) for line in self.lines)
+
+    @property
+    def event_id(self):
+        """! SEISAN ID (field ID: of the type I line), or None if the event has no ID"""
+        for line in self.lines:
+            if line[79:80] == b'I' and line[57:60] == b'ID:':
+                return line[60:74].decode('latin-1').strip()
+        return None
+
+    @cached_property
+    def picks(self):
+        """! List of Phase_pick dataclasses, decoded on first access"""
+        return [read_line4(line.decode('latin-1')) for line in self.pick_lines]
+
+    def raw_lines(self, line_types):
+        """! Raw lines of the event whose type (column 80) is in line_types (bytes)"""
+        return [line for line in self.lines if line[79:80] and line[79:80] in line_types]
+
+    @property
+    def auxiliary_lines(self):
+        """! Raw lines of types 2, 3, 5, 6 and E of the event"""
+        return self.raw_lines(AUXILIARY_TYPES)
+
+    @cached_property
+    def macroseismic(self):
+        """! List of Macroseismic dataclasses (type 2 lines), decoded on first access"""
+        return [read_line2(line.decode('latin-1')) for line in self.raw_lines(b'2')]
+
+    @cached_property
+    def comments(self):
+        """! List of Comment dataclasses (type 3 and 5 lines), decoded on first access"""
+        return [read_line3(line.decode('latin-1')) for line in self.raw_lines(b'35')]
+
+    @cached_property
+    def error_estimate(self):
+        """! ErrorEstimate dataclass of the type E line, or None, decoded on first access"""
+        lines = self.raw_lines(b'E')
+        return read_lineE(lines[0].decode('latin-1')) if lines else None
+
+    @cached_property
+    def waveforms(self):
+        """! List of Waveform dataclasses (type 6 lines), decoded on first access"""
+        return [read_line6(line.decode('latin-1')) for line in self.raw_lines(b'6')]
+
+    def to_bytes(self):
+        """! The event as it was read, including the final blank line"""
+        return b''.join(self.lines)
+
+# Line types kept as raw lines and decoded on access
+AUXILIARY_TYPES = b'2356E'
+
 def read_line1(line):
     """! Function read_line1
     
@@ -350,3 +574,1200 @@ def read_line4(line):
     direction, apparent_velocity, incidence_angle, direction_residual,
     residual, weight, distance, azimuth)
 
+def _float_field(text):
+    """! Returns a fixed-width field as float, or None if it is blank"""
+    return None if text.isspace() or not text else float(text)
+
+def _int_field(text):
+    """! Returns a fixed-width field as int, or None if it is blank"""
+    return None if text.isspace() or not text else int(text)
+
+def read_line2(line):
+    """! Function read_line2
+
+    @brief Reads a string formatted as a Line 2 (macroseismic information) in SEISAN's Nordic format
+
+    @param[in]   line   string with SEISAN's Nordic macroseismic format (Line 2)
+    @return      Macroseismic dataclass
+    """
+
+    line = line.rstrip('\r\n').ljust(LINE_WIDTH)
+    return Macroseismic(line[5:20].strip(), line[21], line[22], line[23], line[24], line[25],
+                        _int_field(line[27:29]), line[29], line[30:32],
+                        _float_field(line[33:39]), _float_field(line[40:47]),
+                        _float_field(line[48:51]), line[51], _float_field(line[52:56]),
+                        _float_field(line[56:61]), _int_field(line[61:63]),
+                        _float_field(line[63:68]), _int_field(line[68:70]), line[71],
+                        line[72:75])
+
+def read_line3(line):
+    """! Function read_line3
+
+    @brief Reads a string formatted as a Line 3 (comment) or Line 5 in SEISAN's Nordic format
+
+    @param[in]   line   string with a comment line of SEISAN's Nordic format
+    @return      Comment dataclass with the text (trailing blanks removed) and the line type
+    """
+
+    line = line.rstrip('\r\n').ljust(LINE_WIDTH)
+    return Comment(line[1:79].rstrip(), line[79])
+
+def read_lineE(line):
+    """! Function read_lineE
+
+    @brief Reads a string formatted as a Line E (hypocenter errors) in SEISAN's Nordic format
+
+    @param[in]   line   string with SEISAN's Nordic error format (Line E)
+    @return      ErrorEstimate dataclass
+    """
+
+    line = line.rstrip('\r\n').ljust(LINE_WIDTH)
+    return ErrorEstimate(_int_field(line[5:8]), _float_field(line[14:20]),
+                         _float_field(line[24:30]), _float_field(line[32:38]),
+                         _float_field(line[38:43]), _float_field(line[43:55]),
+                         _float_field(line[55:67]), _float_field(line[67:79]))
+
+def read_line6(line):
+    """! Function read_line6
+
+    @brief Reads a string formatted as a Line 6 (waveform file) in SEISAN's Nordic format
+
+    @param[in]   line   string with SEISAN's Nordic waveform format (Line 6)
+    @return      Waveform dataclass
+    """
+
+    return Waveform(line.rstrip('\r\n')[1:79].strip())
+
+def _fixed_width_block(lines):
+    """! Function _fixed_width_block
+
+    @brief Stacks lines into a 2D array of bytes with one row per line
+
+    Line terminators are removed and every line is padded with blanks (or
+    truncated) to LINE_WIDTH characters, so that each field of the Nordic
+    format is a fixed range of columns of the array.
+
+    @param[in]   lines  iterable of str or bytes lines
+    @return      numpy uint8 array of shape (number of lines, LINE_WIDTH)
+    """
+
+    rows = []
+    for line in lines:
+        if isinstance(line, str):
+            line = line.encode('latin-1')
+        rows.append(line.rstrip(b'\r\n')[:LINE_WIDTH].ljust(LINE_WIDTH))
+
+    block = np.frombuffer(b''.join(rows), dtype=np.uint8)
+    return block.reshape(len(rows), LINE_WIDTH)
+
+def _blank(block, start, stop):
+    """! Returns a boolean array that is True where columns start:stop are blank"""
+    return (block[:, start:stop] == ord(' ')).all(axis=1)
+
+def _column(block, start, stop):
+    """! Returns columns start:stop of a block as a fixed-size bytes array"""
+    field = np.ascontiguousarray(block[:, start:stop])
+    return field.view('S{}'.format(stop - start)).ravel()
+
+def _decode_str(block, start, stop):
+    """! Returns columns start:stop of a block as a bytes array (see _decoded)"""
+    return _column(block, start, stop)
+
+def _decoded(columns):
+    """! Converts the bytes columns of a dict of columns to unicode"""
+    return {name: np.char.decode(column, 'latin-1') if column.dtype.kind == 'S' else column
+            for name, column in columns.items()}
+
+def _invalid_field(field, start, stop, convert):
+    """! Returns a ValueError naming the first value of a bytes column that convert rejects"""
+
+    for value in field.tolist():
+        try:
+            convert(value)
+        except ValueError:
+            return ValueError("invalid field '{}' in columns {}-{}"
+                              .format(value.decode('latin-1'), start + 1, stop))
+    return ValueError('invalid field in columns {}-{}'.format(start + 1, stop))
+
+def _decode_int(block, start, stop):
+    """! Returns columns start:stop of a block as int64 (fields cannot be blank)"""
+    field = _column(block, start, stop)
+    try:
+        return field.astype(np.int64)
+    except ValueError:
+        raise _invalid_field(field, start, stop, int) from None
+
+def _decode_float(block, start, stop):
+    """! Returns columns start:stop of a block as float64, with NaN for blank fields"""
+    field = _column(block, start, stop)
+    blank = _blank(block, start, stop)
+    if blank.any():
+        field = np.where(blank, b'nan', field)
+    try:
+        return field.astype(np.float64)
+    except ValueError:
+        raise _invalid_field(field, start, stop, float) from None
+
+def _decode_magnitude(block, start):
+    """! Returns magnitude, magnitude type and agency starting at column start"""
+    mag = _decode_float(block, start, start + 4)
+    blank = np.isnan(mag)
+    mag_type = np.where(blank, b' ', np.char.add(b'M', _decode_str(block, start + 4, start + 5)))
+    mag_agency = np.where(blank, b'   ', _decode_str(block, start + 5, start + 8))
+    return mag, mag_type, mag_agency
+
+def read_lines1(lines):
+    """! Function read_lines1
+
+    @brief Reads many Line 1 (hypocenter) strings of SEISAN's Nordic format at once
+
+    Equivalent to calling read_line1 for every line, but the fixed-width
+    columns are decoded in a single batched pass. Blank numeric fields are NaN.
+
+    @param[in]   lines  iterable of str or bytes with Nordic hypocenter lines (Line 1)
+    @return      dict of numpy arrays, one per Hypocenter field, in the same order
+    """
+
+    return _decoded(_decode_lines1(_fixed_width_block(lines)))
+
+def _decode_lines1(block):
+    """! Decodes a block of hypocenter lines (see read_lines1), with bytes string columns"""
+
+    columns = {
+        'year':               _decode_int(block, 1, 5),
+        'month':              _decode_int(block, 6, 8),
+        'day':                _decode_int(block, 8, 10),
+        'fixed_time':         _decode_str(block, 10, 11),
+        'hour':               _decode_int(block, 11, 13),
+        'minute':             _decode_int(block, 13, 15),
+        'second':             _decode_float(block, 16, 20),
+        'location_model':     _decode_str(block, 20, 21),
+        'distance_indicator': _decode_str(block, 21, 22),
+        'event_type':         _decode_str(block, 22, 23),
+        'latitude':           _decode_float(block, 23, 30),
+        'longitude':          _decode_float(block, 30, 38),
+        'depth':              _decode_float(block, 38, 43),
+        'depth_indicator':    _decode_str(block, 43, 44),
+        'locating_indicator': _decode_str(block, 44, 45),
+        'locating_agency':    _decode_str(block, 45, 48),
+        'num_sta':            _decode_float(block, 48, 51),
+        'rms':                _decode_float(block, 51, 55),
+    }
+
+    for number, start in zip((1, 2, 3), (55, 63, 71)):
+        mag, mag_type, mag_agency = _decode_magnitude(block, start)
+        columns['mag{}'.format(number)] = mag
+        columns['mag_type{}'.format(number)] = mag_type
+        columns['mag_agency{}'.format(number)] = mag_agency
+
+    return {field.name: columns[field.name] for field in fields(Hypocenter)}
+
+def read_lines4(lines):
+    """! Function read_lines4
+
+    @brief Reads many Line 4 (phase card) strings of SEISAN's Nordic format at once
+
+    Equivalent to calling read_line4 for every line, but the fixed-width
+    columns are decoded in a single batched pass. Blank numeric fields are NaN,
+    so integer fields that can be blank (weight_code, hour, minute, duration,
+    direction_residual, weight, azimuth) are returned as float64 arrays.
+
+    @param[in]   lines  iterable of str or bytes with Nordic phase cards (Line 4)
+    @return      dict of numpy arrays, one per Phase_pick field, in the same order
+    """
+
+    return _decoded(_decode_lines4(_fixed_width_block(lines)))
+
+def _decode_lines4(block):
+    """! Decodes a block of phase cards (see read_lines4), with bytes string columns"""
+
+    columns = {
+        'station_name':       np.char.strip(_decode_str(block, 1, 6)),
+        'instrument_type':    _decode_str(block, 6, 7),
+        'component':          _decode_str(block, 7, 8),
+        'onset':              _decode_str(block, 9, 10),
+        'phase':              np.char.rstrip(_decode_str(block, 10, 14)),
+        'weight_code':        _decode_float(block, 14, 15),
+        'pick_mode':          _decode_str(block, 15, 16),
+        'polarity':           _decode_str(block, 16, 17),
+        'hour':               _decode_float(block, 18, 20),
+        'minute':             _decode_float(block, 20, 22),
+        'second':             _decode_float(block, 22, 28),
+        'duration':           _decode_float(block, 29, 33),
+        'amplitude':          _decode_float(block, 33, 40),
+        'period':             _decode_float(block, 41, 45),
+        'direction':          _decode_float(block, 46, 51),
+        'apparent_velocity':  _decode_float(block, 52, 56),
+        'incidence_angle':    _decode_float(block, 56, 60),
+        'direction_residual': _decode_float(block, 60, 63),
+        'residual':           _decode_float(block, 63, 68),
+        'weight':             _decode_float(block, 68, 70),
+        'distance':           _decode_float(block, 70, 75),
+        'azimuth':            _decode_float(block, 76, 79),
+    }
+
+    return {field.name: columns[field.name] for field in fields(Phase_pick)}
+
+def _iter_events(fp, line_number=0, offset=0):
+    """! Function _iter_events
+
+    @brief Splits an iterable of raw lines in Nordic format into events
+
+    @param[in]   fp           iterable of bytes lines (e.g. a file opened in binary mode)
+    @param[in]   line_number  number of lines already read before the first one in fp
+    @param[in]   offset       byte offset in the file of the first line in fp
+    @return      generator of Event dataclasses
+    """
+
+    event = None
+    in_header = False
+
+    for line in fp:
+        line_number += 1
+        line_offset = offset
+        offset += len(line)
+
+        if line.isspace() or not line:
+            if event is not None:
+                event.lines.append(line)
+                yield event
+                event = None
+            continue
+
+        if len(line.rstrip(b'\r\n')) < LINE_WIDTH:
+            raise NordicFormatError('invalid line length', line_number, line)
+
+        line_type = line[79:80]
+
+        if line_type == b'1':
+            if event is not None:
+                print("Ignoring extra hypocenter line for this event")
+            else:
+                in_header = True
+                try:
+                    hypocenter = read_line1(line.rstrip(b'\r\n').decode('latin-1') + '\n')
+                except ValueError as error:
+                    raise NordicFormatError(str(error), line_number, line) from None
+                event = Event(hypocenter, offset=line_offset)
+
+        elif event is None:
+            if line_type == b'H':
+                raise NordicFormatError('high precision hypocenter line before event line',
+                                        line_number, line)
+            if line_type in (b' ', b'4') and len(line.strip()) > 5:
+                raise NordicFormatError('badly placed phase card', line_number, line)
+            continue
+
+        elif line_type == b'H':
+            try:
+                event.high_precision = read_lineH(line.decode('latin-1'))
+            except ValueError as error:
+                raise NordicFormatError(str(error), line_number, line) from None
+
+        elif line_type == b'7':
+            in_header = False
+
+        elif line_type in (b' ', b'4') and len(line.strip()) > 5:
+            if in_header:
+                raise NordicFormatError('badly placed phase card', line_number, line)
+            event.pick_lines.append(line)
+
+        event.lines.append(line)
+
+    if event is not None:
+        yield event
+
+def iter_events(nordic_file, line_number=0, offset=0):
+    """! Function iter_events
+
+    @brief Reads a file in Nordic format one event at a time
+
+    Only one event is held in memory at any time, so files of any size can be
+    processed. Lines outside an event that are not phase cards are ignored.
+
+    @param[in]   nordic_file   name of the file in Nordic format, or an iterable of
+                               bytes lines (e.g. the raw lines of some events, or a
+                               part of a file read into memory)
+    @param[in]   line_number   number of lines before the first one (for the line
+                               numbers of the errors when reading lines)
+    @param[in]   offset        byte offset in the file of the first line (for
+                               Event.offset when reading lines)
+    @return      generator of Event dataclasses
+    @exception   NordicFormatError if a line is too short or a phase card is
+                 outside an event or before the phase card header (line 7)
+    """
+
+    if not isinstance(nordic_file, (str, os.PathLike)):
+        yield from _iter_events(nordic_file, line_number, offset)
+        return
+
+    with open(nordic_file, 'rb', buffering=1 << 20) as fp:
+        if offset:
+            fp.seek(offset)
+        yield from _iter_events(fp, line_number, offset)
+
+def write_events(events, output):
+    """! Function write_events
+
+    @brief Writes events in Nordic format from their raw lines
+
+    Events are written exactly as they were read (see Event.to_bytes), with
+    all their auxiliary lines, so reading a file with iter_events and
+    writing all its events gives back the same bytes apart from the lines
+    outside events.
+
+    @param[in]   events   iterable of Event dataclasses
+    @param[in]   output   name of the output file, or a binary file object
+    @return      number of events written
+    """
+
+    if isinstance(output, (str, os.PathLike)):
+        with open(output, 'wb', buffering=1 << 20) as fp:
+            return write_events(events, fp)
+
+    num_events = 0
+    for event in events:
+        output.writelines(event.lines)
+        num_events += 1
+    return num_events
+
+class RowView:
+    """
+    Lightweight view of one row of a HypocenterTable or PickTable
+
+    Fields are read as attributes (e.g. row.station_name), with the same
+    values as in the Hypocenter and Phase_pick dataclasses (None for blank
+    numeric fields).
+    """
+    __slots__ = ('_table', '_row')
+
+    def __init__(self, table, row):
+        self._table = table
+        self._row = row
+
+    def __getattr__(self, name):
+        try:
+            return self._table.value(name, self._row)
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def to_dataclass(self):
+        """! Returns the row as a Hypocenter or Phase_pick dataclass"""
+        return self._table.dataclass(*(self._table.value(field.name, self._row)
+                                       for field in fields(self._table.dataclass)))
+
+    def __repr__(self):
+        values = ', '.join('{}={!r}'.format(name, self._table.value(name, self._row))
+                           for name in self._table.names)
+        return '{}({})'.format(type(self).__name__, values)
+
+class _Table:
+    """
+    Base class of the array-backed tables of hypocenters and picks
+
+    Numeric columns are typed numpy arrays (NaN for blank fields). String
+    columns are interned: they are stored as int32 codes into an array of
+    unique values (categories). Columns are read as table[name], which
+    decodes string columns, and rows as table[i], that returns a RowView.
+    """
+
+    dataclass = None
+    dtypes = {}
+
+    def __init__(self, columns, categories=None):
+        """! Builds a table from a dict of columns
+
+        @param[in]   columns      dict of numpy arrays. String columns are either
+                                  arrays of str, arrays of bytes (decoded as latin-1) or,
+                                  if given in categories, int32 codes
+        @param[in]   categories   dict from string column name to its unique values
+        """
+
+        self.names = list(columns)
+        self.columns = {}
+        self.categories = {}
+        for name, column in columns.items():
+            if categories is not None and name in categories:
+                self.columns[name] = np.asarray(column, dtype=np.int32)
+                self.categories[name] = np.asarray(categories[name])
+            elif np.asarray(column).dtype.kind in 'US':
+                # Bytes columns are interned before decoding, so that only
+                # the unique values are decoded
+                uniques, codes = np.unique(column, return_inverse=True)
+                if uniques.dtype.kind == 'S':
+                    uniques = np.char.decode(uniques, 'latin-1')
+                self.categories[name] = uniques
+                self.columns[name] = codes.astype(np.int32).reshape(-1)
+            else:
+                self.columns[name] = np.asarray(column, dtype=self.dtypes.get(name))
+
+    def __len__(self):
+        return len(self.columns[self.names[0]]) if self.names else 0
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            if key in self.categories:
+                return self.categories[key][self.columns[key]]
+            return self.columns[key]
+        return RowView(self, key)
+
+    def __iter__(self):
+        return (RowView(self, row) for row in range(len(self)))
+
+    def keys(self):
+        return list(self.names)
+
+    def items(self):
+        return ((name, self[name]) for name in self.names)
+
+    def codes(self, name):
+        """! Returns the int32 codes of a string column"""
+        return self.columns[name]
+
+    def value(self, name, row):
+        """! Returns the value of a field in a row (None for blank numeric fields)"""
+
+        if name in self.categories:
+            return str(self.categories[name][self.columns[name][row]])
+        value = self.columns[name][row].item()
+        if isinstance(value, float) and value != value:
+            return None
+        if isinstance(value, float) and self.dtypes.get(name) == np.float32:
+            return int(value)
+        return value
+
+    def take(self, rows):
+        """! Returns a new table with some rows (array of positions or boolean mask)"""
+        return type(self)({name: column[rows] for name, column in self.columns.items()},
+                          self.categories)
+
+    @classmethod
+    def concatenate(cls, tables):
+        """! Joins tables with the same columns, merging the categories of string columns"""
+
+        tables = list(tables)
+        columns = {}
+        categories = {}
+        for name in tables[0].names:
+            if name in tables[0].categories:
+                categories[name] = np.unique(np.concatenate([t.categories[name] for t in tables]))
+                columns[name] = np.concatenate(
+                    [np.searchsorted(categories[name], t.categories[name])[t.columns[name]]
+                     for t in tables])
+            else:
+                columns[name] = np.concatenate([t.columns[name] for t in tables])
+        return cls(columns, categories)
+
+    def to_pandas(self):
+        """! Returns a DataFrame, with categorical columns for the string columns"""
+
+        import pandas as pd
+
+        data = {}
+        for name in self.names:
+            if name in self.categories:
+                data[name] = pd.Categorical.from_codes(self.columns[name], self.categories[name])
+            else:
+                data[name] = self.columns[name]
+        return pd.DataFrame(data, copy=False)
+
+    def to_arrow(self):
+        """! Returns an Arrow table, with dictionary columns for the string columns"""
+
+        import pyarrow as pa
+
+        arrays = []
+        for name in self.names:
+            if name in self.categories:
+                arrays.append(pa.DictionaryArray.from_arrays(self.columns[name],
+                                                             self.categories[name].astype(str)))
+            else:
+                arrays.append(pa.array(self.columns[name]))
+        return pa.Table.from_arrays(arrays, names=self.names)
+
+    @classmethod
+    def from_arrow(cls, table):
+        """! Builds a table from an Arrow table written by to_arrow"""
+
+        import pyarrow as pa
+
+        columns = {}
+        categories = {}
+        for name in table.column_names:
+            column = table.column(name).combine_chunks()
+            if pa.types.is_dictionary(column.type):
+                columns[name] = column.indices.to_numpy()
+                categories[name] = column.dictionary.to_numpy(zero_copy_only=False).astype(str)
+            else:
+                columns[name] = column.to_numpy()
+        return cls(columns, categories)
+
+    def __repr__(self):
+        return '{}({} rows)'.format(type(self).__name__, len(self))
+
+class HypocenterTable(_Table):
+    """
+    Array-backed table of hypocenters, with the fields of the Hypocenter dataclass
+    """
+    dataclass = Hypocenter
+    dtypes = {'num_sta': np.float32}
+
+class PickTable(_Table):
+    """
+    Array-backed table of picks, with the fields of the Phase_pick dataclass and
+    an 'event' column with the row of the event of each pick in its HypocenterTable
+
+    Integer fields that can be blank are float32 (exact for these small integers).
+    """
+    dataclass = Phase_pick
+    dtypes = {name: np.float32 for name in ('weight_code', 'hour', 'minute', 'duration',
+                                            'direction_residual', 'weight', 'azimuth')}
+    dtypes['event'] = np.int64
+
+def tables_from_events(events):
+    """! Function tables_from_events
+
+    @brief Decodes the hypocenter and phase lines of a sequence of events in bulk
+
+    @param[in]   events       iterable of Event dataclasses
+    @return      (HypocenterTable, PickTable)
+    """
+
+    hypocenter_lines = []
+    pick_lines = []
+    num_picks = []
+    with metrics.stage('split') as record:
+        for event in events:
+            hypocenter_lines.append(event.lines[0])
+            pick_lines.extend(event.pick_lines)
+            num_picks.append(len(event.pick_lines))
+        record.add(events=len(hypocenter_lines), picks=len(pick_lines))
+
+    with metrics.stage('decode') as record:
+        hypocenters = _decode_lines1(_fixed_width_block(hypocenter_lines))
+        picks = _decode_lines4(_fixed_width_block(pick_lines))
+        picks['event'] = np.repeat(np.arange(len(num_picks), dtype=np.int64), num_picks)
+        record.add(events=len(hypocenter_lines), picks=len(pick_lines))
+
+    return HypocenterTable(hypocenters), PickTable(picks)
+
+def read_tables(nordic_file):
+    """! Function read_tables
+
+    @brief Reads all the hypocenters and phase cards of a file in Nordic format
+
+    @param[in]   nordic_file   name of the file in Nordic format
+    @return      (HypocenterTable, PickTable), with the columns of read_lines1
+                 and read_lines4. The picks have an additional 'event' column
+                 with the row of their event in the hypocenters
+    """
+
+    return tables_from_events(iter_events(nordic_file))
+
+def iter_tables(nordic_file, chunk_size=100000):
+    """! Function iter_tables
+
+    @brief Reads a file in Nordic format in chunks of hypocenter and pick tables
+
+    Each chunk contains whole events, and is emitted as soon as it holds at
+    least chunk_size picks, so memory depends on chunk_size and not on the
+    size of the file. The 'event' column of the picks refers to the rows of the
+    hypocenters of the same chunk.
+
+    @param[in]   nordic_file   name of the file in Nordic format
+    @param[in]   chunk_size    minimum number of picks per chunk (the last one can be smaller)
+    @return      generator of (hypocenters, picks) as returned by read_tables
+    """
+
+    events = []
+    num_picks = 0
+    for event in iter_events(nordic_file):
+        events.append(event)
+        num_picks += len(event.pick_lines)
+        if num_picks >= chunk_size:
+            yield tables_from_events(events)
+            events = []
+            num_picks = 0
+
+    if events:
+        yield tables_from_events(events)
+
+def _iter_blocks(fp, line_number=0, offset=0):
+    """! Function _iter_blocks
+
+    @brief Splits an iterable of raw lines into blocks that end at a blank line
+
+    @param[in]   fp           iterable of bytes lines
+    @param[in]   line_number  number of lines already read before the first one in fp
+    @param[in]   offset       byte offset in the file of the first line in fp
+    @return      generator of (lines, line number of the first line, byte offset of the
+                 first line, byte offset after the last line)
+    """
+
+    lines = []
+    first_line = line_number + 1
+    first_offset = offset
+    for line in fp:
+        lines.append(line)
+        line_number += 1
+        offset += len(line)
+        if line.isspace():
+            yield lines, first_line, first_offset, offset
+            lines = []
+            first_line = line_number + 1
+            first_offset = offset
+    if lines:
+        yield lines, first_line, first_offset, offset
+
+def iter_raw_events(fp):
+    """! Function iter_raw_events
+
+    @brief Splits a stream of raw lines in events, without decoding them
+
+    An event is made of the lines up to and including the next blank line
+    (see _iter_blocks). Groups of lines that do not start with a hypocenter
+    line (type 1) are not events and are skipped.
+
+    @param[in]   fp   iterable of bytes lines (e.g. a file opened in binary mode)
+    @return      generator of lists of bytes lines
+    """
+
+    for lines, first_line, first_offset, offset in _iter_blocks(fp):
+        if lines[0][79:80] == b'1':
+            yield lines
+
+def decode_error(event, line_number):
+    """! Function decode_error
+
+    @brief Finds the line of an event that the bulk decoders cannot decode
+
+    @param[in]   event         Event that tables_from_events cannot decode
+    @param[in]   line_number   line number of the first line of the event
+    @return      NordicFormatError with the reason and the line number of the failing line
+    """
+
+    picks = iter(event.pick_lines)
+    next_pick = next(picks, None)
+    for index, line in enumerate(event.lines):
+        if index == 0:
+            decode = _decode_lines1
+        elif line is next_pick:
+            decode = _decode_lines4
+            next_pick = next(picks, None)
+        else:
+            continue
+        try:
+            decode(_fixed_width_block([line]))
+        except ValueError as error:
+            return NordicFormatError(str(error), line_number + index, line)
+    return NordicFormatError('event cannot be decoded', line_number, event.lines[0])
+
+def iter_tables_tolerant(nordic_file, chunk_size=100000, reject=None, offset=0, line_number=0):
+    """! Function iter_tables_tolerant
+
+    @brief Reads a file in Nordic format in chunks of tables, skipping malformed events
+
+    Like iter_tables, but an event that raises NordicFormatError or that
+    cannot be decoded (ValueError) is passed to reject and left out of the
+    tables instead of stopping the conversion. The reason given to reject
+    names the invalid field, and the line number is that of the failing
+    line. Each chunk also gives the
+    position in the file after its last event, so that reading can be
+    resumed from there with offset and line_number.
+
+    @param[in]   nordic_file   name of the file in Nordic format
+    @param[in]   chunk_size    minimum number of picks per chunk (the last one can be smaller)
+    @param[in]   reject        function called as reject(lines, line_number, reason) with the
+                               raw lines of every rejected event, or None
+    @param[in]   offset        byte offset where reading starts (start of a line outside an
+                               event, e.g. the offset returned with a previous chunk)
+    @param[in]   line_number   number of lines before offset
+    @return      generator of (hypocenters, picks, offset, line_number), with the tables
+                 as returned by read_tables and the byte offset and number of lines read
+                 after the chunk
+    """
+
+    def rejected(lines, line_number, error):
+        if reject is not None:
+            reason = str(error)
+            if isinstance(error, NordicFormatError) and error.line_number is not None:
+                reason, line_number = reason.rsplit(' (line', 1)[0], error.line_number
+            reject(lines, line_number, reason)
+
+    def tables(events):
+        try:
+            return tables_from_events([event for event, first_line in events])
+        except ValueError:
+            pass
+        # Decode the events one by one to find the ones that fail
+        kept = []
+        for event, first_line in events:
+            try:
+                tables_from_events([event])
+                kept.append(event)
+            except ValueError:
+                rejected(event.lines, first_line, decode_error(event, first_line))
+        return tables_from_events(kept)
+
+    events = []
+    num_picks = 0
+    with open(nordic_file, 'rb', buffering=1 << 20) as fp:
+        fp.seek(offset)
+        for lines, first_line, first_offset, offset in _iter_blocks(fp, line_number, offset):
+            line_number = first_line + len(lines) - 1
+            try:
+                block = list(_iter_events(lines, first_line - 1, first_offset))
+            except (NordicFormatError, ValueError) as error:
+                rejected(lines, first_line, error)
+                continue
+            for event in block:
+                # Line number of the event, after any lines of the block outside it
+                event_line, position = first_line, first_offset
+                for line in lines:
+                    if position >= event.offset:
+                        break
+                    event_line += 1
+                    position += len(line)
+                events.append((event, event_line))
+                num_picks += len(event.pick_lines)
+            if num_picks >= chunk_size:
+                yield tables(events) + (offset, line_number)
+                events = []
+                num_picks = 0
+
+    if events:
+        yield tables(events) + (offset, line_number)
+
+def concatenate_tables(tables):
+    """! Function concatenate_tables
+
+    @brief Joins (hypocenters, picks) tables, renumbering the event index of the picks
+
+    @param[in]   tables   sequence of (hypocenters, picks) as returned by read_tables
+    @return      (hypocenters, picks) with the rows of all the tables, in order
+    """
+
+    tables = list(tables)
+    if not tables:
+        return tables_from_events([])
+
+    num_events = [len(hypocenters) for hypocenters, picks in tables]
+    first_event = np.cumsum([0] + num_events[:-1])
+
+    hypocenters = HypocenterTable.concatenate(h for h, p in tables)
+    picks = PickTable.concatenate(p for h, p in tables)
+    picks.columns['event'] = np.concatenate([p['event'] + first
+                                             for (h, p), first in zip(tables, first_event)])
+
+    return hypocenters, picks
+
+def sort_tables(hypocenters, picks):
+    """! Function sort_tables
+
+    @brief Sorts (hypocenters, picks) tables by origin time, keeping the picks of each event in order
+
+    @param[in]   hypocenters   HypocenterTable
+    @param[in]   picks         PickTable, with the 'event' column of read_tables
+    @return      (hypocenters, picks) sorted by origin time (stable)
+    """
+
+    time = origin_times(hypocenters['year'], hypocenters['month'], hypocenters['day'],
+                        hypocenters['hour'], hypocenters['minute'], hypocenters['second'])
+    order = np.argsort(time, kind='stable')
+    new_row = np.empty_like(order)
+    new_row[order] = np.arange(len(order))
+
+    event = new_row[picks['event']]
+    pick_order = np.argsort(event, kind='stable')
+    picks = picks.take(pick_order)
+    picks.columns['event'] = event[pick_order].astype(np.int64)
+
+    return hypocenters.take(order), picks
+
+def event_boundaries(nordic_file, num_chunks):
+    """! Function event_boundaries
+
+    @brief Finds byte offsets that split a Nordic file in about num_chunks ranges
+
+    Every offset, except the first and last, is the start of the line that
+    follows a blank line, so that each range contains only whole events.
+
+    @param[in]   nordic_file   name of the file in Nordic format
+    @param[in]   num_chunks    number of ranges wanted
+    @return      sorted list of offsets, starting at 0 and ending at the file size
+    """
+
+    size = os.path.getsize(nordic_file)
+    offsets = [0]
+
+    with open(nordic_file, 'rb') as fp:
+        for chunk in range(1, num_chunks):
+            target = size * chunk // num_chunks
+            if target <= offsets[-1]:
+                continue
+            fp.seek(target - 1)
+            fp.readline()           # skip to the start of the next line
+            while True:
+                line = fp.readline()
+                if not line or line.isspace():
+                    break
+            offset = fp.tell()
+            if offsets[-1] < offset < size:
+                offsets.append(offset)
+
+    offsets.append(size)
+    return offsets
+
+def _read_tables_range(nordic_file, start, stop):
+    """! Reads the tables of the events between byte offsets start and stop of a file"""
+
+    with open(nordic_file, 'rb') as fp:
+        fp.seek(start)
+        data = fp.read(stop - start)
+
+    try:
+        return tables_from_events(_iter_events(data.splitlines(keepends=True), offset=start))
+    except NordicFormatError as error:
+        with open(nordic_file, 'rb') as fp:
+            lines_before = fp.read(start).count(b'\n')
+        message = str(error).rsplit(' (line', 1)[0]
+        raise NordicFormatError(message, lines_before + error.line_number, error.line) from None
+
+def read_tables_parallel(nordic_file, workers=None, chunk_bytes=64 << 20, use_mmap=False):
+    """! Function read_tables_parallel
+
+    @brief Reads all the hypocenters and phase cards of a Nordic file with several processes
+
+    The file is split in ranges of about chunk_bytes bytes at blank lines
+    between events, the ranges are decoded in a process pool and the tables
+    are joined in file order, so the result is identical to read_tables.
+
+    @param[in]   nordic_file   name of the file in Nordic format
+    @param[in]   workers       number of processes (default: number of CPUs)
+    @param[in]   chunk_bytes   approximate size of the ranges given to each task
+    @param[in]   use_mmap      read the ranges with iter_tables_mmap, so that all the
+                               processes share the pages of one memory map of the file
+    @return      (hypocenters, picks) as returned by read_tables
+    """
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    size = os.path.getsize(nordic_file)
+    num_chunks = max(workers, -(-size // chunk_bytes))
+    offsets = event_boundaries(nordic_file, num_chunks)
+
+    if workers == 1 or len(offsets) <= 2:
+        return read_tables_mmap(nordic_file) if use_mmap else read_tables(nordic_file)
+
+    reader = _read_tables_mmap_range if use_mmap else _read_tables_range
+    with ProcessPoolExecutor(workers) as executor:
+        tables = executor.map(reader, [nordic_file] * (len(offsets) - 1),
+                              offsets[:-1], offsets[1:])
+        return concatenate_tables(tables)
+
+def _nonspace(data):
+    """! Returns a boolean array that is True where the bytes of data are not whitespace
+
+    Whitespace is what bytes.isspace() considers whitespace: blank, and tab to
+    carriage return (9 to 13). Only comparisons are used, as indexing a lookup
+    table with the bytes would convert them to intp (8 bytes per input byte).
+    """
+    nonspace = (data - np.uint8(9)) > 4
+    nonspace &= data != ord(' ')
+    return nonspace
+
+def _gather_block(buffer, starts):
+    """! Copies LINE_WIDTH bytes from each of the offsets starts of buffer into a 2D block
+
+    The rows are taken from a sliding-window view of the buffer, so the only
+    temporary is the index of the rows.
+    """
+    if len(starts) == 0:
+        return np.empty((0, LINE_WIDTH), dtype=np.uint8)
+    return np.lib.stride_tricks.sliding_window_view(buffer, LINE_WIDTH)[starts]
+
+def _strip_lengths(buffer, starts, ends):
+    """! Returns len(line.strip()) of the lines buffer[starts:ends] of at least LINE_WIDTH bytes"""
+
+    nonspace = _nonspace(_gather_block(buffer, starts))
+    found = nonspace.any(axis=1)
+    first = nonspace.argmax(axis=1)
+    last = LINE_WIDTH - 1 - nonspace[:, ::-1].argmax(axis=1)
+    lengths = np.where(found, last - first + 1, 0)
+
+    # Lines longer than LINE_WIDTH are rare, and are measured one by one
+    for row in np.flatnonzero(ends - starts > LINE_WIDTH):
+        lengths[row] = len(bytes(buffer[starts[row]:ends[row]]).strip())
+
+    return lengths
+
+def _line_bounds(buffer, start, stop, at_end):
+    """! Function _line_bounds
+
+    @brief Splits a range of a buffer in lines, ending at the last blank line
+
+    @param[in]   buffer        numpy uint8 array with the bytes of the file
+    @param[in]   start, stop   range of buffer, start being the start of a line
+    @param[in]   at_end        True if stop is the end of the file, so that the
+                               range ends at its last line and not at a blank line
+    @return      (starts, stops, blank): offsets of the first byte and after the
+                 last byte of each line, and whether the line is blank. The
+                 arrays are empty if the range has no blank line
+    """
+
+    window = buffer[start:stop]
+    stops = np.flatnonzero(window == ord('\n')) + (start + 1)
+    if at_end and (len(stops) == 0 or stops[-1] < stop):
+        stops = np.append(stops, stop)
+    if len(stops) == 0:
+        return stops, stops, np.zeros(0, dtype=bool)
+    starts = np.empty_like(stops)
+    starts[:1] = start
+    starts[1:] = stops[:-1]
+
+    # Every line has at least one byte, so each reduceat segment is the whole line
+    blank = ~np.logical_or.reduceat(_nonspace(window[:stops[-1] - start]), starts - start)
+
+    if not at_end:
+        blank_rows = np.flatnonzero(blank)
+        end = blank_rows[-1] + 1 if len(blank_rows) else 0
+        starts, stops, blank = starts[:end], stops[:end], blank[:end]
+
+    return starts, stops, blank
+
+def _scan_window(buffer, starts, stops, blank, line_number):
+    """! Function _scan_window
+
+    @brief Finds the hypocenter lines and phase cards of a range of lines of a buffer
+
+    This is the state machine of _iter_events written with array operations,
+    and raises the same errors. The range must not end inside an event, that
+    is, its last line must be blank or the last line of the file.
+
+    @param[in]   buffer        numpy uint8 array with the bytes of the file
+    @param[in]   starts, stops, blank   lines of the range, as returned by _line_bounds
+    @param[in]   line_number   number of lines of the file before the first line
+    @return      (offsets of the hypocenter lines, offsets of the phase cards,
+                  row in the hypocenters of the event of each phase card)
+    """
+
+    num_lines = len(starts)
+    rows = np.arange(num_lines)
+
+    ends = stops.copy()
+    for terminator in (ord('\n'), ord('\r')):
+        nonempty = ends > starts
+        ends[nonempty] -= buffer[ends[nonempty] - 1] == terminator
+
+    short = ~blank & (ends - starts < LINE_WIDTH)
+    line_type = np.zeros(num_lines, dtype=np.uint8)
+    valid = ~blank & ~short
+    line_type[valid] = buffer[starts[valid] + LINE_WIDTH - 1]
+
+    # Events start at the first hypocenter line after a blank line
+
+    segment = np.cumsum(blank) - blank
+    hypocenter_rows = np.flatnonzero(line_type == ord('1'))
+    first = np.ones(len(hypocenter_rows), dtype=bool)
+    first[1:] = segment[hypocenter_rows[1:]] != segment[hypocenter_rows[:-1]]
+    event_rows = hypocenter_rows[first]
+    event_segments = segment[event_rows]
+
+    event_start = np.full(segment[-1] + 1, num_lines)
+    event_start[event_segments] = event_rows
+    line_event_start = event_start[segment]
+    in_event = rows >= line_event_start
+
+    # Phase cards, and lines before the phase header (type 7) of their event
+
+    candidates = np.flatnonzero((line_type == ord(' ')) | (line_type == ord('4')))
+    phase_card = np.zeros(num_lines, dtype=bool)
+    phase_card[candidates] = _strip_lengths(buffer, starts[candidates], ends[candidates]) > 5
+
+    headers = np.zeros(num_lines + 1, dtype=np.int64)
+    np.cumsum(in_event & (line_type == ord('7')), out=headers[1:])
+    in_header = headers[rows + 1] == headers[np.minimum(line_event_start, num_lines)]
+
+    errors = [
+        (short, 'invalid line length'),
+        (~in_event & (line_type == ord('H')), 'high precision hypocenter line before event line'),
+        (phase_card & (~in_event | in_header), 'badly placed phase card'),
+    ]
+    error_row, error_message = num_lines, None
+    for mask, message in errors:
+        mask_rows = np.flatnonzero(mask)
+        if len(mask_rows) and mask_rows[0] < error_row:
+            error_row, error_message = mask_rows[0], message
+
+    extra_rows = hypocenter_rows[~first]
+    for row in extra_rows[extra_rows < error_row]:
+        print("Ignoring extra hypocenter line for this event")
+
+    if error_message is not None:
+        line = bytes(buffer[starts[error_row]:stops[error_row]])
+        raise NordicFormatError(error_message, line_number + error_row + 1, line)
+
+    pick_rows = np.flatnonzero(phase_card)
+    pick_event = np.searchsorted(event_segments, segment[pick_rows])
+
+    return starts[event_rows], starts[pick_rows], pick_event.astype(np.int64)
+
+def iter_tables_mmap(nordic_file, start=0, stop=None, window_bytes=8 << 20):
+    """! Function iter_tables_mmap
+
+    @brief Reads a Nordic file through a memory map, in windows of whole events
+
+    The file is memory-mapped and scanned in windows of about window_bytes
+    bytes that end at blank lines. Line boundaries are the newlines of the
+    window (numpy.flatnonzero on the map), and blank lines and line types are
+    found from them with one boolean per byte of the window. The hypocenter
+    lines and phase cards are then copied once out of the map, into the
+    blocks their fixed-width fields are decoded from, so no line is ever
+    turned into a Python object. The pages of the map are shared with every
+    other process reading the same file, and memory apart from the tables
+    depends only on window_bytes (a few times window_bytes at most).
+
+    @param[in]   nordic_file    name of the file in Nordic format
+    @param[in]   start, stop    byte range to read: start must be the start of a line
+                                outside an event and stop the end of the file or of
+                                a blank line
+    @param[in]   window_bytes   approximate number of bytes scanned at once
+    @return      generator of (hypocenters, picks) as returned by read_tables, one
+                 per window, with the event indices local to each window
+    """
+
+    import mmap
+
+    stop = os.path.getsize(nordic_file) if stop is None else stop
+    if start >= stop:
+        return
+
+    # The map is not closed explicitly: it is released with the last array
+    # that refers to it, which can outlive this generator (e.g. in a traceback)
+    with open(nordic_file, 'rb') as fp:
+        buffer = np.frombuffer(mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ),
+                               dtype=np.uint8)
+
+    lines_read = 0
+    position = start
+    window = window_bytes
+    while position < stop:
+        window_stop = min(position + window, stop)
+        starts, stops, blank = _line_bounds(buffer, position, window_stop, window_stop == stop)
+        if len(starts) == 0:
+            window *= 2      # an event larger than the window
+            continue
+
+        try:
+            with metrics.stage('scan') as record:
+                event_starts, pick_starts, pick_event = _scan_window(buffer, starts, stops,
+                                                                     blank, lines_read)
+                record.add(bytes=int(stops[-1]) - position)
+        except NordicFormatError as error:
+            if start == 0:
+                raise
+            lines_before = np.count_nonzero(buffer[:start] == ord('\n'))
+            message = str(error).rsplit(' (line', 1)[0]
+            raise NordicFormatError(message, lines_before + error.line_number,
+                                    error.line) from None
+
+        with metrics.stage('decode') as record:
+            hypocenters = _decode_lines1(_gather_block(buffer, event_starts))
+            picks = _decode_lines4(_gather_block(buffer, pick_starts))
+            picks['event'] = pick_event
+            record.add(events=len(event_starts), picks=len(pick_starts))
+        yield HypocenterTable(hypocenters), PickTable(picks)
+
+        lines_read += len(starts)
+        position = int(stops[-1])
+        window = window_bytes
+
+def read_tables_mmap(nordic_file, window_bytes=8 << 20):
+    """! Function read_tables_mmap
+
+    @brief Reads all the hypocenters and phase cards of a Nordic file through a memory map
+
+    @param[in]   nordic_file    name of the file in Nordic format
+    @param[in]   window_bytes   approximate number of bytes scanned at once
+    @return      (hypocenters, picks) as returned by read_tables
+    """
+
+    return concatenate_tables(iter_tables_mmap(nordic_file, window_bytes=window_bytes))
+
+def _read_tables_mmap_range(nordic_file, start, stop):
+    """! Reads the tables of the events between byte offsets start and stop through a memory map"""
+    return concatenate_tables(iter_tables_mmap(nordic_file, start, stop))
+
+_NS_PER_SECOND = 1000000000
+
+def _dates(year, month, day):
+    """! Returns datetime64[D] dates from arrays of year, month and day"""
+
+    year = np.asarray(year, dtype=np.int64)
+    month = np.asarray(month, dtype=np.int64)
+    day = np.asarray(day, dtype=np.int64)
+    return (((year - 1970).astype('datetime64[Y]') + (month - 1).astype('timedelta64[M]'))
+            .astype('datetime64[D]') + (day - 1).astype('timedelta64[D]'))
+
+def _times_of_day(date, hour, minute, second):
+    """! Adds hour, minute and second to dates, with NaT where any of them is NaN"""
+
+    hour = np.asarray(hour, dtype=np.float64)
+    minute = np.asarray(minute, dtype=np.float64)
+    second = np.asarray(second, dtype=np.float64)
+    blank = np.isnan(hour) | np.isnan(minute) | np.isnan(second)
+
+    nanoseconds = ((np.nan_to_num(hour).astype(np.int64) * 3600 +
+                    np.nan_to_num(minute).astype(np.int64) * 60) * _NS_PER_SECOND +
+                   np.round(np.nan_to_num(second) * _NS_PER_SECOND).astype(np.int64))
+
+    times = date.astype('datetime64[ns]') + nanoseconds.astype('timedelta64[ns]')
+    times[blank] = np.datetime64('NaT')
+    return times
+
+def origin_times(year, month, day, hour, minute, second):
+    """! Function origin_times
+
+    @brief Builds datetime64[ns] times from arrays of date and time fields
+
+    Seconds (and minutes) beyond their range carry over, so that a second of
+    60.0 is the first second of the next minute.
+
+    @param[in]   year, month, day, hour, minute, second   arrays of equal length
+                 (e.g. columns of the hypocenters returned by read_tables)
+    @return      datetime64[ns] array, NaT where hour, minute or second are NaN
+    """
+
+    return _times_of_day(_dates(year, month, day), hour, minute, second)
+
+def pick_times(hypocenters, picks):
+    """! Function pick_times
+
+    @brief Builds the datetime64[ns] times of all the picks of a table
+
+    Phase cards only have hour, minute and second, so the date is taken from
+    the hypocenter of the event. Picks whose hour and minute are more than
+    12 hours earlier than those of the origin time happened after midnight,
+    and are moved to the next day; picks slightly earlier than the origin
+    stay on its day, with a negative travel time. Hours of 24 or more also
+    give the next day.
+
+    @param[in]   hypocenters   HypocenterTable (or dict of hypocenter columns)
+    @param[in]   picks         PickTable (or dict of pick columns)
+    @return      datetime64[ns] array with one element per pick (NaT for blank times)
+    """
+
+    event = picks['event']
+    date = _dates(hypocenters['year'][event], hypocenters['month'][event],
+                  hypocenters['day'][event])
+
+    origin_minute = hypocenters['hour'][event] * 60 + hypocenters['minute'][event]
+    with np.errstate(invalid='ignore'):
+        after_midnight = picks['hour'] * 60 + picks['minute'] < origin_minute - 720
+    date = date + after_midnight.astype('timedelta64[D]')
+
+    return _times_of_day(date, picks['hour'], picks['minute'], picks['second'])
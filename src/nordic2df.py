@@ -2,112 +2,326 @@
 # -*- coding: utf-8 -*-
 """! Converts a file in nordic format to a dataframe with all the seismic phases
 
+The columns of all the picks are decoded in bulk and the dataframe is built
+once, instead of concatenating one dataframe per pick. With --chunk-size the
+picks are written to the Feather file as Arrow record batches of that size,
+so catalogs larger than memory can be converted. With --workers the file is
+decoded by several processes, and with --mmap it is read through a memory
+map shared by all of them (see nordic.read_tables_mmap). With --stations the
+epicentral distance, azimuth and back-azimuth of every pick are recomputed
+from the coordinates of its station at the time of the pick (see
+stations.StationInventory), and picks whose stored distance disagrees or
+that are outside the operating period of their station are flagged.
+
+With --rejects, events that cannot be read are written to the rejects file
+with the reason and line number and the conversion goes on; a checkpoint is
+saved after every chunk, and --resume continues an interrupted conversion
+(see convert_tolerant).
 
 Created on Sat Aug 22 17:11:22 2020
 
 @author: Antonio Villaseñor, ICM-CSIC
 """
 
+import os
 import sys
-from datetime import datetime
-import math
+import argparse
 import pandas as pd
-from obspy.geodetics import gps2dist_azimuth
-
-import cartopy.crs as ccrs
-import matplotlib.pyplot as plt
-import seaborn as sns
-import pyarrow.feather as feather
 
 import nordic
+import metrics
+import stations
+
+column_names = ['station', 'phase', 'pick', 'residual', 'distance', 'azimuth', 'ot', 'latitude', 'longitude', 'depth']
 
-if len(sys.argv) < 2:
-    print("Usage: station_stats.py nordic_file")
-    sys.exit()
+def phase_dataframe(hypocenters, picks):
+    """! Function phase_dataframe
 
-nordic_file=sys.argv[1]
+    @brief Builds the dataframe of phases from the tables returned by nordic.read_tables
 
-# Read catalog file and obtain number of P and S picks for station and earliest and latest pick
+    @param[in]   hypocenters   nordic.HypocenterTable
+    @param[in]   picks         nordic.PickTable
+    @return      pandas DataFrame with one row per pick and columns column_names
+    """
 
-column_names = ['station', 'phase', 'pick', 'residual', 'distance', 'azimuth', 'ot', 'latitude', 'longitude', 'depth']
-dfs = pd.DataFrame(columns = column_names)
-
-num_lines = 0
-line_count = 0
-in_event = False
-with open(nordic_file) as fp:
-    for line in fp:
-
-#       Counter to see progress reading file
-        num_lines += 1
-        line_count += 1
-        if line_count == 1000:
-            print(num_lines)
-            line_count=0
-
-        if len(line.strip()) == 0:
-            in_event = False
-
-        elif line[79] == '1':
-            if in_event:
-                print("Ignoring extra hypocenter line for this event")
-                continue
-            in_event = True
-            in_header = True
-            hypocenter = nordic.read_line1(line)
-            if hypocenter.second > 59.999:
-                hypocenter.second = 59.999
-            ot_iso = '{0:4d}-{1:02d}-{2:02d} {3:02d}:{4:02d}:{5:09.6f}'.format( \
-                     hypocenter.year, hypocenter.month, hypocenter.day, hypocenter.hour, \
-                     hypocenter.minute, hypocenter.second)
-            ot = datetime.fromisoformat(ot_iso)
-
-        elif line[79] == '7':
-            in_header = False
-
-        elif line[79] == ' ' and len(line.strip()) > 5:
-            if not in_event or in_header:
-                print('ERROR: badly placed phase card')
-                print(in_event, in_header, line)
-                sys.exit()
-            pick = nordic.read_line4(line)
-
-            if pick.second > 59.999:
-                pick.second = 59.999
-            pick_iso = '{0:4d}-{1:02d}-{2:02d} {3:02d}:{4:02d}:{5:09.6f}'.format( \
-                 hypocenter.year, hypocenter.month, hypocenter.day, pick.hour, \
-                 pick.minute, pick.second)
-            pick_time = datetime.fromisoformat(pick_iso)
-
-#           phase_dict = {
-#               'station': pick.station_name,
-#               'phase': pick.phase,
-#               'pick': pick_time,
-#               'residual': pick.residual,
-#               'distance': pick.distance,
-#               'azimuth': pick.azimuth,
-#               'ot': ot,
-#               'latitude': hypocenter.latitude,
-#               'longitude': hypocenter.longitude,
-#               'depth': hypocenter.depth }
-
-            phase_df = pd.DataFrame( {
-                'station': pick.station_name,
-                'phase': pick.phase,
-                'pick': pick_time,
-                'residual': pick.residual,
-                'distance': pick.distance,
-                'azimuth': pick.azimuth,
-                'ot': ot,
-                'latitude': hypocenter.latitude,
-                'longitude': hypocenter.longitude,
-                'depth': hypocenter.depth } , index=[0])
-
-#           dfs = dfs.append(phase_dict,ignore_index=True)
-            dfs = pd.concat([dfs, phase_df], ignore_index=True)
-
-print("Number of lines read: ", num_lines)
-
-print(dfs)
-
-feather.write_feather(dfs, 'ign.feather')
+    event = picks['event']
+
+    with metrics.stage('time_conversion') as record:
+        ot = nordic.origin_times(hypocenters['year'], hypocenters['month'], hypocenters['day'],
+                                 hypocenters['hour'], hypocenters['minute'], hypocenters['second'])
+        pick = nordic.pick_times(hypocenters, picks)
+        record.add(events=len(hypocenters), picks=len(picks))
+
+    with metrics.stage('dataframe') as record:
+        dfs = pd.DataFrame({
+            'station': picks['station_name'],
+            'phase': picks['phase'],
+            'pick': pick,
+            'residual': picks['residual'],
+            'distance': picks['distance'],
+            'azimuth': picks['azimuth'],
+            'ot': ot[event],
+            'latitude': hypocenters['latitude'][event],
+            'longitude': hypocenters['longitude'][event],
+            'depth': hypocenters['depth'][event] }, columns=column_names)
+        record.add(events=len(hypocenters), picks=len(picks))
+
+    return dfs
+
+def add_geometry(dfs, hypocenters, picks, inventory):
+    """! Function add_geometry
+
+    @brief Adds the recomputed pick geometry (see stations.pick_geometry) to a phase dataframe
+
+    Adds columns distance_calc, azimuth_calc, back_azimuth, distance_mismatch and
+    station_outside
+
+    @param[in,out] dfs           DataFrame returned by phase_dataframe
+    @param[in]     hypocenters   nordic.HypocenterTable
+    @param[in]     picks         nordic.PickTable
+    @param[in]     inventory     stations.StationInventory
+    @return        dfs
+    """
+
+    with metrics.stage('geometry') as record:
+        geometry = stations.pick_geometry(hypocenters, picks, inventory)
+        record.add(picks=len(picks))
+    dfs['distance_calc'] = geometry['distance']
+    dfs['azimuth_calc'] = geometry['azimuth']
+    dfs['back_azimuth'] = geometry['back_azimuth']
+    dfs['distance_mismatch'] = geometry['distance_mismatch']
+    dfs['station_outside'] = geometry['station_outside']
+    return dfs
+
+def write_feather_chunked(nordic_file, feather_file, chunk_size, inventory=None):
+    """! Function write_feather_chunked
+
+    @brief Converts a Nordic file to Feather writing one record batch every chunk_size picks
+
+    @param[in]   nordic_file    name of the file in Nordic format
+    @param[in]   feather_file   name of the output Feather file
+    @param[in]   chunk_size     number of picks per record batch
+    @param[in]   inventory      if given, stations.StationInventory used to add the pick geometry
+    @return      number of picks written
+    """
+
+    import pyarrow as pa
+
+    num_picks = 0
+    writer = None
+    try:
+        for hypocenters, picks in nordic.iter_tables(nordic_file, chunk_size):
+            dfs = phase_dataframe(hypocenters, picks)
+            if inventory is not None:
+                add_geometry(dfs, hypocenters, picks, inventory)
+            with metrics.stage('write') as record:
+                batch = pa.RecordBatch.from_pandas(dfs, preserve_index=False)
+                if writer is None:
+                    options = pa.ipc.IpcWriteOptions(compression='lz4')
+                    writer = pa.ipc.new_file(feather_file, batch.schema, options=options)
+                writer.write_batch(batch)
+                record.add(picks=batch.num_rows)
+            num_picks += batch.num_rows
+            print(num_picks)
+        if writer is None:          # no events: write the columns without rows
+            batch = _empty_batch(inventory)
+            writer = pa.ipc.new_file(feather_file, batch.schema,
+                                     options=pa.ipc.IpcWriteOptions(compression='lz4'))
+            writer.write_batch(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    return num_picks
+
+def _empty_batch(inventory=None):
+    """! Returns a record batch without rows with the columns written by the converters"""
+
+    import pyarrow as pa
+
+    hypocenters, picks = nordic.tables_from_events([])
+    dfs = phase_dataframe(hypocenters, picks)
+    if inventory is not None:
+        add_geometry(dfs, hypocenters, picks, inventory)
+    return pa.RecordBatch.from_pandas(dfs, preserve_index=False)
+
+def _write_json(data, file_name):
+    """! Writes a JSON file atomically"""
+    import json
+    temporary_file = file_name + '.tmp'
+    with open(temporary_file, 'w') as fp:
+        json.dump(data, fp)
+    os.replace(temporary_file, file_name)
+
+def convert_tolerant(nordic_file, feather_file, rejects_file, chunk_size=100000,
+                     inventory=None, resume=False):
+    """! Function convert_tolerant
+
+    @brief Converts a Nordic file to Feather skipping malformed events, with checkpoints
+
+    Events that cannot be read are written to rejects_file, each one after a
+    line 'REJECTED line N: reason', and the conversion goes on. Every chunk
+    of chunk_size picks is written to a part file (feather_file.partNNNNN)
+    and then the checkpoint feather_file.checkpoint is updated with the byte
+    offset reached, so an interrupted conversion is resumed from the last
+    checkpoint with resume=True. When the whole file has been read the parts
+    are joined into feather_file and removed with the checkpoint. feather_file
+    is always written, without rows if no event was accepted.
+
+    @param[in]   nordic_file    name of the file in Nordic format
+    @param[in]   feather_file   name of the output Feather file
+    @param[in]   rejects_file   name of the file where rejected events are written
+    @param[in]   chunk_size     number of picks per part (and checkpoint)
+    @param[in]   inventory      if given, stations.StationInventory used to add the pick geometry
+    @param[in]   resume         continue from the checkpoint of a previous run, if any
+    @return      (number of picks written, number of events rejected)
+    """
+
+    import json
+    import pyarrow as pa
+
+    checkpoint_file = feather_file + '.checkpoint'
+    stat = os.stat(nordic_file)
+    state = {'nordic_file': os.path.abspath(nordic_file), 'size': stat.st_size,
+             'mtime_ns': stat.st_mtime_ns, 'offset': 0, 'line_number': 0, 'num_picks': 0,
+             'num_rejected': 0, 'rejects_size': 0, 'parts': []}
+
+    if os.path.exists(checkpoint_file):
+        with open(checkpoint_file) as fp:
+            saved = json.load(fp)
+        if resume:
+            if any(saved[key] != state[key] for key in ('nordic_file', 'size', 'mtime_ns')):
+                raise ValueError('checkpoint {} is for a different input file'
+                                 .format(checkpoint_file))
+            state = saved
+            print('Resuming at line {} ({} picks already written)'.format(
+                  state['line_number'], state['num_picks']))
+        else:
+            for part in saved['parts']:     # parts of a previous run that is not resumed
+                if os.path.exists(part):
+                    os.remove(part)
+
+    # Rejects written after the last checkpoint are written again when resuming
+    rejects = open(rejects_file, 'r+b' if os.path.exists(rejects_file) and resume else 'wb')
+    rejects.truncate(state['rejects_size'])
+    rejects.seek(state['rejects_size'])
+
+    def reject(lines, line_number, reason):
+        rejects.write('REJECTED line {}: {}\n'.format(line_number, reason).encode('latin-1'))
+        rejects.writelines(lines)
+        state['num_rejected'] += 1
+        print('Rejected event at line {}: {}'.format(line_number, reason))
+
+    options = pa.ipc.IpcWriteOptions(compression='lz4')
+    with rejects:
+        for hypocenters, picks, offset, line_number in nordic.iter_tables_tolerant(
+                nordic_file, chunk_size, reject, state['offset'], state['line_number']):
+            dfs = phase_dataframe(hypocenters, picks)
+            if inventory is not None:
+                add_geometry(dfs, hypocenters, picks, inventory)
+            part = '{}.part{:05d}'.format(feather_file, len(state['parts']))
+            with metrics.stage('write') as record:
+                batch = pa.RecordBatch.from_pandas(dfs, preserve_index=False)
+                with pa.ipc.new_file(part, batch.schema, options=options) as writer:
+                    writer.write_batch(batch)
+                record.add(picks=batch.num_rows)
+
+            rejects.flush()
+            state.update(offset=offset, line_number=line_number, rejects_size=rejects.tell(),
+                         num_picks=state['num_picks'] + batch.num_rows)
+            state['parts'].append(part)
+            _write_json(state, checkpoint_file)
+            print(state['num_picks'])
+
+    # Join the parts into the output file, that has no rows if no event was accepted
+    writer = None
+    try:
+        for part in state['parts']:
+            with pa.memory_map(part) as source:
+                reader = pa.ipc.open_file(source)
+                for i in range(reader.num_record_batches):
+                    batch = reader.get_batch(i)
+                    if writer is None:
+                        writer = pa.ipc.new_file(feather_file, batch.schema, options=options)
+                    writer.write_batch(batch)
+        if writer is None:
+            batch = _empty_batch(inventory)
+            writer = pa.ipc.new_file(feather_file, batch.schema, options=options)
+            writer.write_batch(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    for part in state['parts']:
+        os.remove(part)
+    if os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+
+    return state['num_picks'], state['num_rejected']
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Converts a Nordic file to a Feather file with all the phases')
+    parser.add_argument('nordic_file', help='file in Nordic format')
+    parser.add_argument('-o', '--output', default='ign.feather', help='output Feather file')
+    parser.add_argument('--chunk-size', type=int, default=None,
+                        help='write record batches of this number of picks')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of processes used to read the Nordic file')
+    parser.add_argument('--mmap', action='store_true',
+                        help='read the Nordic file through a memory map')
+    parser.add_argument('--stations', default=None,
+                        help='station file used to recompute distance and azimuth of the picks')
+    parser.add_argument('--rejects', default=None,
+                        help='write events that cannot be read to this file and go on, '
+                             'saving a checkpoint after every chunk')
+    parser.add_argument('--resume', action='store_true',
+                        help='with --rejects, resume from the checkpoint of an interrupted run')
+    args = parser.parse_args(argv)
+
+    inventory = None
+    if args.stations:
+        inventory = stations.StationInventory.from_file(args.stations)
+
+    if args.rejects:
+        try:
+            num_picks, num_rejected = convert_tolerant(args.nordic_file, args.output,
+                                                       args.rejects, args.chunk_size or 100000,
+                                                       inventory, args.resume)
+        except ValueError as error:
+            print('ERROR: ' + str(error))
+            sys.exit()
+        print("Number of picks written: ", num_picks)
+        print("Number of events rejected: ", num_rejected)
+        return
+
+    try:
+        if args.chunk_size:
+            num_picks = write_feather_chunked(args.nordic_file, args.output, args.chunk_size,
+                                              inventory)
+            print("Number of picks written: ", num_picks)
+        else:
+            with metrics.stage('read') as record:
+                hypocenters, picks = nordic.read_tables_parallel(args.nordic_file, args.workers,
+                                                                   use_mmap=args.mmap)
+                record.add(bytes=os.path.getsize(args.nordic_file), events=len(hypocenters),
+                           picks=len(picks))
+            dfs = phase_dataframe(hypocenters, picks)
+            if inventory is not None:
+                add_geometry(dfs, hypocenters, picks, inventory)
+                print("Picks with mismatched distance: ", dfs['distance_mismatch'].sum())
+                print("Picks outside the operating period of their station: ",
+                      dfs['station_outside'].sum())
+            print("Number of events read: ", len(hypocenters))
+            print(dfs)
+            import pyarrow.feather as feather
+            with metrics.stage('write') as record:
+                feather.write_feather(dfs, args.output)
+                record.add(bytes=os.path.getsize(args.output), picks=len(dfs))
+    except nordic.NordicFormatError as error:
+        print('ERROR: ' + str(error))
+        print(error.line)
+        sys.exit()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""!
+
+@package nordic_index
+
+Byte-offset index of the events of a file in Nordic format
+
+The index is stored in a sidecar file next to the catalog (catalog name plus
+'.idx.npz') with, for every event, its byte offset and length, origin time,
+epicenter, depth, magnitude and SEISAN ID. It also stores the size and
+modification time of the catalog, and it is rebuilt automatically when any
+of them changes.
+
+select_events uses the index to read only the events that match a query,
+seeking straight to them in the catalog.
+
+Usage: nordic_index.py nordic_file
+
+Created on Sat Oct 17 10:12:31 2026
+"""
+
+import os
+import sys
+
+import numpy as np
+
+import nordic
+
+INDEX_SUFFIX = '.idx.npz'
+
+def index_file(nordic_file):
+    """! Returns the name of the index sidecar file of a Nordic file"""
+    return nordic_file + INDEX_SUFFIX
+
+def _file_signature(nordic_file):
+    """! Returns (size, modification time in ns) of a file"""
+    stat = os.stat(nordic_file)
+    return stat.st_size, stat.st_mtime_ns
+
+def build_index(nordic_file):
+    """! Function build_index
+
+    @brief Scans a Nordic file and writes its index sidecar file
+
+    @param[in]   nordic_file   name of the file in Nordic format
+    @return      dict of numpy arrays with the index (see load_index)
+    """
+
+    size, mtime = _file_signature(nordic_file)
+
+    offsets = []
+    lengths = []
+    event_ids = []
+    hypocenter_lines = []
+    for event in nordic.iter_events(nordic_file):
+        offsets.append(event.offset)
+        lengths.append(event.length)
+        event_ids.append(event.event_id or '')
+        hypocenter_lines.append(event.lines[0])
+
+    hypocenters = nordic.read_lines1(hypocenter_lines)
+
+    index = {
+        'offset':    np.array(offsets, dtype=np.int64),
+        'length':    np.array(lengths, dtype=np.int64),
+        'time':      nordic.origin_times(hypocenters['year'], hypocenters['month'],
+                                         hypocenters['day'], hypocenters['hour'],
+                                         hypocenters['minute'], hypocenters['second']
+                                         ).astype('datetime64[ms]'),
+        'latitude':  hypocenters['latitude'].astype(np.float32),
+        'longitude': hypocenters['longitude'].astype(np.float32),
+        'depth':     hypocenters['depth'].astype(np.float32),
+        'magnitude': hypocenters['mag1'].astype(np.float32),
+        'event_id':  np.array(event_ids, dtype='U14'),
+    }
+
+    temporary_file = index_file(nordic_file) + '.tmp'
+    with open(temporary_file, 'wb') as fp:
+        np.savez(fp, size=size, mtime=mtime, **index)
+    os.replace(temporary_file, index_file(nordic_file))
+
+    return index
+
+def load_index(nordic_file):
+    """! Function load_index
+
+    @brief Returns the index of a Nordic file, building it if missing or out of date
+
+    The index is out of date when the size or the modification time of the
+    Nordic file differ from the ones stored in the sidecar file.
+
+    @param[in]   nordic_file   name of the file in Nordic format
+    @return      dict of numpy arrays with keys offset, length, time
+                 (datetime64[ms]), latitude, longitude, depth, magnitude and
+                 event_id, with one element per event
+    """
+
+    try:
+        with np.load(index_file(nordic_file)) as data:
+            if (int(data['size']), int(data['mtime'])) == _file_signature(nordic_file):
+                return {name: data[name] for name in data.files if name not in ('size', 'mtime')}
+    except (OSError, KeyError, ValueError):
+        pass
+
+    return build_index(nordic_file)
+
+def query_index(index, start=None, end=None, region=None, event_id=None):
+    """! Function query_index
+
+    @brief Returns the positions in the index of the events that match a query
+
+    @param[in]   index      index as returned by load_index
+    @param[in]   start      earliest origin time (anything accepted by numpy.datetime64)
+    @param[in]   end        latest origin time (anything accepted by numpy.datetime64)
+    @param[in]   region     (min_latitude, max_latitude, min_longitude, max_longitude)
+    @param[in]   event_id   SEISAN ID or list of IDs
+    @return      numpy array of positions, in file order
+    """
+
+    selected = np.ones(len(index['offset']), dtype=bool)
+
+    if start is not None:
+        selected &= index['time'] >= np.datetime64(start, 'ms')
+    if end is not None:
+        selected &= index['time'] <= np.datetime64(end, 'ms')
+    if region is not None:
+        min_lat, max_lat, min_lon, max_lon = region
+        selected &= ((index['latitude'] >= min_lat) & (index['latitude'] <= max_lat) &
+                     (index['longitude'] >= min_lon) & (index['longitude'] <= max_lon))
+    if event_id is not None:
+        if isinstance(event_id, str):
+            event_id = [event_id]
+        selected &= np.isin(index['event_id'], list(event_id))
+
+    return np.flatnonzero(selected)
+
+def select_events(nordic_file, start=None, end=None, region=None, event_id=None):
+    """! Function select_events
+
+    @brief Reads the events of a Nordic file that match a query, using its index
+
+    Only the bytes of the selected events are read from the file.
+
+    @param[in]   nordic_file   name of the file in Nordic format
+    @param[in]   start, end, region, event_id   query (see query_index)
+    @return      generator of nordic.Event dataclasses, in file order
+    """
+
+    index = load_index(nordic_file)
+    positions = query_index(index, start, end, region, event_id)
+
+    with open(nordic_file, 'rb') as fp:
+        for position in positions:
+            offset = int(index['offset'][position])
+            fp.seek(offset)
+            data = fp.read(int(index['length'][position]))
+            yield from nordic.iter_events(data.splitlines(keepends=True), offset=offset)
+
+if __name__ == '__main__':
+
+    if len(sys.argv) < 2:
+        print("Usage: nordic_index.py nordic_file")
+        sys.exit()
+
+    index = load_index(sys.argv[1])
+    print("Number of events indexed: ", len(index['offset']))
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""!
+
+@package obspy_catalog
+
+Converts the hypocenter and pick tables of a Nordic file to an ObsPy Catalog
+
+Before any ObsPy object is created the picks are filtered with array
+operations: duplicated picks (same event, station, component and phase) and
+later phases (every P or S pick of an event and station after the first
+one) are removed, keeping the earliest pick of each group. The columns
+needed by the Origin, Magnitude, Pick and Arrival objects are then converted
+to Python lists in one pass, and the objects of each event are built from
+slices of these lists. With lazy=True a LazyCatalog is returned, that builds
+each event the first time it is accessed.
+
+Usage: obspy_catalog.py nordic_file -o quakeml_file [--keep-duplicates] [--keep-later-phases]
+
+Created on Sat Oct 17 15:12:40 2026
+"""
+
+import sys
+import argparse
+from collections.abc import Sequence
+
+import numpy as np
+
+import nordic
+import stations
+
+ONSETS = {'I': 'impulsive', 'E': 'emergent'}
+POLARITIES = {'C': 'positive', 'U': 'positive', 'D': 'negative'}
+EVENT_TYPES = {' ': 'earthquake', 'Q': 'earthquake', 'E': 'explosion', 'P': 'explosion'}
+
+KM_PER_DEGREE = 2.0 * np.pi * stations.EARTH_RADIUS / 360.0
+
+def _first_of_groups(keys, time):
+    """! Function _first_of_groups
+
+    @brief Marks the earliest element of each group of equal keys
+
+    @param[in]   keys   sequence of integer arrays, all of the same length
+    @param[in]   time   int64 array used to order each group (the smallest is kept)
+    @return      boolean array, True for the element kept of each group
+    """
+
+    order = np.lexsort((time,) + tuple(reversed(keys)))
+    same = np.ones(max(len(order) - 1, 0), dtype=bool)
+    for key in keys:
+        sorted_key = key[order]
+        same &= sorted_key[1:] == sorted_key[:-1]
+
+    kept = np.zeros(len(order), dtype=bool)
+    kept[order[np.concatenate(([True], ~same))[:len(order)]]] = True
+    return kept
+
+def first_arrivals(hypocenters, picks, remove_duplicates=True, remove_later_phases=True,
+                   phase_types='PS'):
+    """! Function first_arrivals
+
+    @brief Selects the picks that go into the catalog
+
+    Only picks whose phase starts with one of the letters of phase_types are
+    kept. Picks without time are considered later than any other pick.
+
+    @param[in]   hypocenters           nordic.HypocenterTable
+    @param[in]   picks                 nordic.PickTable
+    @param[in]   remove_duplicates     keep only the earliest pick with the same
+                                       event, station, component and phase
+    @param[in]   remove_later_phases   keep only the earliest pick of each phase type
+                                       (first letter of the phase) for every event
+                                       and station
+    @param[in]   phase_types           first letters of the phases kept
+    @return      boolean array, True for the picks kept
+    """
+
+    time = nordic.pick_times(hypocenters, picks).astype(np.int64)
+    time[time == np.iinfo(np.int64).min] = np.iinfo(np.int64).max    # NaT last
+
+    phase = picks['phase'].astype(str)
+    phase_type = np.char.ljust(phase, 1).astype('U1')
+    kept = np.isin(phase_type, list(phase_types))
+
+    event = picks['event']
+    station = picks.codes('station_name')
+
+    if remove_duplicates:
+        kept &= _first_of_groups((event, station, picks.codes('component'),
+                                  picks.codes('phase')), time)
+    if remove_later_phases:
+        type_code = np.unique(phase_type, return_inverse=True)[1].reshape(-1)
+        candidates = np.flatnonzero(kept)
+        later = ~_first_of_groups((event[candidates], station[candidates],
+                                   type_code[candidates]), time[candidates])
+        kept[candidates[later]] = False
+
+    return kept
+
+def _values(array):
+    """! Converts an array to a list, with None for NaN and NaT"""
+    array = np.asarray(array)
+    if array.dtype.kind == 'M':
+        return np.where(np.isnat(array), None, array.astype(np.int64).astype(object)).tolist()
+    if array.dtype.kind == 'f':
+        return np.where(np.isnan(array), None, array.astype(object)).tolist()
+    return array.tolist()
+
+class LazyCatalog(Sequence):
+    """
+    Sequence of obspy.core.event.Event built on first access
+
+    The columns of the tables are converted to Python lists when the object
+    is created, and the ObsPy objects of an event are built (once) when the
+    event is accessed. to_catalog builds all the events into an
+    obspy.core.event.Catalog.
+    """
+
+    def __init__(self, hypocenters, picks):
+        """! Prepares the columns of the events
+
+        @param[in]   hypocenters   nordic.HypocenterTable
+        @param[in]   picks         nordic.PickTable, sorted by event (as returned by
+                                   nordic.read_tables and filtered with first_arrivals)
+        """
+
+        origin_time = nordic.origin_times(hypocenters['year'], hypocenters['month'],
+                                          hypocenters['day'], hypocenters['hour'],
+                                          hypocenters['minute'], hypocenters['second'])
+        self.events = {
+            'time':       _values(origin_time),
+            'latitude':   _values(hypocenters['latitude']),
+            'longitude':  _values(hypocenters['longitude']),
+            'depth':      _values(hypocenters['depth'] * 1000.0),
+            'rms':        _values(hypocenters['rms']),
+            'num_sta':    _values(hypocenters['num_sta']),
+            'event_type': _values(hypocenters['event_type']),
+        }
+        for number in (1, 2, 3):
+            for name in ('mag', 'mag_type', 'mag_agency'):
+                column = '{}{}'.format(name, number)
+                values = hypocenters[column]
+                if values.dtype.kind == 'U':
+                    values = np.char.strip(values)
+                self.events[column] = _values(values)
+
+        self.picks = {
+            'time':      _values(nordic.pick_times(hypocenters, picks)),
+            'station':   _values(picks['station_name']),
+            'channel':   _values(np.char.strip(np.char.add(picks['instrument_type'],
+                                                           picks['component']))),
+            'phase':     _values(picks['phase']),
+            'onset':     _values(picks['onset']),
+            'polarity':  _values(picks['polarity']),
+            'pick_mode': _values(picks['pick_mode']),
+            'residual':  _values(picks['residual']),
+            'distance':  _values(picks['distance'] / KM_PER_DEGREE),
+            'azimuth':   _values(picks['azimuth']),
+        }
+
+        self.first_pick = np.searchsorted(picks['event'],
+                                          np.arange(len(hypocenters) + 1)).tolist()
+        self._built = {}
+
+    def __len__(self):
+        return len(self.first_pick) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[row] for row in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('event index out of range')
+        if index not in self._built:
+            self._built[index] = self._event(index)
+        return self._built[index]
+
+    def _event(self, row):
+        """! Builds the obspy.core.event.Event of a row of the hypocenters"""
+
+        from obspy import UTCDateTime
+        from obspy.core.event import (Arrival, CreationInfo, Event, Magnitude, Origin,
+                                      OriginQuality, Pick, WaveformStreamID)
+
+        columns = self.picks
+        picks = []
+        arrivals = []
+        for k in range(self.first_pick[row], self.first_pick[row + 1]):
+            time = columns['time'][k]
+            pick = Pick(time=None if time is None else UTCDateTime(ns=time),
+                        waveform_id=WaveformStreamID(station_code=columns['station'][k],
+                                                     channel_code=columns['channel'][k]),
+                        phase_hint=columns['phase'][k],
+                        onset=ONSETS.get(columns['onset'][k]),
+                        polarity=POLARITIES.get(columns['polarity'][k]),
+                        evaluation_mode='automatic' if columns['pick_mode'][k] == 'A' else 'manual')
+            picks.append(pick)
+            arrivals.append(Arrival(pick_id=pick.resource_id, phase=columns['phase'][k],
+                                    time_residual=columns['residual'][k],
+                                    distance=columns['distance'][k],
+                                    azimuth=columns['azimuth'][k]))
+
+        columns = self.events
+        time = columns['time'][row]
+        num_sta = columns['num_sta'][row]
+        origin = Origin(time=None if time is None else UTCDateTime(ns=time),
+                        latitude=columns['latitude'][row], longitude=columns['longitude'][row],
+                        depth=columns['depth'][row], arrivals=arrivals,
+                        quality=OriginQuality(standard_error=columns['rms'][row],
+                                              used_station_count=None if num_sta is None
+                                              else int(num_sta)))
+
+        magnitudes = []
+        for number in (1, 2, 3):
+            mag = columns['mag{}'.format(number)][row]
+            if mag is None:
+                continue
+            magnitudes.append(Magnitude(
+                mag=mag, magnitude_type=columns['mag_type{}'.format(number)][row],
+                origin_id=origin.resource_id,
+                creation_info=CreationInfo(agency_id=columns['mag_agency{}'.format(number)][row])))
+
+        event = Event(origins=[origin], magnitudes=magnitudes, picks=picks,
+                      event_type=EVENT_TYPES.get(columns['event_type'][row]))
+        event.preferred_origin_id = origin.resource_id
+        if magnitudes:
+            event.preferred_magnitude_id = magnitudes[0].resource_id
+        return event
+
+    def to_catalog(self):
+        """! Builds all the events into an obspy.core.event.Catalog"""
+        from obspy.core.event import Catalog
+        return Catalog(events=[self[row] for row in range(len(self))])
+
+def to_catalog(hypocenters, picks, lazy=False, remove_duplicates=True,
+               remove_later_phases=True, phase_types='PS'):
+    """! Function to_catalog
+
+    @brief Converts hypocenter and pick tables to an ObsPy Catalog
+
+    @param[in]   hypocenters   nordic.HypocenterTable
+    @param[in]   picks         nordic.PickTable
+    @param[in]   lazy          return a LazyCatalog instead of a Catalog
+    @param[in]   remove_duplicates, remove_later_phases, phase_types   see first_arrivals
+    @return      obspy.core.event.Catalog, or LazyCatalog if lazy is True
+    """
+
+    kept = first_arrivals(hypocenters, picks, remove_duplicates, remove_later_phases,
+                          phase_types)
+    catalog = LazyCatalog(hypocenters, picks.take(kept))
+    return catalog if lazy else catalog.to_catalog()
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Converts a Nordic file to an ObsPy catalog')
+    parser.add_argument('nordic_file', help='file in Nordic format')
+    parser.add_argument('-o', '--output', required=True, help='output file')
+    parser.add_argument('--format', default='QUAKEML', help='ObsPy event format (default QUAKEML)')
+    parser.add_argument('--keep-duplicates', action='store_true',
+                        help='keep duplicated picks (same station, component and phase)')
+    parser.add_argument('--keep-later-phases', action='store_true',
+                        help='keep all the P and S picks of each station')
+    args = parser.parse_args(argv)
+
+    import parse_cache
+
+    try:
+        hypocenters, picks = parse_cache.read_tables(args.nordic_file)
+    except nordic.NordicFormatError as error:
+        print('ERROR: ' + str(error))
+        print(error.line)
+        sys.exit()
+
+    catalog = to_catalog(hypocenters, picks, remove_duplicates=not args.keep_duplicates,
+                         remove_later_phases=not args.keep_later_phases)
+    print("Number of events: ", len(catalog))
+    print("Number of picks: ", sum(len(event.picks) for event in catalog))
+    catalog.write(args.output, format=args.format)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""!
+
+@package parse_cache
+
+On-disk cache of the hypocenter and pick tables of Nordic files
+
+The tables returned by nordic.read_tables are stored as uncompressed Feather
+files (string columns as dictionary arrays), keyed by a hash of the contents of the Nordic file and by
+nordic.PARSER_VERSION, so that later runs on the same catalog memory-map them
+instead of parsing the text again. When the cache grows beyond its size cap
+the least recently used entries are removed.
+
+The cache directory is $LET_CACHE_DIR (default ~/.cache/let-processing) and
+the size cap is $LET_CACHE_MAX_BYTES (default 2 GiB).
+
+Usage: parse_cache.py info|clear
+
+Created on Sat Oct 17 11:05:12 2026
+"""
+
+import os
+import sys
+import hashlib
+
+import pyarrow.feather as feather
+
+import nordic
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'let-processing')
+DEFAULT_MAX_BYTES = 2 << 30
+
+TABLE_NAMES = ('hypocenters', 'picks')
+TABLE_CLASSES = (nordic.HypocenterTable, nordic.PickTable)
+
+def cache_dir():
+    """! Returns the cache directory"""
+    return os.environ.get('LET_CACHE_DIR', DEFAULT_CACHE_DIR)
+
+def max_bytes():
+    """! Returns the size cap of the cache in bytes"""
+    return int(os.environ.get('LET_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
+
+def content_hash(nordic_file):
+    """! Returns a hex digest of the contents of a file"""
+
+    digest = hashlib.blake2b(digest_size=20)
+    with open(nordic_file, 'rb') as fp:
+        for block in iter(lambda: fp.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _entry_files(directory, key):
+    """! Returns the names of the Feather files of a cache entry"""
+    return [os.path.join(directory, '{}.{}.feather'.format(key, name)) for name in TABLE_NAMES]
+
+def read_tables(nordic_file, workers=1, directory=None, size_cap=None):
+    """! Function read_tables
+
+    @brief Returns the tables of a Nordic file, from the cache if possible
+
+    Same result as nordic.read_tables. On a cache miss the file is parsed
+    (with read_tables_parallel if workers > 1) and the tables are stored.
+
+    @param[in]   nordic_file   name of the file in Nordic format
+    @param[in]   workers       number of processes used to parse the file on a miss
+    @param[in]   directory     cache directory (default cache_dir())
+    @param[in]   size_cap      size cap of the cache in bytes (default max_bytes()).
+                               0 disables the cache
+    @return      (nordic.HypocenterTable, nordic.PickTable)
+    """
+
+    directory = directory or cache_dir()
+    size_cap = max_bytes() if size_cap is None else size_cap
+
+    if size_cap == 0:
+        return nordic.read_tables_parallel(nordic_file, workers)
+
+    key = '{}-v{}'.format(content_hash(nordic_file), nordic.PARSER_VERSION)
+    files = _entry_files(directory, key)
+
+    if all(os.path.exists(name) for name in files):
+        for name in files:
+            os.utime(name)
+        return tuple(table_class.from_arrow(feather.read_table(name, memory_map=True))
+                     for table_class, name in zip(TABLE_CLASSES, files))
+
+    tables = nordic.read_tables_parallel(nordic_file, workers)
+
+    os.makedirs(directory, exist_ok=True)
+    for name, table in zip(files, tables):
+        temporary_file = name + '.tmp'
+        feather.write_feather(table.to_arrow(), temporary_file, compression='uncompressed')
+        os.replace(temporary_file, name)
+
+    evict(directory, size_cap, keep=key)
+    return tables
+
+def cache_entries(directory=None):
+    """! Function cache_entries
+
+    @brief Lists the entries of the cache
+
+    @param[in]   directory   cache directory (default cache_dir())
+    @return      list of (key, size in bytes, last access time), most recent first
+    """
+
+    directory = directory or cache_dir()
+    entries = {}
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            if not name.endswith('.feather'):
+                continue
+            key = name.split('.', 1)[0]
+            stat = os.stat(os.path.join(directory, name))
+            size, used = entries.get(key, (0, 0))
+            entries[key] = (size + stat.st_size, max(used, stat.st_mtime))
+
+    return sorted(((key, size, used) for key, (size, used) in entries.items()),
+                  key=lambda entry: entry[2], reverse=True)
+
+def _remove_entry(directory, key):
+    """! Removes the files of a cache entry"""
+    for name in _entry_files(directory, key):
+        if os.path.exists(name):
+            os.remove(name)
+
+def evict(directory=None, size_cap=None, keep=None):
+    """! Function evict
+
+    @brief Removes the least recently used entries until the cache fits in size_cap
+
+    @param[in]   directory   cache directory (default cache_dir())
+    @param[in]   size_cap    size cap in bytes (default max_bytes())
+    @param[in]   keep        key of an entry that is never removed (e.g. the one just written)
+    """
+
+    directory = directory or cache_dir()
+    size_cap = max_bytes() if size_cap is None else size_cap
+
+    total = 0
+    for key, size, used in cache_entries(directory):
+        total += size
+        if total > size_cap and key != keep:
+            _remove_entry(directory, key)
+
+def clear_cache(directory=None):
+    """! Removes all the entries of the cache"""
+
+    directory = directory or cache_dir()
+    for key, size, used in cache_entries(directory):
+        _remove_entry(directory, key)
+
+if __name__ == '__main__':
+
+    if len(sys.argv) < 2 or sys.argv[1] not in ('info', 'clear'):
+        print("Usage: parse_cache.py info|clear")
+        sys.exit()
+
+    if sys.argv[1] == 'clear':
+        clear_cache()
+    else:
+        entries = cache_entries()
+        print('Cache directory: ' + cache_dir())
+        for key, size, used in entries:
+            print('{}  {:12d}'.format(key, size))
+        print('{} entries, {} bytes (cap {})'.format(len(entries),
+              sum(entry[1] for entry in entries), max_bytes()))
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""!
+
+@package rea
+
+Reads SEISAN databases stored as S-files in REA/YYYY/MM directory trees
+
+A SEISAN database keeps each event in its own S-file (e.g.
+19-0101-41L.S201701), in one directory per year and month. Reading
+hundreds of thousands of small files is dominated by the latency of the
+file system, so the files are read by a pool of threads, while the
+contents are split in events with the same state machine as
+nordic.iter_events and decoded with the bulk line readers in batches of
+files. The events of all the files are merged into one hypocenter table and
+one pick table, sorted by origin time. S-files that cannot be read are
+skipped and reported with their name and the failing line.
+
+Usage: rea.py database_directory [-o feather_file] [--start YYYY/MM] [--end YYYY/MM]
+
+Created on Sat Oct 17 14:05:31 2026
+"""
+
+import os
+import re
+import sys
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+import nordic
+
+# Name of an S-file: DD-HHMM-SSX.SYYYYMM
+SFILE_PATTERN = re.compile(r'^\d\d-\d{4}-\d\d[LRD]\.S\d{6}$')
+
+def find_sfiles(database_directory, start=None, end=None):
+    """! Function find_sfiles
+
+    @brief Lists the S-files of a database directory, in year and month order
+
+    @param[in]   database_directory   directory with YYYY/MM subdirectories
+    @param[in]   start, end           first and last (year, month) to include
+    @return      list of S-file names
+    """
+
+    sfiles = []
+    for year in sorted(os.listdir(database_directory)):
+        year_directory = os.path.join(database_directory, year)
+        if not (year.isdigit() and len(year) == 4 and os.path.isdir(year_directory)):
+            continue
+        for month in sorted(os.listdir(year_directory)):
+            month_directory = os.path.join(year_directory, month)
+            if not (month.isdigit() and len(month) == 2 and os.path.isdir(month_directory)):
+                continue
+            if start is not None and (int(year), int(month)) < start:
+                continue
+            if end is not None and (int(year), int(month)) > end:
+                continue
+            with os.scandir(month_directory) as entries:
+                names = sorted(entry.name for entry in entries
+                               if entry.is_file() and SFILE_PATTERN.match(entry.name))
+            sfiles.extend(os.path.join(month_directory, name) for name in names)
+
+    return sfiles
+
+def _read_file(file_name):
+    """! Returns the contents of a file as bytes"""
+    with open(file_name, 'rb') as fp:
+        return fp.read()
+
+def _file_error(file_name, error):
+    """! Returns a NordicFormatError with the message of error prefixed by the S-file name"""
+    message = str(error).rsplit(' (line', 1)[0]
+    return nordic.NordicFormatError('{}: {}'.format(file_name, message),
+                                    error.line_number, error.line)
+
+def _events(sfiles, contents, reject=None):
+    """! Function _events
+
+    @brief Splits the contents of some S-files in nordic.Event
+
+    @param[in]   sfiles     list of S-file names
+    @param[in]   contents   list with the bytes of every S-file
+    @param[in]   reject     function called as reject(file_name, error) for the S-files
+                            with format errors, or None to raise the error
+    @return      list of (file name, contents, list of nordic.Event) of the files read
+    @exception   NordicFormatError naming the S-file if reject is None
+    """
+
+    files = []
+    for file_name, data in zip(sfiles, contents):
+        try:
+            files.append((file_name, data, list(nordic.iter_events(data.splitlines(keepends=True)))))
+        except nordic.NordicFormatError as error:
+            if reject is None:
+                raise _file_error(file_name, error) from None
+            reject(file_name, _file_error(file_name, error))
+    return files
+
+def _tables(files, reject=None):
+    """! Function _tables
+
+    @brief Decodes the events of some S-files into tables, naming the S-file on errors
+
+    The events of all the files are decoded at once. If that fails, the
+    files are decoded one by one to find the ones whose fields cannot be
+    decoded, and the line that fails (see nordic.decode_error).
+
+    @param[in]   files    list returned by _events
+    @param[in]   reject   function called as reject(file_name, error) for the S-files
+                          that cannot be decoded, or None to raise the error
+    @return      (nordic.HypocenterTable, nordic.PickTable) of the other files
+    @exception   NordicFormatError naming the S-file if reject is None
+    """
+
+    try:
+        return nordic.tables_from_events([event for name, data, events in files
+                                          for event in events])
+    except ValueError:
+        pass
+
+    kept = []
+    for file_name, data, events in files:
+        try:
+            nordic.tables_from_events(events)
+            kept.extend(events)
+            continue
+        except ValueError:
+            pass
+        error = nordic.NordicFormatError('{}: events cannot be decoded'.format(file_name))
+        for event in events:
+            try:
+                nordic.tables_from_events([event])
+            except ValueError:
+                line_number = data.count(b'\n', 0, event.offset) + 1
+                error = _file_error(file_name, nordic.decode_error(event, line_number))
+                break
+        if reject is None:
+            raise error
+        reject(file_name, error)
+    return nordic.tables_from_events(kept)
+
+def print_progress(done, total):
+    """! Prints the number of files read on a single line of the standard error"""
+    end = '\n' if done == total else ''
+    print('\rRead {} of {} S-files'.format(done, total), end=end, file=sys.stderr, flush=True)
+
+def read_sfiles(sfiles, threads=16, batch_size=5000, progress=None, reject=None):
+    """! Function read_sfiles
+
+    @brief Reads a list of S-files into hypocenter and pick tables sorted by origin time
+
+    @param[in]   sfiles       list of S-file names
+    @param[in]   threads      number of threads that read the files
+    @param[in]   batch_size   number of files decoded at once
+    @param[in]   progress     function called as progress(files read, total files)
+                              after every batch, or None
+    @param[in]   reject       function called as reject(file_name, error) with a
+                              NordicFormatError naming the S-file, for every S-file
+                              that cannot be read; the other files are still read.
+                              If None, the first such error is raised
+    @return      (nordic.HypocenterTable, nordic.PickTable) sorted by origin time,
+                 as returned by nordic.read_tables
+    """
+
+    tables = []
+    with ThreadPoolExecutor(threads) as executor:
+        for first in range(0, len(sfiles), batch_size):
+            batch = sfiles[first:first + batch_size]
+            with metrics.stage('read_files') as record:
+                contents = list(executor.map(_read_file, batch))
+                record.add(bytes=sum(len(content) for content in contents))
+            tables.append(_tables(_events(batch, contents, reject), reject))
+            if progress is not None:
+                progress(first + len(batch), len(sfiles))
+
+    return nordic.sort_tables(*nordic.concatenate_tables(tables))
+
+def read_database(database_directory, start=None, end=None, threads=16, progress=None):
+    """! Function read_database
+
+    @brief Reads all the S-files of a database directory (see find_sfiles and read_sfiles)
+
+    @return      (nordic.HypocenterTable, nordic.PickTable) sorted by origin time
+    """
+
+    return read_sfiles(find_sfiles(database_directory, start, end), threads,
+                       progress=progress)
+
+def _year_month(text):
+    """! Parses YYYY/MM"""
+    year, month = text.split('/')
+    return int(year), int(month)
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Reads the S-files of a SEISAN database directory')
+    parser.add_argument('database_directory', help='directory with YYYY/MM subdirectories of S-files')
+    parser.add_argument('-o', '--output', help='Feather file for the phases (see nordic2df.py)')
+    parser.add_argument('--start', type=_year_month, help='first year and month (YYYY/MM)')
+    parser.add_argument('--end', type=_year_month, help='last year and month (YYYY/MM)')
+    parser.add_argument('--threads', type=int, default=16, help='number of threads reading files')
+    args = parser.parse_args(argv)
+
+    sfiles = find_sfiles(args.database_directory, args.start, args.end)
+    print("Number of S-files found: ", len(sfiles))
+
+    rejected = []
+
+    def reject(file_name, error):
+        print('\nSkipping ' + str(error), file=sys.stderr)
+        rejected.append(file_name)
+
+    hypocenters, picks = read_sfiles(sfiles, args.threads, progress=print_progress,
+                                     reject=reject)
+
+    print("Number of S-files skipped: ", len(rejected))
+
+    print("Number of events read: ", len(hypocenters))
+    print("Number of picks read: ", len(picks))
+
+    if args.output:
+        import pyarrow.feather as feather
+        import nordic2df
+        feather.write_feather(nordic2df.phase_dataframe(hypocenters, picks), args.output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""!
+
+@package residual_stats
+
+Statistics of the travel-time residuals (TRES) per station, phase and distance bin
+
+The residuals are accumulated in one pass, chunk by chunk, by a
+ResidualStatistics object whose memory does not depend on the number of
+picks. The residual of a phase card has two decimals (F5.2), so every
+residual is an integer number of centiseconds and the accumulators are
+integers:
+
+- the moments are the count, sum and sum of squares in centiseconds, from
+  which the mean and standard deviation are computed
+- the quantile sketch of each group is the histogram of its residuals at
+  the resolution of the field, one counter per distinct value
+
+Both are merged by adding them, so the statistics of chunks read by
+different processes merge exactly, in any order, into the statistics of the
+whole catalog. Medians and percentiles are exact, interpolated between
+order statistics like numpy.percentile. The statistics of coarser groups
+(e.g. per station over all phases and distances) are rolled up from the
+same accumulators.
+
+Usage: residual_stats.py nordic_file [--by station,phase,distance_bin] [--bin-width KM]
+                         [--workers N] [-o csv_file]
+
+Created on Sat Oct 17 18:10:26 2026
+"""
+
+import os
+import sys
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import nordic
+
+group_fields = ['station', 'phase', 'distance_bin']
+
+percentiles = [5, 25, 50, 75, 95]
+
+# Residuals are stored as centiseconds shifted by VALUE_OFFSET, so that each
+# (group, value) pair is one non-negative integer key
+RESOLUTION = 0.01
+VALUE_OFFSET = 100000
+VALUE_RANGE = 2 * VALUE_OFFSET + 1
+
+def _sum_by(index, values, size):
+    """! Sums int64 values by index exactly (numpy.bincount sums its weights as float64)"""
+    result = np.zeros(size, dtype=np.int64)
+    np.add.at(result, index, values)
+    return result
+
+class ResidualStatistics:
+    """
+    Mergeable accumulators of residuals grouped by station, phase and distance bin
+
+    Attributes
+    ----------
+    bin_width : float
+        width of the distance bins in km (bin k covers [k * bin_width, (k + 1) * bin_width))
+    groups : list
+        (station, phase, distance bin) of every group, in order of appearance
+    count, total, total_squares : numpy arrays
+        number of residuals, sum and sum of squares in centiseconds of every group
+    keys, counts : numpy arrays
+        sorted (group, value) keys of the histograms and their counts
+    """
+
+    def __init__(self, bin_width=10.0):
+        self.bin_width = bin_width
+        self.groups = []
+        self._group_id = {}
+        self.count = np.zeros(0, dtype=np.int64)
+        self.total = np.zeros(0, dtype=np.int64)
+        self.total_squares = np.zeros(0, dtype=np.int64)
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    def _group_ids(self, groups):
+        """! Returns the ids of a list of groups, adding the new ones"""
+
+        ids = np.empty(len(groups), dtype=np.int64)
+        for i, group in enumerate(groups):
+            gid = self._group_id.get(group)
+            if gid is None:
+                gid = self._group_id[group] = len(self.groups)
+                self.groups.append(group)
+            ids[i] = gid
+
+        grow = len(self.groups) - len(self.count)
+        if grow > 0:
+            self.count = np.concatenate([self.count, np.zeros(grow, dtype=np.int64)])
+            self.total = np.concatenate([self.total, np.zeros(grow, dtype=np.int64)])
+            self.total_squares = np.concatenate([self.total_squares,
+                                                 np.zeros(grow, dtype=np.int64)])
+        return ids
+
+    def _add_histogram(self, keys, counts):
+        """! Adds counts of (group, value) keys to the histograms"""
+
+        keys, inverse = np.unique(np.concatenate([self.keys, keys]), return_inverse=True)
+        self.counts = _sum_by(inverse.reshape(-1), np.concatenate([self.counts, counts]),
+                              len(keys))
+        self.keys = keys
+
+    def add(self, station, phase, distance, residual):
+        """! Function add
+
+        @brief Adds residuals to the statistics
+
+        Residuals that are NaN are ignored. Distances that are NaN go to bin -1.
+
+        @param[in]   station    array of station codes
+        @param[in]   phase      array of phase names
+        @param[in]   distance   array of epicentral distances in km
+        @param[in]   residual   array of residuals in seconds
+        """
+
+        residual = np.asarray(residual, dtype=np.float64)
+        kept = ~np.isnan(residual)
+        value = np.rint(residual[kept] / RESOLUTION).astype(np.int64)
+        value = np.clip(value, -VALUE_OFFSET, VALUE_OFFSET)
+
+        distance = np.asarray(distance, dtype=np.float64)[kept]
+        with np.errstate(invalid='ignore'):
+            distance_bin = np.where(np.isnan(distance), -1,
+                                    np.floor(distance / self.bin_width)).astype(np.int64)
+
+        # Group the picks of the chunk, and map the groups of the chunk to global ids
+        station_names, station_code = np.unique(np.asarray(station)[kept], return_inverse=True)
+        phase_names, phase_code = np.unique(np.asarray(phase)[kept], return_inverse=True)
+        chunk_groups, group = np.unique(np.stack([station_code.reshape(-1),
+                                                  phase_code.reshape(-1), distance_bin]),
+                                        axis=1, return_inverse=True)
+        ids = self._group_ids([(str(station_names[s]), str(phase_names[p]), int(b))
+                               for s, p, b in chunk_groups.T.tolist()])
+        group = ids[group.reshape(-1)]
+
+        self.count += np.bincount(group, minlength=len(self.count))
+        self.total += _sum_by(group, value, len(self.count))
+        self.total_squares += _sum_by(group, value * value, len(self.count))
+
+        keys, counts = np.unique(group * VALUE_RANGE + value + VALUE_OFFSET, return_counts=True)
+        self._add_histogram(keys, counts)
+
+    def add_tables(self, hypocenters, picks):
+        """! Adds the residuals of the picks of a chunk of tables (e.g. from nordic.iter_tables)"""
+        self.add(picks['station_name'], picks['phase'], picks['distance'], picks['residual'])
+
+    def add_events(self, events):
+        """! Adds the residuals of the picks of a sequence of nordic.Event"""
+        self.add_tables(*nordic.tables_from_events(events))
+
+    def merge(self, other):
+        """! Function merge
+
+        @brief Adds the statistics of another ResidualStatistics with the same bin width
+
+        @param[in]   other   ResidualStatistics
+        @return      self
+        """
+
+        if other.bin_width != self.bin_width:
+            raise ValueError('cannot merge statistics with different distance bins')
+
+        ids = self._group_ids(other.groups)
+        np.add.at(self.count, ids, other.count)
+        np.add.at(self.total, ids, other.total)
+        np.add.at(self.total_squares, ids, other.total_squares)
+
+        group, value = np.divmod(other.keys, VALUE_RANGE)
+        self._add_histogram(ids[group] * VALUE_RANGE + value, other.counts)
+        return self
+
+    def table(self, by=('station', 'phase'), percentiles=percentiles):
+        """! Function table
+
+        @brief Returns the statistics of the residuals grouped by some of the group fields
+
+        @param[in]   by            names of group_fields to group by (the others are merged)
+        @param[in]   percentiles   percentiles computed besides the median
+        @return      DataFrame indexed by the fields in by, with columns count, mean,
+                     std (sample standard deviation), median and p<percentile>, in seconds.
+                     distance_bin is the lower edge of the bin in km (NaN for no distance)
+        """
+
+        by = list(by)
+        for name in by:
+            if name not in group_fields:
+                raise ValueError('unknown group field: ' + name)
+
+        # Roll the groups up to the requested fields
+        groups = pd.DataFrame(self.groups, columns=group_fields)
+        if by:
+            grouped = groups.groupby(by, sort=True)
+            target = grouped.ngroup().to_numpy(dtype=np.int64)
+            index = grouped.size().index
+        else:
+            target = np.zeros(len(groups), dtype=np.int64)
+            index = pd.RangeIndex(1)
+        num_groups = len(index)
+
+        count = _sum_by(target, self.count, num_groups)
+        # Exact integer arithmetic for the moments (Python integers cannot overflow)
+        total = np.zeros(num_groups, dtype=object)
+        total_squares = np.zeros(num_groups, dtype=object)
+        np.add.at(total, target, self.total.astype(object))
+        np.add.at(total_squares, target, self.total_squares.astype(object))
+
+        group, value = np.divmod(self.keys, VALUE_RANGE)
+        keys, inverse = np.unique(target[group] * VALUE_RANGE + value, return_inverse=True)
+        counts = _sum_by(inverse.reshape(-1), self.counts, len(keys))
+        group, value = np.divmod(keys, VALUE_RANGE)
+        value = (value - VALUE_OFFSET) * RESOLUTION
+
+        result = pd.DataFrame(index=index)
+        result['count'] = count
+        with np.errstate(invalid='ignore', divide='ignore'):
+            n = count.astype(object)
+            result['mean'] = np.where(count > 0, (total / np.maximum(n, 1)).astype(np.float64)
+                                      * RESOLUTION, np.nan)
+            variance = (n * total_squares - total * total) / np.maximum(n * (n - 1), 1)
+            result['std'] = np.where(count > 1, np.sqrt(variance.astype(np.float64))
+                                     * RESOLUTION, np.nan)
+
+        # Order statistics from the cumulative counts of the sorted histograms
+        cumulative = np.cumsum(counts)
+        start = np.concatenate(([0], np.cumsum(count)))[:-1]
+        for q in sorted(set([50] + list(percentiles))):
+            position = (count - 1) * q / 100.0
+            low = np.floor(position).astype(np.int64)
+            fraction = position - low
+            high = np.minimum(low + 1, count - 1)
+            v_low = value[np.minimum(np.searchsorted(cumulative, start + low, side='right'),
+                                     len(value) - 1)] if len(value) else np.zeros(num_groups)
+            v_high = value[np.minimum(np.searchsorted(cumulative, start + high, side='right'),
+                                      len(value) - 1)] if len(value) else np.zeros(num_groups)
+            column = 'median' if q == 50 else 'p{:g}'.format(q)
+            result[column] = np.where(count > 0, v_low + fraction * (v_high - v_low), np.nan)
+
+        if 'distance_bin' in by:
+            result = result.reset_index('distance_bin')
+            result['distance_bin'] = np.where(result['distance_bin'] < 0, np.nan,
+                                              result['distance_bin'] * self.bin_width)
+            result = result.set_index('distance_bin', append=len(by) > 1)
+
+        return result
+
+def _range_statistics(nordic_file, start, stop, bin_width):
+    """! Returns the ResidualStatistics of the events between byte offsets start and stop"""
+
+    statistics = ResidualStatistics(bin_width)
+    for hypocenters, picks in nordic.iter_tables_mmap(nordic_file, start, stop):
+        statistics.add_tables(hypocenters, picks)
+    return statistics
+
+def residual_statistics(nordic_file, bin_width=10.0, workers=1, chunk_bytes=64 << 20):
+    """! Function residual_statistics
+
+    @brief Computes the residual statistics of a Nordic file in one pass
+
+    The file is read in windows through a memory map (see nordic.iter_tables_mmap),
+    by several processes if workers > 1, and their statistics are merged.
+
+    @param[in]   nordic_file    name of the file in Nordic format
+    @param[in]   bin_width      width of the distance bins in km
+    @param[in]   workers        number of processes
+    @param[in]   chunk_bytes    approximate size of the ranges given to each process
+    @return      ResidualStatistics
+    """
+
+    if workers == 1:
+        return _range_statistics(nordic_file, 0, None, bin_width)
+
+    size = os.path.getsize(nordic_file)
+    offsets = nordic.event_boundaries(nordic_file, max(workers, -(-size // chunk_bytes)))
+    statistics = ResidualStatistics(bin_width)
+    with ProcessPoolExecutor(workers) as executor:
+        for partial in executor.map(_range_statistics, [nordic_file] * (len(offsets) - 1),
+                                    offsets[:-1], offsets[1:], [bin_width] * (len(offsets) - 1)):
+            statistics.merge(partial)
+    return statistics
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Statistics of the travel-time residuals of a catalog')
+    parser.add_argument('nordic_file', help='file in Nordic format')
+    parser.add_argument('--by', default='station,phase',
+                        help='comma-separated group fields among ' + ','.join(group_fields))
+    parser.add_argument('--bin-width', type=float, default=10.0,
+                        help='width of the distance bins in km')
+    parser.add_argument('--workers', type=int, default=1, help='number of processes')
+    parser.add_argument('-o', '--output', help='CSV file for the statistics')
+    args = parser.parse_args(argv)
+
+    by = [name for name in args.by.split(',') if name]
+    try:
+        statistics = residual_statistics(args.nordic_file, args.bin_width, args.workers)
+        result = statistics.table(by)
+    except nordic.NordicFormatError as error:
+        print('ERROR: ' + str(error))
+        print(error.line)
+        sys.exit()
+    except ValueError as error:
+        print('ERROR: ' + str(error))
+        sys.exit()
+
+    print(result.to_string())
+    if args.output:
+        result.to_csv(args.output)
+
+if __name__ == '__main__':
+    main()
@@ -1,30 +1,262 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-"""
+"""! select_eq.py
+
+@brief Selects the events of a Nordic file that match some criteria
+
+Events can be selected by origin time window, latitude/longitude box or
+polygon, depth range, magnitude range, maximum RMS, minimum number of
+stations, distance indicator and event type, and by SEISAN ID. Only the
+fields of the hypocenter line (type 1) that are needed by the criteria are
+decoded, and the phase cards are never parsed. The file is read as a stream
+of raw events and the selected events are written back byte for byte, so
+the output is a valid Nordic file.
+
+With --use-index the event index of nordic_index.py is used to seek
+directly to the events that can match the time, region and ID criteria.
+
 Created on Fri Aug 21 13:36:27 2020
 
 @author: antonio
 """
-from obspy.io.nordic.core import read_nordic # , readheader
 
-nordic_file='/Users/antonio/devel/let-processing/data/test.nor'
+import sys
+import argparse
+
+import metrics
+import nordic
+
+def point_in_polygon(latitude, longitude, polygon):
+    """! Function point_in_polygon
+
+    @brief Tells if a point is inside a polygon (ray casting in latitude/longitude)
+
+    @param[in]   latitude, longitude   coordinates of the point
+    @param[in]   polygon               list of (latitude, longitude) vertices
+    @return      True if the point is inside the polygon
+    """
+
+    inside = False
+    lat_j, lon_j = polygon[-1]
+    for lat_i, lon_i in polygon:
+        if (lat_i > latitude) != (lat_j > latitude):
+            crossing = lon_i + (latitude - lat_i) * (lon_j - lon_i) / (lat_j - lat_i)
+            if longitude < crossing:
+                inside = not inside
+        lat_j, lon_j = lat_i, lon_i
+    return inside
+
+def _float(field):
+    """! Returns a float from a bytes field, or None if it is blank"""
+    return float(field) if field.strip() else None
+
+class EventFilter:
+    """
+    Selection criteria evaluated on the raw hypocenter line of an event
+
+    Criteria that are None are not applied. Each criterion only decodes the
+    columns it needs, and events are rejected at the first failing one, with
+    the cheapest criteria checked first. Events with a blank field needed
+    by a criterion are rejected.
+    """
+
+    def __init__(self, start=None, end=None, region=None, polygon=None,
+                 min_depth=None, max_depth=None, min_magnitude=None, max_magnitude=None,
+                 max_rms=None, min_stations=None, distance_indicators=None, event_types=None,
+                 event_ids=None):
+        """! Sets the selection criteria
+
+        @param[in]   start, end           origin time window, as datetime
+        @param[in]   region               (min_latitude, max_latitude, min_longitude, max_longitude)
+        @param[in]   polygon              list of (latitude, longitude) vertices
+        @param[in]   min_depth, max_depth             depth range in km
+        @param[in]   min_magnitude, max_magnitude     range of the first magnitude
+        @param[in]   max_rms              maximum RMS of the residuals
+        @param[in]   min_stations         minimum number of stations
+        @param[in]   distance_indicators  accepted distance indicators (e.g. 'LR')
+        @param[in]   event_types          accepted event types (e.g. 'EP', ' ' for earthquakes)
+        @param[in]   event_ids            accepted SEISAN IDs
+        """
+
+        self.start = None if start is None else _time_key(start)
+        self.end = None if end is None else _time_key(end)
+        self.region = region
+        self.polygon = polygon
+        self.depth = (min_depth, max_depth)
+        self.magnitude = (min_magnitude, max_magnitude)
+        self.max_rms = max_rms
+        self.min_stations = min_stations
+        self.distance_indicators = (None if distance_indicators is None
+                                    else distance_indicators.encode('latin-1'))
+        self.event_types = None if event_types is None else event_types.encode('latin-1')
+        self.event_ids = None if event_ids is None else {i.encode('latin-1') for i in event_ids}
+
+    def match(self, lines):
+        """! Tells if an event, given as its raw lines, matches all the criteria"""
+
+        line = lines[0]
+
+        if self.distance_indicators is not None and line[21:22] not in self.distance_indicators:
+            return False
+        if self.event_types is not None and line[22:23] not in self.event_types:
+            return False
+
+        if self.start is not None or self.end is not None:
+            second = _float(line[16:20])
+            if second is None:
+                return False
+            key = (int(line[1:5]), int(line[6:8]), int(line[8:10]),
+                   int(line[11:13]), int(line[13:15]), second)
+            if self.start is not None and key < self.start:
+                return False
+            if self.end is not None and key > self.end:
+                return False
+
+        if self.region is not None or self.polygon is not None:
+            latitude = _float(line[23:30])
+            longitude = _float(line[30:38])
+            if latitude is None or longitude is None:
+                return False
+            if self.region is not None:
+                min_lat, max_lat, min_lon, max_lon = self.region
+                if not (min_lat <= latitude <= max_lat and min_lon <= longitude <= max_lon):
+                    return False
+            if self.polygon is not None and not point_in_polygon(latitude, longitude, self.polygon):
+                return False
+
+        if not _in_range(line[38:43], self.depth):
+            return False
+        if not _in_range(line[55:59], self.magnitude):
+            return False
+        if self.max_rms is not None and not _in_range(line[51:55], (None, self.max_rms)):
+            return False
+        if self.min_stations is not None and not _in_range(line[48:51], (self.min_stations, None)):
+            return False
+
+        if self.event_ids is not None:
+            for other in lines[1:]:
+                if other[79:80] == b'I' and other[57:60] == b'ID:':
+                    return other[60:74].strip() in self.event_ids
+            return False
+
+        return True
+
+def _time_key(time):
+    """! Returns the tuple used to compare origin times"""
+    return (time.year, time.month, time.day, time.hour, time.minute,
+            time.second + time.microsecond * 1e-6)
+
+def _in_range(field, limits):
+    """! Tells if a numeric field is within (minimum, maximum), None meaning no limit"""
+
+    minimum, maximum = limits
+    if minimum is None and maximum is None:
+        return True
+    value = _float(field)
+    if value is None:
+        return False
+    return (minimum is None or value >= minimum) and (maximum is None or value <= maximum)
+
+def select_events(nordic_file, event_filter, output, use_index=False):
+    """! Function select_events
+
+    @brief Writes the events of a Nordic file that match a filter
+
+    @param[in]   nordic_file    name of the file in Nordic format
+    @param[in]   event_filter   EventFilter
+    @param[in]   output         binary file object where the selected events are written
+    @param[in]   use_index      prefilter the events with the index of nordic_index.py
+    @return      (number of events read, number of events selected)
+    """
+
+    num_events = 0
+    num_selected = 0
+
+    if use_index:
+        import nordic_index
+        ids = None
+        if event_filter.event_ids is not None:
+            ids = [i.decode('latin-1') for i in event_filter.event_ids]
+        start = end = None
+        if event_filter.start is not None:
+            start = _key_to_datetime64(event_filter.start)
+        if event_filter.end is not None:
+            end = _key_to_datetime64(event_filter.end)
+        events = (event.lines for event in nordic_index.select_events(
+                  nordic_file, start, end, event_filter.region, ids))
+        for lines in events:
+            num_events += 1
+            if event_filter.match(lines):
+                output.writelines(lines)
+                num_selected += 1
+        return num_events, num_selected
+
+    with metrics.stage('select') as record, open(nordic_file, 'rb', buffering=1 << 22) as fp:
+        for lines in nordic.iter_raw_events(fp):
+            num_events += 1
+            if event_filter.match(lines):
+                output.writelines(lines)
+                num_selected += 1
+        record.add(bytes=fp.tell(), events=num_events)
+
+    return num_events, num_selected
+
+def _key_to_datetime64(key):
+    """! Converts a time key back to a string accepted by numpy.datetime64"""
+    year, month, day, hour, minute, second = key
+    return '{:04d}-{:02d}-{:02d}T{:02d}:{:02d}:{:06.3f}'.format(year, month, day, hour,
+                                                                minute, second)
+
+def _vertex(text):
+    """! Parses a polygon vertex given as LAT,LON"""
+    latitude, longitude = text.split(',')
+    return float(latitude), float(longitude)
+
+def main(argv=None):
 
-#catalog = readheader(nordic_file)
+    from datetime import datetime
 
-catalog = read_nordic(nordic_file, return_wavnames=False)
-#print(type(catalog))
-#print(dir(catalog))
+    parser = argparse.ArgumentParser(description='Selects the events of a Nordic file')
+    parser.add_argument('nordic_file', help='file in Nordic format')
+    parser.add_argument('-o', '--output', help='output Nordic file (default standard output)')
+    parser.add_argument('--start', type=datetime.fromisoformat,
+                        help='earliest origin time (e.g. 2020-03-01T00:00:00)')
+    parser.add_argument('--end', type=datetime.fromisoformat, help='latest origin time')
+    parser.add_argument('--region', type=float, nargs=4,
+                        metavar=('MIN_LAT', 'MAX_LAT', 'MIN_LON', 'MAX_LON'))
+    parser.add_argument('--polygon', type=_vertex, nargs='+', metavar='LAT,LON',
+                        help='vertices of a polygon')
+    parser.add_argument('--min-depth', type=float)
+    parser.add_argument('--max-depth', type=float)
+    parser.add_argument('--min-magnitude', type=float)
+    parser.add_argument('--max-magnitude', type=float)
+    parser.add_argument('--max-rms', type=float)
+    parser.add_argument('--min-stations', type=int)
+    parser.add_argument('--distance', help="distance indicators, e.g. 'L' or 'LR'")
+    parser.add_argument('--event-type', help="event types, e.g. 'E' or 'EP' (' ' for earthquakes)")
+    parser.add_argument('--id', action='append', dest='event_id', help='SEISAN ID (can be repeated)')
+    parser.add_argument('--use-index', action='store_true',
+                        help='use the event index to read only candidate events')
+    args = parser.parse_args(argv)
 
-#print(catalog)
-#print(catalog.__str__(print_all=True))
+    event_filter = EventFilter(args.start, args.end, args.region, args.polygon,
+                               args.min_depth, args.max_depth,
+                               args.min_magnitude, args.max_magnitude,
+                               args.max_rms, args.min_stations,
+                               args.distance, args.event_type, args.event_id)
 
-test_event = catalog.events[0]
-print(type(test_event))
-print(dir(test_event))
+    output = open(args.output, 'wb', buffering=1 << 22) if args.output else sys.stdout.buffer
+    try:
+        num_events, num_selected = select_events(args.nordic_file, event_filter, output,
+                                                 args.use_index)
+    except nordic.NordicFormatError as error:
+        print('ERROR: ' + str(error), file=sys.stderr)
+        sys.exit()
+    finally:
+        if args.output:
+            output.close()
 
-#print(test_event.magnitudes)
-#print(type(test_event.magnitudes))
+    print('Selected {} of {} events'.format(num_selected, num_events), file=sys.stderr)
 
-print(test_event)
-print(test_event.event_type)
-print(test_event.picks)
\ No newline at end of file
+if __name__ == '__main__':
+    main()
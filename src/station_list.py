@@ -4,6 +4,13 @@
 
 @brief Makes some basic statistics for stations in a local earthquake dataset
 
+The number of P and S picks and the dates of the first and last pick of every
+station are computed as one grouped aggregation over the pick table of the
+catalog (station_pick_counts). StationPickCounter computes the same
+statistics incrementally, from chunks of tables or from a stream of events.
+Picks made outside the operating period of their station in the station file
+are counted with a StationInventory (outside_pick_counts).
+
 Arguments:
 station_file
 nordic file
@@ -14,145 +21,156 @@ Created on Sat Aug 22 17:11:22 2020
 """
 
 import sys
-import datetime
-import math
+import argparse
+import numpy as np
 import pandas as pd
-from obspy.geodetics import gps2dist_azimuth
-import cartopy.crs as ccrs
-import matplotlib.pyplot as plt
 import nordic
+import metrics
+import parse_cache
+import stations
+
+count_columns = ['num_p', 'num_s', 'start_date', 'end_date']
+
+def station_pick_counts(hypocenters, picks):
+    """! Function station_pick_counts
+
+    @brief Computes the number of P and S picks and the first and last pick date of each station
+
+    @param[in]   hypocenters   nordic.HypocenterTable
+    @param[in]   picks         nordic.PickTable
+    @return      DataFrame indexed by station with columns count_columns
+    """
+
+    phase_type = np.char.ljust(picks['phase'].astype(str), 1).astype('U1')
+    time = nordic.pick_times(hypocenters, picks).astype('datetime64[s]')
+
+    dfp = pd.DataFrame({
+        'station': picks['station_name'],
+        'num_p': phase_type == 'P',
+        'num_s': phase_type == 'S',
+        'start_date': time,
+        'end_date': time })
+
+    counts = dfp.groupby('station', sort=True).agg(
+        {'num_p': 'sum', 'num_s': 'sum', 'start_date': 'min', 'end_date': 'max'})
+    return counts.astype({'num_p': 'int64', 'num_s': 'int64'})
+
+class StationPickCounter:
+    """
+    Incremental version of station_pick_counts
+
+    Chunks of tables (e.g. from nordic.iter_tables) or events (e.g. from
+    nordic.iter_events) are aggregated as they arrive and merged with the
+    previous counts, so memory depends only on the number of stations.
+    """
+
+    def __init__(self):
+        self.counts = pd.DataFrame(columns=count_columns).rename_axis('station')
+
+    def add_tables(self, hypocenters, picks):
+        """! Adds the picks of a chunk of tables"""
+
+        chunk = station_pick_counts(hypocenters, picks)
+        if self.counts.empty:
+            self.counts = chunk
+            return
+        both = pd.concat([self.counts, chunk])
+        self.counts = both.groupby(level=0, sort=True).agg(
+            {'num_p': 'sum', 'num_s': 'sum', 'start_date': 'min', 'end_date': 'max'})
+
+    def add_events(self, events):
+        """! Adds the picks of a sequence of nordic.Event"""
+        self.add_tables(*nordic.tables_from_events(events))
+
+def outside_pick_counts(inventory, hypocenters, picks):
+    """! Function outside_pick_counts
+
+    @brief Counts the picks of each station outside the operating period of the station
+
+    @param[in]   inventory     stations.StationInventory
+    @param[in]   hypocenters   nordic.HypocenterTable
+    @param[in]   picks         nordic.PickTable
+    @return      Series indexed by station with the number of picks outside all the
+                 epochs of the station (only stations with such picks)
+    """
+
+    outside = inventory.pick_epochs(hypocenters, picks)['outside']
+    codes, counts = np.unique(picks.codes('station_name')[outside], return_counts=True)
+    return pd.Series(counts, index=pd.Index(picks.categories['station_name'][codes],
+                                            name='station'), name='num_outside')
+
+def station_reports(df, counts):
+    """! Function station_reports
+
+    @brief Splits the pick counts in stations in the station file and unknown stations
+
+    @param[in]   df       DataFrame of the station file, with a 'station' column
+    @param[in]   counts   DataFrame returned by station_pick_counts
+    @return      (dfi, df_missing): dfi is df indexed by station with the counts
+                 (zero picks and NaT dates for stations without picks),
+                 df_missing has the counts of stations with P or S picks that
+                 are not in the station file
+    """
+
+    dfi = df.set_index('station').join(counts)
+    dfi[['num_p', 'num_s']] = dfi[['num_p', 'num_s']].fillna(0).astype('int64')
+
+    missing = counts[~counts.index.isin(dfi.index)]
+    df_missing = missing[(missing['num_p'] + missing['num_s']) > 0]
+
+    return dfi, df_missing
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Makes basic statistics of the stations of a catalog')
+    parser.add_argument('station_file', help='station file')
+    parser.add_argument('nordic_file', help='file in Nordic format')
+    args = parser.parse_args(argv)
+
+    # Read station file and the distances between all station pairs
+
+    neighbors = stations.StationNeighbors.from_file(args.station_file)
+    df = neighbors.stations
+
+    print("Stations closer than 1 km:")
+    print(neighbors.near_duplicates(1.0))
+
+    # Read catalog file and obtain number of P and S picks for station and earliest and latest pick
+
+    try:
+        hypocenters, picks = parse_cache.read_tables(args.nordic_file)
+    except nordic.NordicFormatError as error:
+        print('ERROR: ' + str(error))
+        print(error.line)
+        sys.exit()
+
+    print("Number of events read: ", len(hypocenters))
+
+    with metrics.stage('statistics') as record:
+        dfi, df_missing = station_reports(df, station_pick_counts(hypocenters, picks))
+        outside = outside_pick_counts(stations.StationInventory.from_file(args.station_file),
+                                      hypocenters, picks)
+        record.add(events=len(hypocenters), picks=len(picks))
+
+    print(dfi)
+
+    print(df_missing)
 
-if len(sys.argv) < 3:
-    print("Usage: station_list.py station_file nordic_file")
-    sys.exit()
-
-station_file=sys.argv[1]
-nordic_file=sys.argv[2]
-
-# Read station file into a Pandas dataframe
-
-fields = ['station', 'network', 'latitude', 'longitude', 'elevation']
-
-df = pd.read_table(station_file, delim_whitespace=True, header=None,
-     usecols = [0, 1, 2, 3, 4], names=fields)
-
-num_stations, nc = df.shape
-
-# Calculate distance between all station pairs
-
-for i in df.index:
-    for j in range(i+1, num_stations):
-        delta, az, baz = gps2dist_azimuth(df.loc[i, 'latitude'], df.loc[i,'longitude'],
-        df.loc[j, 'latitude'], df.loc[j,'longitude'])
-        
-#       if (delta < 1000.0):
-#           print(delta/1000.0, df.loc[i,'station'], df.loc[j,'station'])
-
-# Read catalog file and obtain number of P and S picks for station and earliest and latest pick
-
-dfi = df.set_index('station')
-
-zeros = [0] * num_stations
-dfi['num_p'] = zeros
-dfi['num_s'] = zeros
-dfi['start_date'] = zeros
-dfi['end_date'] = zeros
-
-#dum = pd.DataFrame(columns = ['station', 'num_p', 'num_s', 'start_date', 'end_date'])
-#df_missing = dum.set_index('station')
-cols = ['station', 'num_p', 'num_s', 'start_date', 'end_date']
-df_missing = pd.DataFrame(columns = cols).set_index('station')
-
-num_lines = 0
-line_count = 0
-in_event = False
-with open(nordic_file) as fp:
-    for line in fp:
-
-#       Counter to see progress reading file
-        num_lines += 1
-        line_count += 1
-        if line_count == 100:
-#           print(num_lines)
-            line_count=0
-
-        if len(line.strip()) == 0:
-            in_event = False
-
-        elif line[79] == '1':
-            if in_event:
-                print("Ignoring extra hypocenter line for this event")
-                continue
-            in_event = True
-            in_header = True
-            hypocenter = nordic.read_line1(line)
-
-        elif line[79] == '7':
-            in_header = False
-
-        elif line[79] == ' ' and len(line.strip()) > 5:
-            if not in_event or in_header:
-                print('ERROR: badly placed phase card')
-                print(in_event, in_header, line)
-                sys.exit()
-            pick = nordic.read_line4(line)
-            phase = pick.phase
-            phase_second = math.floor(pick.second)
-            if phase_second < 0 or phase_second > 59:
-                phase_second = 0
-                print(line)
-            phase_time = datetime.datetime(hypocenter.year, hypocenter.month, hypocenter.day,
-            pick.hour, pick.minute, phase_second)
-
-            if pick.station_name in dfi.index:
-
-                if phase[0] == 'P':
-                    dfi.loc[pick.station_name, 'num_p'] += 1
-                elif phase[0] == 'S':
-                    dfi.loc[pick.station_name, 'num_s'] += 1
-
-                if dfi.loc[pick.station_name, 'start_date'] == 0 or (phase_time <
-                    dfi.loc[pick.station_name, 'start_date']):
-                    dfi.loc[pick.station_name, 'start_date'] = phase_time
-                if dfi.loc[pick.station_name, 'end_date'] == 0 or (phase_time >
-                    dfi.loc[pick.station_name, 'end_date']):
-                    dfi.loc[pick.station_name, 'end_date'] = phase_time
-
-            elif pick.station_name in df_missing.index:
-
-                if phase[0] == 'P':
-                    df_missing.loc[pick.station_name, 'num_p'] += 1
-                elif phase[0] == 'S':
-                    df_missing.loc[pick.station_name, 'num_s'] += 1
-
-                if phase_time < df_missing.loc[pick.station_name, 'start_date']:
-                    df_missing.loc[pick.station_name, 'start_date'] = phase_time
-                if phase_time > df_missing.loc[pick.station_name, 'end_date']:
-                    df_missing.loc[pick.station_name, 'end_date'] = phase_time
-
-            else:
-#               print("Missing station: " + pick.station_name)
-                if phase[0] == 'P':
-                    df_missing.loc[pick.station_name] = [1, 0, phase_time, phase_time]
-                elif phase[0] == 'S':
-                    df_missing.loc[pick.station_name] = [0, 1, phase_time, phase_time]
-                
-
-print("Number of lines read: ", num_lines)
-print(dfi)
-
-print(df_missing)
-
-# Plot station map
-extent = [-17.5, -15.0, 27.5, 29.0]
-
-#plt.figure(figsize=(10,10))
-#ax = plt.axes(projection=ccrs.PlateCarree())
-#ax.set_extent(extent)
-#ax.coastlines(resolution='10m')
-#ax.scatter(df['longitude'],df['latitude'], marker='^', color='green', transform=ccrs.Geodetic())
-#for i in df.itertuples():
-#    plt.text(i.longitude, i.latitude, i.station)
-#plt.show()
+    print("Picks outside the operating period of the station:")
+    print(outside)
 
+    # Plot station map
+#   import cartopy.crs as ccrs
+#   import matplotlib.pyplot as plt
+#   extent = [-17.5, -15.0, 27.5, 29.0]
+#   plt.figure(figsize=(10,10))
+#   ax = plt.axes(projection=ccrs.PlateCarree())
+#   ax.set_extent(extent)
+#   ax.coastlines(resolution='10m')
+#   ax.scatter(df['longitude'],df['latitude'], marker='^', color='green', transform=ccrs.Geodetic())
+#   for i in df.itertuples():
+#       plt.text(i.longitude, i.latitude, i.station)
+#   plt.show()
 
+if __name__ == '__main__':
+    main()
@@ -2,165 +2,183 @@
 # -*- coding: utf-8 -*-
 """! Makes some basic statistics for stations in a local earthquake dataset
 
+For one station, or for all the stations of the station file when the
+station code is omitted or 'all', makes a histogram of distances, KDE and
+scatter plots of residual against distance, and a map of the events with P
+picks. The catalog is read once and its picks are partitioned by station;
+in all-stations mode the plots are made by a pool of processes. With
+--no-plot only the number of P and S picks of each station, and of picks
+outside the operating period of the station in the station file, are
+printed, and the plotting libraries are never imported.
+
+Output files are named <station>_histogram.png, <station>_kde.png,
+<station>_scatter.png and <station>_map.png.
 
 Created on Sat Aug 22 17:11:22 2020
 
 @author: Antonio Villaseñor, ICM-CSIC
 """
 
+import os
 import sys
-from datetime import datetime
-import math
-import pandas as pd
-from obspy.geodetics import gps2dist_azimuth
-
-import cartopy.crs as ccrs
-import matplotlib.pyplot as plt
-import seaborn as sns
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 
+import metrics
 import nordic
-
-if len(sys.argv) < 4:
-    print("Usage: station_stats.py station_file nordic_file station_code")
-    sys.exit()
-
-station_file=sys.argv[1]
-nordic_file=sys.argv[2]
-station=sys.argv[3]
-
-# Read station file into a Pandas dataframe
-
-fields = ['station', 'network', 'latitude', 'longitude', 'elevation']
-
-df = pd.read_table(station_file, delim_whitespace=True, header=None,
-     usecols = [0, 1, 2, 3, 4], names=fields)
-
-#if not df['station'].str.contains(station).any():
-#    print('ERROR: string ' + station + ' not in station file')
-#    sys.exit()
-
-matches = df.index[df['station'] == station].tolist()
-total_matches = len(matches)
-
-if total_matches == 0:
-    print('ERROR: station not in station file')
-    sys.exit()
-elif total_matches > 1:
-    print('WARNING: more than one match for ' + station + ' in station file')
-    sys.exit()
-
-sta_lat = df.iloc[matches[0]]['latitude']
-sta_lon = df.iloc[matches[0]]['longitude']
-
-# Read catalog file and obtain number of P and S picks for station and earliest and latest pick
-
-column_names = ['phase', 'pick', 'residual', 'distance', 'azimuth', 'ot', 'latitude', 'longitude', 'depth']
-dfs = pd.DataFrame(columns = column_names)
-
-num_lines = 0
-line_count = 0
-in_event = False
-with open(nordic_file) as fp:
-    for line in fp:
-
-#       Counter to see progress reading file
-        num_lines += 1
-        line_count += 1
-        if line_count == 100:
-#           print(num_lines)
-            line_count=0
-
-        if len(line.strip()) == 0:
-            in_event = False
-
-        elif line[79] == '1':
-            if in_event:
-                print("Ignoring extra hypocenter line for this event")
-                continue
-            in_event = True
-            in_header = True
-            hypocenter = nordic.read_line1(line)
-            if hypocenter.second > 59.999:
-                hypocenter.second = 59.999
-            ot_iso = '{0:4d}-{1:02d}-{2:02d} {3:02d}:{4:02d}:{5:09.6f}'.format( \
-                     hypocenter.year, hypocenter.month, hypocenter.day, hypocenter.hour, \
-                     hypocenter.minute, hypocenter.second)
-            ot = datetime.fromisoformat(ot_iso)
-
-        elif line[79] == '7':
-            in_header = False
-
-        elif line[79] == ' ' and len(line.strip()) > 5:
-            if not in_event or in_header:
-                print('ERROR: badly placed phase card')
-                print(in_event, in_header, line)
-                sys.exit()
-            pick = nordic.read_line4(line)
-
-
-            if pick.station_name == station:
-                phase = pick.phase
-                if pick.second > 59.999:
-                    pick.second = 59.999
-                pick_iso = '{0:4d}-{1:02d}-{2:02d} {3:02d}:{4:02d}:{5:09.6f}'.format( \
-                     hypocenter.year, hypocenter.month, hypocenter.day, pick.hour, \
-                     pick.minute, pick.second)
-                pick_time = datetime.fromisoformat(pick_iso)
-
-                phase_dict = {
-                    'phase': pick.phase,
-                    'pick': pick.phase,
-                    'residual': pick.residual,
-                    'distance': pick.distance,
-                    'azimuth': pick.azimuth,
-                    'ot': ot,
-                    'latitude': hypocenter.latitude,
-                    'longitude': hypocenter.longitude,
-                    'depth': hypocenter.depth }
-
-                phase_df = pd.DataFrame( {
-                    'phase': pick.phase,
-                    'pick': pick.phase,
-                    'residual': pick.residual,
-                    'distance': pick.distance,
-                    'azimuth': pick.azimuth,
-                    'ot': ot,
-                    'latitude': hypocenter.latitude,
-                    'longitude': hypocenter.longitude,
-                    'depth': hypocenter.depth } , index=[0])
-
-#               dfs = dfs.append(phase_dict,ignore_index=True)
-                dfs = pd.concat([dfs, phase_df], ignore_index=True)
-
-print("Number of lines read: ", num_lines)
-
-print(dfs)
-
-dfp = dfs[dfs.phase == 'P']
-
-sns.set(style='white')
-
-g = sns.distplot(dfp[['distance']], bins=20, kde=False, rug=True)
-plt.savefig('histogram.png', dpi=300)
-
-#sns.jointplot(x = 'distance', y = 'residual', data = dfp[['distance','residual']], kind='kde')
-sns.jointplot(x = 'distance', y = 'residual', data = dfp[['distance','residual']]).plot_joint(sns.kdeplot, zorder=0, n_levels=10)
-plt.savefig('kde.png', dpi=300)
-
-sns.jointplot(x = 'distance', y = 'residual', data = dfp[['distance','residual']], s=0.2)
-plt.savefig('scatter.png', dpi=300)
-
-# Plot station map
-
-fig, ax = plt.subplots()
-fig.suptitle('Station ' + station)
+import nordic2df
+import parse_cache
+import stations
 
 extent = [-17.5, -15.0, 27.5, 29.0]
-ax = plt.axes(projection=ccrs.PlateCarree())
-ax.set_extent(extent)
-ax.coastlines(resolution='10m')
-ax.scatter(dfp['longitude'],dfp['latitude'], marker='o', color='red', s=0.5, transform=ccrs.Geodetic())
-ax.scatter(sta_lon,sta_lat, marker='^', color='green', transform=ccrs.Geodetic())
-
-#plt.show()
-plt.savefig('map.png', dpi=300)
+
+def plot_station(station, sta_lat, sta_lon, dfp, output_dir='.'):
+    """! Function plot_station
+
+    @brief Makes the histogram, KDE, scatter and map plots of one station
+
+    @param[in]   station      station code
+    @param[in]   sta_lat      station latitude
+    @param[in]   sta_lon      station longitude
+    @param[in]   dfp          DataFrame of P picks of the station (see nordic2df.phase_dataframe)
+    @param[in]   output_dir   directory of the output files
+    @return      list of output file names
+    """
+
+    import cartopy.crs as ccrs
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    names = [os.path.join(output_dir, '{}_{}.png'.format(station, plot))
+             for plot in ('histogram', 'kde', 'scatter', 'map')]
+
+    sns.set(style='white')
+
+    g = sns.distplot(dfp[['distance']], bins=20, kde=False, rug=True)
+    plt.savefig(names[0], dpi=300)
+
+#   sns.jointplot(x = 'distance', y = 'residual', data = dfp[['distance','residual']], kind='kde')
+    sns.jointplot(x = 'distance', y = 'residual', data = dfp[['distance','residual']]).plot_joint(sns.kdeplot, zorder=0, n_levels=10)
+    plt.savefig(names[1], dpi=300)
+
+    sns.jointplot(x = 'distance', y = 'residual', data = dfp[['distance','residual']], s=0.2)
+    plt.savefig(names[2], dpi=300)
+
+    # Plot station map
+
+    fig, ax = plt.subplots()
+    fig.suptitle('Station ' + station)
+
+    ax = plt.axes(projection=ccrs.PlateCarree())
+    ax.set_extent(extent)
+    ax.coastlines(resolution='10m')
+    ax.scatter(dfp['longitude'],dfp['latitude'], marker='o', color='red', s=0.5, transform=ccrs.Geodetic())
+    ax.scatter(sta_lon,sta_lat, marker='^', color='green', transform=ccrs.Geodetic())
+
+#   plt.show()
+    plt.savefig(names[3], dpi=300)
+    plt.close('all')
+
+    return names
+
+def station_phases(hypocenters, picks, codes, inventory=None):
+    """! Function station_phases
+
+    @brief Builds the phase dataframe of the picks of some stations, partitioned by station
+
+    @param[in]   hypocenters   nordic.HypocenterTable
+    @param[in]   picks         nordic.PickTable
+    @param[in]   codes         station codes
+    @param[in]   inventory     if given, stations.StationInventory used to add a column
+                               'outside', True for picks outside the operating period
+                               of their station
+    @return      dict from station code to its DataFrame (see nordic2df.phase_dataframe)
+    """
+
+    picks = picks.take(np.isin(picks['station_name'], codes))
+    dfs = nordic2df.phase_dataframe(hypocenters, picks)
+    if inventory is not None:
+        dfs['outside'] = inventory.pick_epochs(hypocenters, picks)['outside']
+    return {station: group for station, group in dfs.groupby('station', sort=False)}
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Makes statistics and plots of the picks of stations')
+    parser.add_argument('station_file', help='station file')
+    parser.add_argument('nordic_file', help='file in Nordic format')
+    parser.add_argument('station_code', nargs='?', default='all',
+                        help="station code, or 'all' for every station in the station file")
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of processes used to make the plots')
+    parser.add_argument('--output-dir', default='.', help='directory of the plots')
+    parser.add_argument('--no-plot', action='store_true',
+                        help='only print the picks of each station, without plots')
+    args = parser.parse_args(argv)
+
+    # Read all the epochs of the station file, and the first epoch of each station
+
+    inventory = stations.StationInventory.from_file(args.station_file)
+    df = inventory.stations
+
+    if args.station_code != 'all':
+        matches = df.index[df['station'] == args.station_code].tolist()
+        total_matches = len(matches)
+
+        if total_matches == 0:
+            print('ERROR: station not in station file')
+            sys.exit()
+        elif total_matches > 1:
+            print('WARNING: more than one match for ' + args.station_code + ' in station file')
+            sys.exit()
+
+        df = df.iloc[matches]
+
+    # Read catalog file once and split its picks by station. The tables of the
+    # catalog are read from the parse cache when this file has already been
+    # read (see parse_cache.py)
+
+    try:
+        hypocenters, picks = parse_cache.read_tables(args.nordic_file)
+    except nordic.NordicFormatError as error:
+        print('ERROR: ' + str(error))
+        print(error.line)
+        sys.exit()
+
+    print("Number of events read: ", len(hypocenters))
+
+    with metrics.stage('statistics') as record:
+        phases = station_phases(hypocenters, picks, df['station'].unique(), inventory)
+        record.add(events=len(hypocenters), picks=len(picks))
+
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    tasks = []
+    for row in df.drop_duplicates('station').itertuples():
+        if row.station not in phases:
+            print('No picks for station ' + row.station)
+            continue
+        dfs = phases[row.station]
+        dfp = dfs[dfs.phase == 'P']
+        if args.no_plot:
+            print('{:6s} {:8d} {:8d} {:8d}'.format(row.station, len(dfp), (dfs.phase == 'S').sum(),
+                                                   dfs.outside.sum()))
+            continue
+        if dfs.outside.any():
+            print('WARNING: {} picks of {} outside its operating period'.format(
+                  dfs.outside.sum(), row.station))
+        print(dfs)
+        tasks.append((row.station, row.latitude, row.longitude, dfp, args.output_dir))
+
+    with metrics.stage('plotting') as record:
+        if len(tasks) <= 1 or args.workers == 1:
+            for task in tasks:
+                plot_station(*task)
+        else:
+            with ProcessPoolExecutor(args.workers) as executor:
+                for names in executor.map(plot_station, *zip(*tasks)):
+                    print('Written ' + ', '.join(names))
+        record.add(picks=sum(len(task[3]) for task in tasks))
+
+if __name__ == '__main__':
+    main()
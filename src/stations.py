@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""!
+
+@package stations
+
+Station files and vectorized distance computations between stations
+
+Distances and azimuths are computed on a sphere of radius EARTH_RADIUS
+(haversine formula) for whole arrays at once. For the distances found in
+local earthquake tomography the difference with the ellipsoidal distances of
+obspy.geodetics.gps2dist_azimuth is a few tenths of a percent.
+
+StationInventory keeps every epoch (row with its validity period) of the
+stations of a station file, and finds the epoch in operation at the time of
+any number of picks in one vectorized lookup.
+
+The matrix of distances between all the station pairs of a station file is
+cached in a sidecar file (station file name plus '.dist.npz') that is
+rebuilt when the size or modification time of the station file changes.
+
+Created on Sat Oct 17 12:20:45 2026
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+EARTH_RADIUS = 6371.0   # km
+
+DISTANCE_SUFFIX = '.dist.npz'
+
+station_fields = ['station', 'network', 'latitude', 'longitude', 'elevation']
+
+epoch_fields = station_fields + ['start', 'end']
+
+def read_stations(station_file):
+    """! Function read_stations
+
+    @brief Reads the first five columns of a station file into a dataframe
+
+    @param[in]   station_file   name of the station file
+    @return      DataFrame with columns station_fields
+    """
+
+    return pd.read_csv(station_file, sep=r'\s+', header=None,
+                       usecols=[0, 1, 2, 3, 4], names=station_fields)
+
+def read_station_epochs(station_file):
+    """! Function read_station_epochs
+
+    @brief Reads all the columns of a station file, one row per epoch of a station
+
+    The start and end of the validity period of each row are read from the
+    date and time columns after the elevation. Files without them give
+    epochs without limits (NaT).
+
+    @param[in]   station_file   name of the station file
+    @return      DataFrame with columns epoch_fields, start and end as datetime64[ms]
+    """
+
+    df = pd.read_csv(station_file, sep=r'\s+', header=None, dtype=str)
+    epochs = pd.DataFrame({'station': df[0], 'network': df[1]})
+    for column, name in enumerate(['latitude', 'longitude', 'elevation'], 2):
+        epochs[name] = df[column].astype(np.float64)
+    for column, name in ((5, 'start'), (7, 'end')):
+        if df.shape[1] > column + 1:
+            text = (df[column] + 'T' + df[column + 1]).to_numpy(dtype=str)
+            epochs[name] = np.array(text, dtype='datetime64[ms]')
+        else:
+            epochs[name] = np.full(len(df), np.datetime64('NaT'), dtype='datetime64[ms]')
+    return epochs
+
+def _bounds_ns(time, missing):
+    """! Converts datetime64 bounds to int64 ns, clipped to the range of datetime64[ns]"""
+
+    value = time.astype('datetime64[ms]').astype(np.int64)
+    ns = np.clip(value, -(2**63 - 1) // 1000000, (2**63 - 1) // 1000000) * 1000000
+    return np.where(np.isnat(time), missing, ns)
+
+class StationInventory:
+    """
+    All the epochs of the stations of a station file, indexed by station code
+    and start time
+
+    The epochs are sorted by station and start time, so the epochs of each
+    station are a contiguous interval of rows, and lookup resolves any number
+    of (station, time) pairs to their epoch with two binary searches.
+
+    Attributes
+    ----------
+    epochs : DataFrame
+        epochs, as returned by read_station_epochs, sorted by station and start
+    codes : pandas Index
+        station codes, in the order of the epochs
+    first : numpy array
+        first[k]:first[k + 1] are the rows of the epochs of station codes[k]
+    """
+
+    def __init__(self, epochs):
+        start = _bounds_ns(epochs['start'].to_numpy(), np.iinfo(np.int64).min)
+        order = np.lexsort((start, epochs['station'].to_numpy()))
+        self.epochs = epochs.iloc[order].reset_index(drop=True)
+
+        station = self.epochs['station'].to_numpy()
+        self._start = start[order]
+        self._end = _bounds_ns(self.epochs['end'].to_numpy(), np.iinfo(np.int64).max)
+
+        boundary = np.flatnonzero(station[1:] != station[:-1]) + 1
+        self.first = np.concatenate(([0], boundary, [len(station)])).astype(np.int64)
+        self.codes = pd.Index(station[self.first[:-1]])
+        self._code = np.repeat(np.arange(len(self.codes)), np.diff(self.first))
+
+        # Rank of the start of every epoch among all the starts, so that the
+        # pair (code, start) can be searched as a single integer key
+        self._starts = np.unique(self._start)
+        self._key = self._code * (len(self._starts) + 1) + np.searchsorted(self._starts,
+                                                                           self._start) + 1
+
+    @classmethod
+    def from_file(cls, station_file):
+        """! Reads a station file (see read_station_epochs)"""
+        return cls(read_station_epochs(station_file))
+
+    @property
+    def stations(self):
+        """! DataFrame with the first epoch of each station, with columns station_fields"""
+        return self.epochs.iloc[self.first[:-1]][station_fields].reset_index(drop=True)
+
+    def lookup(self, station, time):
+        """! Function lookup
+
+        @brief Finds the epoch of many (station, time) pairs at once
+
+        Each pair gets the epoch of its station with the latest start not
+        after time; times before the first epoch get the first epoch. Pairs
+        whose time is not inside that epoch are flagged as outside, so they
+        keep the coordinates of the closest earlier epoch.
+
+        @param[in]   station   array of station codes
+        @param[in]   time      datetime64 array of the same length (NaT is never outside)
+        @return      dict of numpy arrays with one element per pair: epoch (row of
+                     epochs, -1 for stations not in the inventory), latitude,
+                     longitude, elevation (NaN for unknown stations) and outside
+                     (True for known stations whose time is outside their epochs)
+        """
+
+        return self._lookup(self.codes.get_indexer(np.asarray(station)), time)
+
+    def _lookup(self, code, time):
+        """! lookup with the stations given as rows of codes (-1 for unknown stations)"""
+
+        known = code >= 0
+        time = np.asarray(time, dtype='datetime64[ns]')
+        valid = ~np.isnat(time)
+        value = time.astype(np.int64)
+
+        rank = np.searchsorted(self._starts, value, side='right')
+        key = code * (len(self._starts) + 1) + rank
+        epoch = np.searchsorted(self._key, key, side='right') - 1
+        before = known & ((epoch < 0) | (self._code[np.maximum(epoch, 0)] != code))
+        epoch[before] = self.first[code[before]]
+        epoch[~known] = -1
+
+        rows = np.maximum(epoch, 0)
+        outside = known & valid & ((value < self._start[rows]) | (value > self._end[rows]))
+
+        result = {'epoch': epoch, 'outside': outside}
+        for name in ('latitude', 'longitude', 'elevation'):
+            column = self.epochs[name].to_numpy()[rows]
+            column[~known] = np.nan
+            result[name] = column
+        return result
+
+    def pick_epochs(self, hypocenters, picks):
+        """! Function pick_epochs
+
+        @brief Finds the epoch of the station of every pick at the time of the pick
+
+        @param[in]   hypocenters   nordic.HypocenterTable
+        @param[in]   picks         nordic.PickTable
+        @return      dict of numpy arrays with one element per pick, see lookup
+        """
+
+        import nordic
+
+        code = self.codes.get_indexer(picks.categories['station_name'])
+        return self._lookup(code[picks.codes('station_name')],
+                            nordic.pick_times(hypocenters, picks))
+
+def distance_azimuth(lat1, lon1, lat2, lon2):
+    """! Function distance_azimuth
+
+    @brief Computes distance, azimuth and back-azimuth between points (vectorized)
+
+    The arguments are broadcast against each other as numpy arrays.
+
+    @param[in]   lat1, lon1   coordinates of the first points in degrees
+    @param[in]   lat2, lon2   coordinates of the second points in degrees
+    @return      (distance in km, azimuth from 1 to 2, azimuth from 2 to 1),
+                 azimuths in degrees clockwise from north in [0, 360)
+    """
+
+    phi1 = np.radians(lat1)
+    phi2 = np.radians(lat2)
+    dlambda = np.radians(np.subtract(lon2, lon1))
+
+    cos_phi1 = np.cos(phi1)
+    cos_phi2 = np.cos(phi2)
+    sin_phi1 = np.sin(phi1)
+    sin_phi2 = np.sin(phi2)
+
+    haversine = (np.sin((phi2 - phi1) / 2.0) ** 2 +
+                 cos_phi1 * cos_phi2 * np.sin(dlambda / 2.0) ** 2)
+    distance = 2.0 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(haversine, 0.0, 1.0)))
+
+    sin_dlambda = np.sin(dlambda)
+    cos_dlambda = np.cos(dlambda)
+    azimuth = np.degrees(np.arctan2(sin_dlambda * cos_phi2,
+                                    cos_phi1 * sin_phi2 - sin_phi1 * cos_phi2 * cos_dlambda))
+    back_azimuth = np.degrees(np.arctan2(-sin_dlambda * cos_phi1,
+                                         cos_phi2 * sin_phi1 - sin_phi2 * cos_phi1 * cos_dlambda))
+
+    return distance, np.mod(azimuth, 360.0), np.mod(back_azimuth, 360.0)
+
+def distance_matrix(latitude, longitude):
+    """! Function distance_matrix
+
+    @brief Computes distances and azimuths between all the pairs of a set of points
+
+    @param[in]   latitude, longitude   1D arrays with the coordinates in degrees
+    @return      (distance, azimuth) square matrices. Element [i, j] is the
+                 distance in km and the azimuth in degrees from point i to point j
+    """
+
+    latitude = np.asarray(latitude, dtype=np.float64)
+    longitude = np.asarray(longitude, dtype=np.float64)
+    distance, azimuth, back_azimuth = distance_azimuth(latitude[:, None], longitude[:, None],
+                                                       latitude[None, :], longitude[None, :])
+    return distance, azimuth
+
+def _file_signature(file_name):
+    """! Returns (size, modification time in ns) of a file"""
+    stat = os.stat(file_name)
+    return stat.st_size, stat.st_mtime_ns
+
+class StationNeighbors:
+    """
+    Distances between all the stations of a station file, with neighbor queries
+
+    Attributes
+    ----------
+    stations : DataFrame
+        stations, as returned by read_stations
+    distance : numpy array
+        distance in km between every pair of stations
+    azimuth : numpy array
+        azimuth in degrees from every station to every other station
+    """
+
+    def __init__(self, stations, distance=None, azimuth=None):
+        self.stations = stations.reset_index(drop=True)
+        if distance is None:
+            distance, azimuth = distance_matrix(self.stations['latitude'], self.stations['longitude'])
+        self.distance = distance
+        self.azimuth = azimuth
+        self.codes = self.stations['station'].to_numpy()
+        self._row = {}
+        for row, code in enumerate(self.codes):
+            self._row.setdefault(code, row)
+
+    @classmethod
+    def from_file(cls, station_file):
+        """! Function from_file
+
+        @brief Reads a station file and its distance matrix, from the sidecar file if up to date
+
+        @param[in]   station_file   name of the station file
+        @return      StationNeighbors
+        """
+
+        stations = read_stations(station_file)
+        cache_file = station_file + DISTANCE_SUFFIX
+        signature = _file_signature(station_file)
+
+        try:
+            with np.load(cache_file) as data:
+                if (int(data['size']), int(data['mtime'])) == signature:
+                    return cls(stations, data['distance'], data['azimuth'])
+        except (OSError, KeyError, ValueError):
+            pass
+
+        neighbors = cls(stations)
+        temporary_file = cache_file + '.tmp'
+        with open(temporary_file, 'wb') as fp:
+            np.savez(fp, size=signature[0], mtime=signature[1],
+                     distance=neighbors.distance, azimuth=neighbors.azimuth)
+        os.replace(temporary_file, cache_file)
+
+        return neighbors
+
+    def _result(self, rows, distance):
+        """! Returns a DataFrame with the stations in rows sorted by distance"""
+        order = np.argsort(distance, kind='stable')
+        return pd.DataFrame({'station': self.codes[rows[order]], 'distance': distance[order]})
+
+    def within(self, station, radius):
+        """! Function within
+
+        @brief Returns the stations within radius km of a station
+
+        @param[in]   station   station code
+        @param[in]   radius    distance in km
+        @return      DataFrame with columns station and distance, sorted by distance
+        """
+
+        row = self._row[station]
+        distance = self.distance[row]
+        rows = np.flatnonzero(distance <= radius)
+        rows = rows[rows != row]
+        return self._result(rows, distance[rows])
+
+    def nearest(self, station, k):
+        """! Function nearest
+
+        @brief Returns the k stations closest to a station
+
+        @param[in]   station   station code
+        @param[in]   k         number of stations
+        @return      DataFrame with columns station and distance, sorted by distance
+        """
+
+        row = self._row[station]
+        distance = self.distance[row].copy()
+        distance[row] = np.inf
+        k = min(k, len(distance) - 1)
+        rows = np.argpartition(distance, k - 1)[:k] if k > 0 else np.array([], dtype=int)
+        return self._result(rows, distance[rows])
+
+    def near_point(self, latitude, longitude, radius=None, k=None):
+        """! Function near_point
+
+        @brief Returns the stations within radius km of a point, or the k closest ones
+
+        @param[in]   latitude, longitude   coordinates of the point in degrees
+        @param[in]   radius                distance in km
+        @param[in]   k                     number of stations
+        @return      DataFrame with columns station and distance, sorted by distance
+        """
+
+        distance, azimuth, back_azimuth = distance_azimuth(
+            latitude, longitude, self.stations['latitude'].to_numpy(),
+            self.stations['longitude'].to_numpy())
+        rows = np.arange(len(distance))
+        if radius is not None:
+            rows = rows[distance <= radius]
+        if k is not None and k < len(rows):
+            rows = rows[np.argpartition(distance[rows], k - 1)[:k]]
+        return self._result(rows, distance[rows])
+
+    def near_duplicates(self, max_distance):
+        """! Function near_duplicates
+
+        @brief Returns the pairs of stations closer than max_distance km
+
+        @param[in]   max_distance   distance in km
+        @return      DataFrame with columns station1, station2 and distance
+        """
+
+        rows1, rows2 = np.nonzero(np.triu(self.distance <= max_distance, k=1))
+        return pd.DataFrame({'station1': self.codes[rows1], 'station2': self.codes[rows2],
+                             'distance': self.distance[rows1, rows2]})
+
+def pick_geometry(hypocenters, picks, stations, tolerance=1.0, relative_tolerance=0.02):
+    """! Function pick_geometry
+
+    @brief Recomputes epicentral distance, azimuth and back-azimuth of all the picks
+
+    Picks are joined to the stations by station code, and the geometry of all
+    the event-station pairs is computed in one vectorized call. Picks of
+    stations that are not in the station table get NaN.
+
+    @param[in]   hypocenters          nordic.HypocenterTable
+    @param[in]   picks                nordic.PickTable
+    @param[in]   stations             DataFrame as returned by read_stations, or a
+                                      StationInventory to use the coordinates of the
+                                      epoch of each station at the time of the pick
+    @param[in]   tolerance            largest accepted difference in km with the
+                                      distance stored in the phase card
+    @param[in]   relative_tolerance   largest accepted difference as a fraction of the
+                                      stored distance, if larger than tolerance
+    @return      dict of numpy arrays with one element per pick: station_latitude,
+                 station_longitude, distance (km), azimuth (event to station),
+                 back_azimuth (station to event), distance_mismatch (True
+                 where the stored distance disagrees with the computed one) and
+                 station_outside (True where the pick is outside the epochs of its
+                 station, always False with a DataFrame of stations)
+    """
+
+    if isinstance(stations, StationInventory):
+        epochs = stations.pick_epochs(hypocenters, picks)
+        station_latitude = epochs['latitude']
+        station_longitude = epochs['longitude']
+        outside = epochs['outside']
+    else:
+        codes = pd.Index(stations['station']).drop_duplicates(keep='first')
+        first = ~stations['station'].duplicated(keep='first').to_numpy()
+        rows = codes.get_indexer(picks.categories['station_name'])[picks.codes('station_name')]
+        known = rows >= 0
+
+        station_latitude = np.full(len(rows), np.nan)
+        station_longitude = np.full(len(rows), np.nan)
+        station_latitude[known] = stations['latitude'].to_numpy()[first][rows[known]]
+        station_longitude[known] = stations['longitude'].to_numpy()[first][rows[known]]
+        outside = np.zeros(len(rows), dtype=bool)
+
+    event = picks['event']
+    distance, azimuth, back_azimuth = distance_azimuth(
+        hypocenters['latitude'][event], hypocenters['longitude'][event],
+        station_latitude, station_longitude)
+
+    stored = picks['distance']
+    with np.errstate(invalid='ignore'):
+        mismatch = np.abs(distance - stored) > np.maximum(tolerance, relative_tolerance * stored)
+
+    return {
+        'station_latitude':  station_latitude,
+        'station_longitude': station_longitude,
+        'distance':          distance,
+        'azimuth':           azimuth,
+        'back_azimuth':      back_azimuth,
+        'distance_mismatch': mismatch,
+        'station_outside':   outside,
+    }
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""!
+
+@package synthetic
+
+Writes synthetic catalogs in Nordic format, and their station files, of any size
+
+Events are placed at random in a region and time span, and each one gets P
+and S picks at a random subset of the stations, with travel times from
+constant velocities, so that picks cross minutes, hours and midnight like
+in real catalogs. The lines follow the column layout of SEISAN: every event
+has a hypocenter line (type 1), an ID line (type I), the phase header
+(type 7) and its phase cards (type 4), and some events also have a
+high-precision line (type H), comment lines (type 3), an error line
+(type E), second and third magnitudes and amplitude readings. Optional
+fields (weight, polarity, onset, residual, amplitude, period...) are left
+blank at random.
+
+Usage: synthetic.py num_picks nordic_file [station_file] [--seed SEED]
+
+Created on Sat Oct 17 15:48:02 2026
+"""
+
+import argparse
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import stations
+
+region = (27.5, 29.5, -18.0, -13.5)     # min_lat, max_lat, min_lon, max_lon
+depth_range = (0.0, 40.0)
+vp = 6.0                                 # km/s
+vs = 3.5
+
+phase_header = (' STAT SP IPHASW D HRMM SECON CODA AMPLIT PERI AZIMU VELO AIN AR TRES W  DIS CAZ7\n')
+
+def _field(value, fmt, blank):
+    """! Formats a value, or returns blanks of the same width if blank is True"""
+    text = fmt.format(0 if blank else value)
+    return ' ' * len(text) if blank else text
+
+def make_stations(num_stations, rng):
+    """! Function make_stations
+
+    @brief Creates stations at random positions in the region
+
+    @param[in]   num_stations   number of stations
+    @param[in]   rng            numpy.random.Generator
+    @return      dict of arrays: station, latitude, longitude, elevation
+    """
+
+    min_lat, max_lat, min_lon, max_lon = region
+    return {
+        'station':   np.array(['S{:04d}'.format(i) for i in range(num_stations)]),
+        'latitude':  rng.uniform(min_lat, max_lat, num_stations),
+        'longitude': rng.uniform(min_lon, max_lon, num_stations),
+        'elevation': rng.uniform(0.0, 2500.0, num_stations),
+    }
+
+def write_stations(station_file, station_table):
+    """! Writes a station file with the columns of read_stations and the validity period"""
+
+    with open(station_file, 'w') as fp:
+        for code, lat, lon, elevation in zip(station_table['station'], station_table['latitude'],
+                                             station_table['longitude'], station_table['elevation']):
+            fp.write('{:<6s} SY {:11.6f} {:12.6f} {:8.1f}  2000-01-01 00:00:00.0  '
+                     '2599-12-31 23:59:59.0  {}\n'.format(code, lat, lon, elevation, code))
+
+def hypocenter_line(time, lat, lon, depth, num_sta, rms, magnitudes, event_type=' '):
+    """! Returns a hypocenter line (type 1); magnitudes is a list of (mag, type, agency)"""
+
+    line = ' {:4d} {:2d}{:2d} {:2d}{:2d} {:4.1f} L{}{:7.3f}{:8.3f}{:5.1f}  SYN{:3d}{}'.format(
+        time.year, time.month, time.day, time.hour, time.minute,
+        time.second + time.microsecond * 1e-6, event_type, lat, lon, depth, num_sta,
+        _field(rms, '{:4.2f}', rms is None))
+    for mag, mag_type, agency in magnitudes:
+        line += '{:4.1f}{}{:3s}'.format(mag, mag_type, agency)
+    return line.ljust(79) + '1\n'
+
+def high_precision_line(time, lat, lon, depth, rms):
+    """! Returns a high-precision hypocenter line (type H)"""
+
+    line = ' {:4d} {:2d}{:2d} {:2d}{:2d} {:6.3f} {:9.5f} {:10.5f} {:8.3f} {:6.3f}'.format(
+        time.year, time.month, time.day, time.hour, time.minute,
+        time.second + time.microsecond * 1e-6, lat, lon, depth, rms)
+    return line.ljust(79) + 'H\n'
+
+def error_line(gap, time_error, lat_error, lon_error, depth_error, covariance):
+    """! Returns an error line (type E)"""
+
+    line = ' GAP={:3d}      {:6.2f}    {:6.1f}  {:6.1f}{:5.1f}{:12.4E}{:12.4E}{:12.4E}'.format(
+        gap, time_error, lat_error, lon_error, depth_error, *covariance)
+    return line.ljust(79) + 'E\n'
+
+def id_line(time):
+    """! Returns an ID line (type I) with the SEISAN ID of an origin time"""
+    line = ' ACTION:SYN {:%y-%m-%d %H:%M} OP:syn  STATUS:               ID:{:%Y%m%d%H%M%S}     '.format(
+        time, time)
+    return line.ljust(79)[:79] + 'I\n'
+
+def comment_line(text):
+    """! Returns a comment line (type 3)"""
+    return (' ' + text).ljust(79)[:79] + '3\n'
+
+def phase_line(station, component, onset, phase, weight_code, polarity, time,
+               amplitude=None, period=None, residual=None, weight=None, distance=None,
+               azimuth=None):
+    """! Returns a phase card (type 4); arguments that are None are left blank"""
+
+    time = time + timedelta(microseconds=5000)
+    time = time.replace(microsecond=time.microsecond // 10000 * 10000)
+
+    if distance is not None and distance >= 1000.0:
+        distance_format = '{:5.0f}'
+    else:
+        distance_format = '{:5.1f}'
+
+    return ' {:<5s}{:2s} {}{:<4s}{} {} {:2d}{:2d}{:6.2f}     {}{}{}{}{}{} {} \n'.format(
+        station, component, onset, phase,
+        _field(weight_code, '{:1d}', weight_code is None), polarity,
+        time.hour, time.minute, time.second + time.microsecond * 1e-6,
+        _field(amplitude, '{:7.1f}', amplitude is None),
+        ' ' + _field(period, '{:4.2f}', period is None),
+        ' ' * 18,               # direction, velocity, incidence angle, direction residual
+        _field(residual, '{:5.2f}', residual is None),
+        _field(weight, '{:2d}', weight is None),
+        _field(distance, distance_format, distance is None),
+        _field(azimuth, '{:3d}', azimuth is None))
+
+def write_catalog(nordic_file, num_picks, station_table, seed=0, start=datetime(2020, 1, 1),
+                  days=365):
+    """! Function write_catalog
+
+    @brief Writes a synthetic catalog with at least num_picks phase cards
+
+    @param[in]   nordic_file     name of the output file
+    @param[in]   num_picks       number of phase cards (the last event can add a few more)
+    @param[in]   station_table   stations, as returned by make_stations
+    @param[in]   seed            seed of the random generator
+    @param[in]   start, days     time span of the origin times
+    @return      (number of events, number of phase cards) written
+    """
+
+    rng = np.random.default_rng(seed)
+    min_lat, max_lat, min_lon, max_lon = region
+    num_stations = len(station_table['station'])
+
+    num_events = 0
+    written = 0
+    with open(nordic_file, 'w', buffering=1 << 22, encoding='latin-1', newline='\n') as fp:
+        while written < num_picks:
+            origin = start + timedelta(seconds=float(rng.uniform(0, days * 86400.0)))
+            origin = origin.replace(microsecond=origin.microsecond // 100000 * 100000)
+            lat = rng.uniform(min_lat, max_lat)
+            lon = rng.uniform(min_lon, max_lon)
+            depth = rng.uniform(*depth_range)
+
+            k = int(min(num_stations, max(3, rng.poisson(12))))
+            rows = rng.choice(num_stations, k, replace=False)
+            distance, azimuth, back_azimuth = stations.distance_azimuth(
+                lat, lon, station_table['latitude'][rows], station_table['longitude'][rows])
+            order = np.argsort(distance)
+            rows, distance, azimuth = rows[order], distance[order], azimuth[order]
+            hypocentral = np.hypot(distance, depth)
+
+            # Random values of all the picks of the event, drawn at once
+            uniform = rng.random((k, 8)).tolist()
+            residuals = np.round(rng.normal(0.0, 0.2, (k, 2)), 2).tolist()
+            weight_codes = rng.integers(0, 5, (k, 2)).tolist()
+            weights = rng.integers(0, 11, (k, 2)).tolist()
+            amplitudes = rng.uniform(1.0, 9999.0, k).tolist()
+            periods = rng.uniform(0.05, 2.0, k).tolist()
+
+            lines = []
+            for i, (row, dist, az, hyp) in enumerate(zip(rows.tolist(), distance.tolist(),
+                                                         azimuth.tolist(), hypocentral.tolist())):
+                code = station_table['station'][row]
+                draw = uniform[i]
+                for j, (phase, velocity, component) in enumerate((('P', vp, 'HZ'),
+                                                                  ('S', vs, 'HN'))):
+                    if phase == 'S' and draw[0] < 0.3:
+                        continue
+                    residual = residuals[i][j]
+                    time = origin + timedelta(seconds=hyp / velocity + residual)
+                    lines.append(phase_line(
+                        code, component, 'IE '[int(draw[1 + j] * 3)], phase,
+                        None if draw[3] < 0.2 else weight_codes[i][j],
+                        'CD  '[int(draw[4] * 4)] if phase == 'P' else ' ', time,
+                        residual=None if draw[5] < 0.05 else residual,
+                        weight=None if draw[6] < 0.5 else weights[i][j],
+                        distance=dist, azimuth=int(az) % 360))
+                if draw[7] < 0.1:
+                    time = origin + timedelta(seconds=hyp / vs + 1.0)
+                    lines.append(phase_line(code, 'HE', ' ', 'IAML', None, ' ', time,
+                                            amplitude=amplitudes[i], period=periods[i],
+                                            distance=dist, azimuth=int(az) % 360))
+
+            rms = None if rng.random() < 0.05 else float(rng.uniform(0.05, 1.5))
+            magnitudes = [(float(rng.uniform(0.5, 4.5)), 'L', 'SYN')]
+            if rng.random() < 0.2:
+                magnitudes.append((float(rng.uniform(0.5, 4.5)), 'C', 'SYN'))
+            if rng.random() < 0.05:
+                magnitudes.append((float(rng.uniform(0.5, 4.5)), 'W', 'SYN'))
+
+            fp.write(hypocenter_line(origin, lat, lon, depth, k, rms, magnitudes,
+                                     'E' if rng.random() < 0.02 else ' '))
+            if rng.random() < 0.3:
+                fp.write(high_precision_line(origin, lat, lon, depth, rms or 0.0))
+            if rng.random() < 0.5:
+                fp.write(error_line(int(rng.integers(10, 360)), rng.uniform(0.0, 2.0),
+                                    rng.uniform(0.0, 20.0), rng.uniform(0.0, 20.0),
+                                    rng.uniform(0.0, 20.0), rng.normal(0.0, 1.0, 3)))
+            if rng.random() < 0.3:
+                fp.write(comment_line('GAP={:3d} DIM={:3d}'.format(int(rng.integers(10, 360)),
+                                                                   int(rng.integers(1, 99)))))
+            fp.write(id_line(origin))
+            fp.write(phase_header)
+            fp.writelines(lines)
+            fp.write(' ' * 80 + '\n')
+
+            num_events += 1
+            written += len(lines)
+
+    return num_events, written
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Writes a synthetic catalog in Nordic format')
+    parser.add_argument('num_picks', type=int, help='number of phase cards')
+    parser.add_argument('nordic_file', help='output file in Nordic format')
+    parser.add_argument('station_file', nargs='?', help='output station file')
+    parser.add_argument('--stations', type=int, default=100, help='number of stations')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random generator')
+    args = parser.parse_args(argv)
+
+    station_table = make_stations(args.stations, np.random.default_rng(args.seed))
+    if args.station_file:
+        write_stations(args.station_file, station_table)
+
+    num_events, num_picks = write_catalog(args.nordic_file, args.num_picks, station_table,
+                                          args.seed)
+    print("Number of events written: ", num_events)
+    print("Number of picks written: ", num_picks)
+
+if __name__ == '__main__':
+    main()